@@ -2,6 +2,7 @@
 import textwrap
 
 # local modules
+from irods_testing_environment import async_executor
 from irods_testing_environment import context
 
 def add_compose_args(parser):
@@ -112,17 +113,79 @@ def add_irods_test_args(parser):
                             If indicated, exits on the first test that returns a non-zero exit \
                             code.'''))
 
+    parser.add_argument('--max-test-attempts',
+                        metavar='NUMBER_OF_ATTEMPTS',
+                        dest='max_test_attempts', type=int, default=1,
+                        help=textwrap.dedent('''\
+                            Number of times a failing test is run before it is recorded as failed \
+                            (and, with --fail-fast, ends the run). A test which passes on a later \
+                            attempt is reported as flaky rather than failed.'''))
+
+    parser.add_argument('--retry-on-fresh-executor',
+                        dest='retry_on_fresh_executor', action='store_true',
+                        help=textwrap.dedent('''\
+                            If indicated, a failed test is retried on an executor on which it has \
+                            not failed yet, whenever another executor is still running tests.'''))
+
     parser.add_argument('--concurrent-test-executor-count',
                         dest='executor_count', type=int, default=1,
                         help=textwrap.dedent('''\
                             Number of concurrent executors to run tests at the same time.'''))
 
+    parser.add_argument('--order-tests-by-duration',
+                        dest='order_tests_by_duration', action='store_true',
+                        help=textwrap.dedent('''\
+                            If indicated, tests are queued longest-first based on the durations \
+                            recorded by previous runs of the same project and platform. Tests \
+                            with no recorded duration are queued first.'''))
+
+    parser.add_argument('--test-timings-directory',
+                        metavar='PATH_TO_TEST_TIMINGS_DIRECTORY',
+                        dest='test_timings_directory',
+                        help=textwrap.dedent('''\
+                            Path to local directory in which the durations of tests are recorded \
+                            per project and platform. Defaults to a directory under the user's \
+                            cache directory.'''))
+
+    parser.add_argument('--operation-budgets',
+                        metavar='PATH_TO_BUDGETS_FILE',
+                        dest='operation_budgets',
+                        help=textwrap.dedent('''\
+                            Path to a JSON file of limits on the number of Docker operations \
+                            (execs, inspects, archive copies) made per phase of the job, e.g. \
+                            [{"operation": "exec", "maximum": 40, "phase": "set up consumer*", \
+                            "service": "irods-catalog-consumer"}]. The job fails if any limit is \
+                            exceeded. See irods_testing_environment/instrumentation.py.'''))
+
     parser.add_argument('--discard-logs',
                         dest='save_logs', default=True, action='store_false',
                         help=textwrap.dedent('''\
                             Indicates that the logs should not be collected from the \
                             containers.'''))
 
+    parser.add_argument('--log-shipping-interval',
+                        metavar='SECONDS',
+                        dest='log_shipping_interval', type=float, default=10,
+                        help=textwrap.dedent('''\
+                            Number of seconds between copies of the new contents of the logs and \
+                            test reports from the containers to the job output directory while \
+                            the tests run, so that partial logs survive a job which is killed. \
+                            Use 0 to collect the logs only once the tests have finished.'''))
+
+    parser.add_argument('--bundle-logs',
+                        dest='bundle_logs', action='store_true',
+                        help=textwrap.dedent('''\
+                            If indicated, the collected logs and test reports are saved as \
+                            logs.tar.gz in the job output directory instead of as a directory \
+                            tree.'''))
+
+    parser.add_argument('--no-log-slices',
+                        dest='slice_logs', default=True, action='store_false',
+                        help=textwrap.dedent('''\
+                            Indicates that the part of the server logs written during each test \
+                            should not be saved to log_slices in the job output directory. Only \
+                            iRODS 4.3 and later have a server log which can be sliced.'''))
+
     parser.add_argument('--leak-containers',
                         action='store_false', dest='cleanup_containers',
                         help='If indicated, the containers will not be torn down.')
@@ -137,6 +200,13 @@ def add_irods_test_args(parser):
                             If indicated, the iRODS servers will be set up using \
                             unattended installation.''')
 
+    parser.add_argument('--use-zone-snapshots',
+                        action='store_true', dest='use_zone_snapshots',
+                        help=textwrap.dedent('''\
+                            If indicated, the set-up containers are saved as a snapshot, and a \
+                            later run with the same project, packages, and setup options \
+                            restores the snapshot instead of installing and setting up iRODS.'''))
+
     parser.add_argument(
         '--message',
         "-m",
@@ -159,6 +229,33 @@ def add_database_config_args(parser):
                             Path to the ODBC driver archive file on the local machine. \
                             If not provided, the driver will be downloaded.'''))
 
+    parser.add_argument('--fast-catalog',
+                        dest='fast_catalog', action='store_true',
+                        help=textwrap.dedent('''\
+                            If indicated, the catalog database keeps its data on a tmpfs and does \
+                            not sync it to disk. The catalog is lost if its container stops, so \
+                            this is incompatible with --use-zone-snapshots.'''))
+
+
+def apply_database_config_args(args, compose_project):
+    '''Apply the options added by add_database_config_args which configure the Compose project.
+
+    This should be called before the Compose project is brought up.
+
+    Arguments:
+    args -- argparse.Namespace returned by parse_args
+    compose_project -- compose.Project which will run the catalog database
+    '''
+    if not args.fast_catalog:
+        return
+
+    if getattr(args, 'use_zone_snapshots', False):
+        raise RuntimeError('--fast-catalog cannot be used with --use-zone-snapshots')
+
+    from irods_testing_environment import fast_catalog
+
+    fast_catalog.enable(compose_project)
+
 def add_common_args(parser):
     '''Add argparse options common to irods_testing_environment scripts.
 
@@ -172,6 +269,57 @@ def add_common_args(parser):
                             CRITICAL and ERROR messages will always be printed. \
                             Add more to see more log messages (e.g. -vvv displays DEBUG).'''))
 
+    parser.add_argument('--use-exec-sessions',
+                        dest='use_exec_sessions', action='store_true',
+                        help=textwrap.dedent('''\
+                            If indicated, commands are run through a long-lived shell in each \
+                            container rather than a separate docker exec per command. Falls back \
+                            to docker exec whenever a shell session cannot be used.'''))
+
+    parser.add_argument('--max-concurrent-container-operations',
+                        metavar='NUMBER_OF_OPERATIONS',
+                        dest='max_concurrent_container_operations', type=int,
+                        default=async_executor.DEFAULT_MAX_CONCURRENCY,
+                        help=textwrap.dedent('''\
+                            Maximum number of blocking Docker operations (execs, archive copies) \
+                            run at once when working on many containers concurrently.'''))
+
+
+def apply_common_args(args):
+    '''Apply the options added by add_common_args which configure the testing environment.
+
+    This should be called right after the arguments are parsed and logging is configured.
+
+    Arguments:
+    args -- argparse.Namespace returned by parse_args
+    '''
+    from irods_testing_environment import exec_session
+
+    exec_session.enable(args.use_exec_sessions)
+    async_executor.configure(args.max_concurrent_container_operations)
+
+
+def common_args_to_argv(args):
+    '''Return the command-line arguments which give another script the options added by add_common_args.
+
+    This is for scripts which run other irods_testing_environment scripts (e.g. run_matrix.py) so
+    that the options they parse for themselves are also passed on.
+
+    Arguments:
+    args -- argparse.Namespace returned by parse_args
+    '''
+    argv = list()
+
+    if args.verbosity > 1:
+        argv.append('-' + 'v' * (args.verbosity - 1))
+
+    if args.use_exec_sessions:
+        argv.append('--use-exec-sessions')
+
+    argv.extend(['--max-concurrent-container-operations', str(args.max_concurrent_container_operations)])
+
+    return argv
+
 
 def log_irods_version_and_commit_id(container):
     '''Prints the version and commit_id found in the JSON version file.
@@ -1,5 +1,6 @@
 """Minimal compose Project implementation backed by Docker Compose CLI."""
 
+import json
 import pathlib
 import shutil
 import subprocess
@@ -8,6 +9,31 @@ import docker
 
 from .container import Container
 
+# File names which docker compose looks for in the project directory, in order of preference.
+_COMPOSE_FILE_NAMES = ["compose.yaml", "compose.yml", "docker-compose.yml", "docker-compose.yaml"]
+
+_OVERRIDE_FILE_NAMES = ["compose.override.yaml", "compose.override.yml",
+                        "docker-compose.override.yml", "docker-compose.override.yaml"]
+
+# Functions called with the project name after the set of containers in a project may have changed.
+_change_callbacks = []
+
+
+def register_change_callback(callback):
+    """
+    Register a function to be called with the project name after `up` or `down` runs for any project.
+
+    Arguments:
+        callback: A callable taking the name of the Compose project which changed.
+    """
+    if callback not in _change_callbacks:
+        _change_callbacks.append(callback)
+
+
+def _notify_change(project_name):
+    for callback in _change_callbacks:
+        callback(project_name)
+
 
 def _sanitize_project_name(name):
     # Match legacy usage in this repo: strip characters compose v1 rejects.
@@ -17,20 +43,60 @@ def _sanitize_project_name(name):
 class Project:
     """Subset of compose.project.Project used by this codebase."""
 
-    def __init__(self, project_dir, project_name=None, docker_client=None):
+    def __init__(self, project_dir, project_name=None, docker_client=None, override_files=None):
         """Initialize a Compose Project with a project_dir."""
         self.project_dir = pathlib.Path(project_dir).resolve()
         base_name = pathlib.Path(self.project_dir).name
         name = project_name or base_name
         self.name = _sanitize_project_name(name)
         self._docker_client = docker_client or docker.from_env()
+        self.override_files = [pathlib.Path(f).resolve() for f in override_files or []]
 
-    def _compose_cmd(self, args):
+    def add_override_file(self, path):
+        """
+        Apply the Compose file at `path` on top of the project's own files in every later command.
+
+        Arguments:
+            path: Path to a Compose file whose settings are merged over those of the project.
+        """
+        path = pathlib.Path(path).resolve()
+        if path not in self.override_files:
+            self.override_files.append(path)
+
+    def _compose_file_args(self):
+        # Without extra files, docker compose finds the project's files by itself. Naming any file
+        # with -f turns that off, so the project's own files must be named too.
+        if not self.override_files:
+            return []
+
+        files = [next(self.project_dir / f for f in _COMPOSE_FILE_NAMES if (self.project_dir / f).exists())]
+        default_override = next((self.project_dir / f for f in _OVERRIDE_FILE_NAMES
+                                 if (self.project_dir / f).exists()), None)
+        if default_override:
+            files.append(default_override)
+        files.extend(self.override_files)
+
+        args = []
+        for f in files:
+            args.extend(["-f", str(f)])
+        return args
+
+    def _compose_cmd(self, args, capture_output=False):
         if not shutil.which("docker"):
             raise RuntimeError("docker CLI not found in PATH")
         cmd = ["docker", "compose", "-p", self.name]
+        cmd.extend(self._compose_file_args())
         cmd.extend(args)
-        subprocess.run(cmd, cwd=self.project_dir, check=True)
+        return subprocess.run(cmd, cwd=self.project_dir, check=True, capture_output=capture_output, text=True)
+
+    def config(self):
+        """
+        Return the resolved configuration of the project, including any override files.
+
+        Returns:
+            The output of `docker compose config` as a dict.
+        """
+        return json.loads(self._compose_cmd(["config", "--format", "json"], capture_output=True).stdout)
 
     def build(self):
         """Build the compose project images."""
@@ -47,7 +113,10 @@ class Project:
         if scale_override:
             for service, count in scale_override.items():
                 args.extend(["--scale", f"{service}={count}"])
-        self._compose_cmd(args)
+        try:
+            self._compose_cmd(args)
+        finally:
+            _notify_change(self.name)
         return self.containers()
 
     def down(self, include_volumes=False, remove_image_type=False):
@@ -57,7 +126,10 @@ class Project:
             args.append("--volumes")
         if remove_image_type:
             args.extend(["--rmi", "all"])
-        self._compose_cmd(args)
+        try:
+            self._compose_cmd(args)
+        finally:
+            _notify_change(self.name)
 
     def containers(self, service_names=None):
         """
@@ -36,6 +36,8 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity)
 
+    cli.apply_common_args(args)
+
     try:
         configure_tls_in_zone(docker_client, compose_project)
 
@@ -13,6 +13,7 @@ from irods_testing_environment import irods_setup
 from irods_testing_environment import irods_config
 from irods_testing_environment import json_utils
 from irods_testing_environment import federate
+from irods_testing_environment import tls_material
 from irods_testing_environment import tls_setup
 from irods_testing_environment.install import install
 
@@ -92,6 +93,13 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity)
 
+    cli.apply_common_args(args)
+    cli.apply_database_config_args(args, ctx.compose_project)
+
+    if args.use_tls:
+        # Generating TLS material can be slow, so it is done while the Zones are being set up.
+        tls_material.prefetch()
+
     zone_count = len(zone_names)
     consumer_count = args.consumers_per_zone * zone_count
 
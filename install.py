@@ -32,6 +32,8 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity)
 
+    cli.apply_common_args(args)
+
     project_directory = os.path.abspath(args.project_directory or os.getcwd())
 
     ctx = context.context(docker.from_env(),
@@ -30,6 +30,8 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity)
 
+    cli.apply_common_args(args)
+
     try:
         configure_irods_testing(docker_client, compose_project)
 
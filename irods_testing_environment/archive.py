@@ -1,15 +1,26 @@
 # grown-up imports
+import io
 import logging
 import os
+import shutil
 import tarfile
 import tempfile
+import threading
 
 # local modules
 from . import execute
+from . import instrumentation
+from . import tracing
+
+# Size of the chunks in which archive streams are handed to the Docker client.
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 def create_archive(members, filename='foo', extension='tar'):
     """Create a local archive file with the files in `members` and return a path to the file.
 
+    The archive is created in a new temporary directory. Use `remove_archive` to remove the
+    archive file and its directory once it is no longer needed.
+
     Arguments:
     members -- local files to be placed in the archive
     """
@@ -29,6 +40,107 @@ def create_archive(members, filename='foo', extension='tar'):
     return tarfile_path
 
 
+def remove_archive(path_to_archive):
+    """Remove an archive file made by `create_archive` along with the temporary directory holding it.
+
+    Arguments:
+    path_to_archive -- path to the archive file returned by `create_archive`
+    """
+    directory = os.path.dirname(os.path.abspath(path_to_archive))
+
+    logging.debug('removing archive [{}]'.format(path_to_archive))
+
+    if os.path.exists(path_to_archive):
+        os.unlink(path_to_archive)
+
+    # Only remove the directory if it is the (now empty) temporary directory made for the archive.
+    if os.path.dirname(directory) == os.path.abspath(tempfile.gettempdir()):
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_archive(members, fileobj):
+    """Write a tar archive of the files in `members` to the file-like object `fileobj`.
+
+    The archive is written in stream mode, so `fileobj` does not need to be seekable.
+
+    Arguments:
+    members -- local files to be placed in the archive
+    fileobj -- writable file-like object receiving the archive
+    """
+    with tarfile.open(fileobj=fileobj, mode='w|') as f:
+        for m in members:
+            logging.debug('adding member [{0}] to tar stream'.format(m))
+            f.add(m)
+
+
+def stream_archive(members, chunk_size=STREAM_CHUNK_SIZE):
+    """Generate chunks of a tar archive of the files in `members` as it is being built.
+
+    The archive is written into a pipe by a separate thread and never touches the disk, so memory
+    use is bounded by the size of the pipe and `chunk_size` regardless of the size of `members`.
+
+    Arguments:
+    members -- local files to be placed in the archive
+    chunk_size -- maximum number of bytes in each generated chunk
+    """
+    read_fd, write_fd = os.pipe()
+    errors = list()
+
+    def write():
+        try:
+            with os.fdopen(write_fd, 'wb') as w:
+                write_archive(members, w)
+
+        except BrokenPipeError:
+            # The reader went away, so there is nobody left to report this to.
+            pass
+
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+
+    try:
+        with os.fdopen(read_fd, 'rb') as r:
+            while True:
+                chunk = r.read(chunk_size)
+                if not chunk:
+                    break
+
+                yield chunk
+
+    finally:
+        writer.join()
+
+    if errors:
+        raise errors[0]
+
+
+@tracing.traced('archive')
+def copy_members_to_container(container, members, path_in_container='/'):
+    """Copy local files into the specified container by streaming a tar archive of them.
+
+    The members are added to the archive by their absolute paths, so they appear at the same
+    absolute paths inside the container (when `path_in_container` is '/'). Returns the list of
+    absolute paths of the members inside the container.
+
+    Arguments:
+    container -- the docker container into which the files are being copied
+    members -- local files and directories to copy
+    path_in_container -- directory in the container into which the archive is extracted
+    """
+    members = [os.path.abspath(m) for m in members]
+
+    logging.debug('streaming members [{0}] to container [{1}] at [{2}]'.format(
+        members, container.name, path_in_container))
+
+    if not container.put_archive(path_in_container, stream_archive(members)):
+        raise RuntimeError('failed to put archive in container [{}]'.format(container.name))
+
+    return [os.path.join(path_in_container, m.lstrip(os.sep)) for m in members]
+
+
 def extract_archive(path_to_archive, path_to_extraction=None):
     """Extract the contents of an archive to a directory and return the path to the directory.
 
@@ -71,11 +183,56 @@ def extract_archive(path_to_archive, path_to_extraction=None):
     return dest
 
 
+class _chunk_stream(io.RawIOBase):
+    """Read-only file object over an iterable of byte chunks, such as the stream returned by get_archive."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+def extract_stream(chunks, path_to_extraction):
+    """Extract a tar archive from an iterable of byte chunks as it is read, without saving the archive.
+
+    Arguments:
+    chunks -- iterable of bytes making up the archive (e.g. the stream returned by get_archive)
+    path_to_extraction -- path to the directory into which the contents will be extracted
+    """
+    dest = os.path.abspath(path_to_extraction)
+
+    with tarfile.open(fileobj=_chunk_stream(chunks), mode='r|') as f:
+        for member in f:
+            member_path = os.path.abspath(os.path.join(dest, member.name))
+            if os.path.commonpath([dest, member_path]) != dest:
+                raise RuntimeError('Attempted Path Traversal in Tar File')
+
+            f.extract(member, dest)
+
+    return dest
+
+
 def path_to_archive_in_container(archive_file_path_on_host, extension='tar'):
     """Return path to directory containing extracted archive when copied to container."""
     return '/' + os.path.basename(os.path.abspath(archive_file_path_on_host))[:(len(extension) + 1) * -1]
 
 
+@tracing.traced('archive')
+@instrumentation.counted('copy_archive_to_container')
 def copy_archive_to_container(container, archive_file_path_on_host, extension='tar'):
     """Copy local archive file into the specified container in extracted form.
 
@@ -97,6 +254,8 @@ def copy_archive_to_container(container, archive_file_path_on_host, extension='t
     return dir_path
 
 
+@tracing.traced('archive')
+@instrumentation.counted('copy_from_container')
 def copy_from_container(container,
                         path_to_source_on_container,
                         path_to_destination_directory_on_host=None,
@@ -169,6 +328,80 @@ def copy_from_container(container,
     return dest if cleanup else archive_path
 
 
+@tracing.traced('archive')
+@instrumentation.counted('copy_from_container')
+def stream_from_container(container, path_to_source_on_container, path_to_destination_directory_on_host):
+    """Copy a file or directory from the container into a directory on the host, extracting it as it arrives.
+
+    Unlike `copy_from_container`, the archive is never written to the host.
+
+    Arguments:
+    container -- the Docker container from which the file or directory is to be copied
+    path_to_source_on_container -- absolute path to the source file or directory inside the container
+    path_to_destination_directory_on_host -- the directory into which the file or directory is copied
+    """
+    logging.debug('streaming file [{}] in container [{}] to [{}]'
+                  .format(path_to_source_on_container, container.name, path_to_destination_directory_on_host))
+
+    bits, _ = container.get_archive(path_to_source_on_container)
+
+    return extract_stream(bits, path_to_destination_directory_on_host)
+
+
+@tracing.traced('archive')
+def read_file_from_container(container, path_to_file_on_container):
+    """Return the contents and tar header of a regular file in the container, without touching the host disk.
+
+    Returns a tuple of (tarfile.TarInfo, bytes). The TarInfo carries the owner and mode of the file so
+    that it can be handed to `write_file_to_container` to replace the file in place.
+
+    Arguments:
+    container -- the Docker container from which the file is read
+    path_to_file_on_container -- absolute path to the file inside the container
+    """
+    import io
+
+    bits, _ = container.get_archive(path_to_file_on_container)
+
+    with tarfile.open(fileobj=io.BytesIO(b''.join(bits)), mode='r|') as tf:
+        for member in tf:
+            if not member.isfile():
+                break
+
+            return member, tf.extractfile(member).read()
+
+    raise RuntimeError(f'[{container.name}] [{path_to_file_on_container}] is not a regular file')
+
+
+@tracing.traced('archive')
+def write_file_to_container(container, path_to_file_on_container, contents, tarinfo=None):
+    """Write `contents` to a file in the container in a single put_archive call.
+
+    Arguments:
+    container -- the Docker container in which the file is written
+    path_to_file_on_container -- absolute path to the file inside the container
+    contents -- bytes to write to the file
+    tarinfo -- tar header from `read_file_from_container` whose owner and mode the file should keep
+               (default: a root-owned file with mode 0644)
+    """
+    import copy
+    import io
+    import time
+
+    info = copy.copy(tarinfo) if tarinfo else tarfile.TarInfo()
+    info.name = os.path.basename(path_to_file_on_container)
+    info.size = len(contents)
+    info.mtime = time.time()
+
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tf:
+        tf.addfile(info, io.BytesIO(contents))
+
+    if not container.put_archive(os.path.dirname(path_to_file_on_container), buf.getvalue()):
+        raise RuntimeError(f'[{container.name}] failed to write file [{path_to_file_on_container}]')
+
+
+@tracing.traced('archive')
 def copy_files_in_container(container, sources_and_destinations):
     """Copy files in container from source to destination.
 
@@ -176,8 +409,7 @@ def copy_files_in_container(container, sources_and_destinations):
     container -- the docker.Container in which files will be copied
     sources_and_destinations -- a list of tuples of source paths and destination paths
     """
-    tarfile = create_archive([s for s, d in sources_and_destinations], 'ssl')
-    archive_dirname = copy_archive_to_container(container, tarfile)
+    copy_members_to_container(container, [s for s, d in sources_and_destinations])
 
     for s, d in sources_and_destinations:
         logging.debug(
@@ -195,23 +427,80 @@ def collect_files_from_containers(docker_client,
                                   output_directory_on_host):
     """Collect files from containers into a single output directory on the host.
 
+    Every path is copied from every container concurrently (see `collect_paths_from_containers`).
+
     Arguments:
     docker_client -- the Docker client for communicating with the daemon
     containers -- list of Containers from which paths will be copied
     paths_to_copy_from_containers -- list of path-likes which will be copied from the containers
     output_directory_on_host -- the output directory on the host where files will be copied
     """
-    for c in containers:
+    collect_paths_from_containers(docker_client,
+                                  {c: paths_to_copy_from_containers for c in containers},
+                                  output_directory_on_host)
+
+
+def collect_paths_from_containers(docker_client, paths_by_container, output_directory_on_host):
+    """Copy paths from containers into `logs/<container name>` in an output directory on the host.
+
+    All of the copies run concurrently, and each is extracted as it is streamed from its container.
+    A path which fails to copy does not stop the others from being copied.
+
+    Arguments:
+    docker_client -- the Docker client for communicating with the daemon
+    paths_by_container -- dict of Containers to the list of paths to copy from each
+    output_directory_on_host -- the output directory on the host where files will be copied
+    """
+    import asyncio
+
+    from . import async_executor
+
+    async def collect_from_container(c):
+        paths = paths_by_container[c]
+
         od = os.path.join(output_directory_on_host, 'logs', c.name)
-        if not os.path.exists(od):
-            os.makedirs(od)
+        os.makedirs(od, exist_ok=True)
+
+        logging.info(f'saving files in [{paths}] to [{od}] [{c.name}]')
+
+        source_container = await async_executor.run_blocking(docker_client.containers.get, c.name)
+
+        results = await asyncio.gather(*[async_executor.run_blocking(stream_from_container, source_container, p, od)
+                                         for p in paths],
+                                       return_exceptions=True)
+
+        failures = [(p, r) for p, r in zip(paths, results) if isinstance(r, BaseException)]
+        for p, e in failures:
+            logging.error(f'[{c.name}] failed to copy [{p}]: {e}')
+
+        return 1 if failures else 0
+
+    rc = async_executor.run(async_executor.run_for_containers(collect_from_container,
+                                                              list(paths_by_container),
+                                                              'collecting files'))
+
+    if rc != 0:
+        raise RuntimeError('failed to collect files from some containers')
+
+
+def bundle_directory(path_to_directory, path_to_bundle):
+    """Compress a directory on the host into a gzipped tar file and remove the directory.
+
+    The members of the bundle are named relative to the parent of the directory, so extracting the
+    bundle next to it recreates the directory.
+
+    Arguments:
+    path_to_directory -- path to the directory to bundle
+    path_to_bundle -- path to the gzipped tar file which is written
+    """
+    logging.debug('bundling [{}] into [{}]'.format(path_to_directory, path_to_bundle))
 
-        logging.info(f'saving files in [{paths_to_copy_from_containers}] to [{od}] [{c.name}]')
+    with tarfile.open(path_to_bundle, 'w:gz') as f:
+        f.add(path_to_directory, arcname=os.path.basename(os.path.abspath(path_to_directory)))
 
-        source_container = docker_client.containers.get(c.name)
+    shutil.rmtree(path_to_directory)
 
-        for p in paths_to_copy_from_containers:
-            copy_from_container(source_container, p, od)
+    return path_to_bundle
 
 
 def put_string_to_file(container, target_file, string):
@@ -0,0 +1,242 @@
+"""Content-addressed cache of tar archives of local files, shared across runs and containers.
+
+Installing packages from a local build directory puts the same set of package files into every
+container of every project, run after run. Archives are cached on the host under a key derived from
+the paths, sizes, and modification times of their members (or, optionally, digests of the member
+contents), so a repeated run against an unchanged build directory reuses the archive built the first
+time. Each archive is also only put into a given container once per process.
+
+Every archive has a lock file next to it (`<key>.tar.lock`). Builds of an archive hold an exclusive
+lock on it, and a process which has been handed an archive holds a shared lock on it until the
+process exits, so archives are never pruned while they are being built or may still be used. Lock
+files are never removed, because a process waiting on a removed lock file would not exclude one
+which opens the lock file anew.
+"""
+
+# grown-up modules
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+# local modules
+from . import archive
+from . import context
+
+# Number of archives to keep in the cache. The least recently used archives beyond this are removed.
+DEFAULT_MAX_ENTRIES = 16
+
+# (container ID, archive key) pairs for archives which have already been put into a container.
+_uploaded = set()
+_uploaded_lock = threading.Lock()
+
+# Building the same archive twice at once in this process is wasted effort, so builds of a key are serialized.
+_build_locks = dict()
+_build_locks_lock = threading.Lock()
+
+# Paths of archives handed out by this process -> open lock files on which a shared lock is held.
+_held_lock_files = dict()
+
+
+def default_directory():
+    """
+    Return the default directory in which cached archives are stored.
+
+    Returns:
+        Path to a directory under the user's cache directory (respects XDG_CACHE_HOME).
+    """
+    return context.host_cache_directory('archives')
+
+
+def _walk(members):
+    for m in sorted(os.path.abspath(m) for m in members):
+        if not os.path.isdir(m):
+            yield m
+            continue
+
+        for root, dirs, files in os.walk(m):
+            dirs.sort()
+            for f in sorted(files):
+                yield os.path.join(root, f)
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(archive.STREAM_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def archive_key(members, use_digests=False):
+    """
+    Return the cache key for an archive of the files in `members`.
+
+    Arguments:
+        members: local files and directories to be placed in the archive
+        use_digests: if True, hash file contents instead of trusting sizes and modification times
+
+    Returns:
+        A hex string which changes whenever the path, size, or modification time (or contents, if
+        `use_digests` is True) of any file in the archive changes.
+    """
+    h = hashlib.sha256()
+
+    for path in _walk(members):
+        st = os.stat(path)
+        fingerprint = _file_digest(path) if use_digests else f'{st.st_size}:{st.st_mtime_ns}'
+        h.update(f'{path}\0{fingerprint}\n'.encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def key_of(path_to_archive):
+    """Return the cache key of the cached archive at `path_to_archive`."""
+    return os.path.basename(path_to_archive).split('.')[0]
+
+
+def prune(directory=None, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Remove the least recently used archives from the cache, keeping at most `max_entries`.
+
+    Archives which are locked - being built, or handed out to a process which is still running - are
+    kept even if they are beyond `max_entries`.
+
+    Arguments:
+        directory: the cache directory (default: `default_directory()`)
+        max_entries: number of archives to keep
+    """
+    directory = directory or default_directory()
+
+    try:
+        entries = [os.path.join(directory, e) for e in os.listdir(directory) if e.endswith('.tar')]
+        entries.sort(key=os.path.getmtime, reverse=True)
+
+    except OSError as e:
+        logging.debug(f'failed to list archive cache [{directory}]: {e}')
+        return
+
+    for e in entries[max_entries:]:
+        with open(e + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            except BlockingIOError:
+                logging.debug(f'not removing archive in use from cache [{e}]')
+                continue
+
+            logging.info(f'removing archive from cache [{e}]')
+
+            try:
+                os.unlink(e)
+            except FileNotFoundError:
+                pass
+
+
+def get_or_create_archive(members, directory=None, use_digests=False, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    Return the path to a cached tar archive of the files in `members`, building it if necessary.
+
+    The archive must not be modified or removed by the caller. It is not pruned from the cache
+    while this process is running.
+
+    Arguments:
+        members: local files and directories to be placed in the archive
+        directory: the cache directory (default: `default_directory()`)
+        use_digests: if True, key the archive on file contents instead of sizes and modification times
+        max_entries: number of archives to keep in the cache after adding a new one
+
+    Returns:
+        Path to the cached archive.
+    """
+    directory = directory or default_directory()
+    key = archive_key(members, use_digests=use_digests)
+    path = os.path.join(directory, key + '.tar')
+
+    with _build_locks_lock:
+        build_lock = _build_locks.setdefault(path, threading.Lock())
+
+    os.makedirs(directory, exist_ok=True)
+
+    with build_lock:
+        lock_file = _held_lock_files.get(path)
+
+        # A shared lock is already held on an archive this process has been handed, so it is still there.
+        if lock_file is not None:
+            logging.info(f'using cached archive [{path}]')
+            os.utime(path)
+            return path
+
+        # Other processes (e.g. the projects of a matrix run) may want the same archive at the same time,
+        # so builds of a key are also serialized across processes with a lock file next to the archive.
+        lock_file = open(path + '.lock', 'a')
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            if os.path.exists(path):
+                logging.info(f'using cached archive [{path}]')
+                # The modification time of the archive records when it was last used, for pruning.
+                os.utime(path)
+            else:
+                _build_archive(members, directory, key, path)
+
+            # Other processes may use the archive as well from now on, but none may prune it.
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+
+        except BaseException:
+            lock_file.close()
+            raise
+
+        _held_lock_files[path] = lock_file
+
+    prune(directory, max_entries)
+
+    return path
+
+
+def _build_archive(members, directory, key, path):
+
+    # Build under a temporary name and rename into place so that concurrent jobs never see a partial archive.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=key, suffix='.tmp')
+
+    logging.info(f'building archive for cache [{path}]')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            archive.write_archive([os.path.abspath(m) for m in members], f)
+
+        os.replace(tmp_path, path)
+
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def copy_archive_to_container(container, path_to_archive):
+    """
+    Put a cached archive into the specified container in extracted form, unless it is already there.
+
+    Arguments:
+        container: the docker container into which the archive is being copied
+        path_to_archive: path to an archive returned by `get_or_create_archive`
+
+    Returns:
+        True if the archive was copied, False if the container already had it.
+    """
+    uploaded = (container.id, key_of(path_to_archive))
+
+    with _uploaded_lock:
+        if uploaded in _uploaded:
+            logging.debug(f'[{container.name}] already has archive [{path_to_archive}]')
+            return False
+
+    archive.copy_archive_to_container(container, path_to_archive)
+
+    with _uploaded_lock:
+        _uploaded.add(uploaded)
+
+    return True
@@ -0,0 +1,213 @@
+"""An asyncio layer for running many container operations concurrently with a bounded number of threads.
+
+Fanning work out over the containers of a project used to mean a fresh ThreadPoolExecutor per call
+site, each sized by default and each with its own hand-written loop over the results. Here, work on
+containers is written as coroutines, and the blocking Docker API calls they make (exec, put_archive,
+get_archive) all run on one shared, bounded thread pool - the scheduler. A coroutine waiting on a
+Docker call does not hold a thread while other coroutines are queued, so hundreds of container
+operations can be in flight with only `max_concurrency` threads talking to the daemon.
+
+Cancellation is structured: `run_for_containers` cancels the remaining work when the caller is
+cancelled (e.g. by KeyboardInterrupt in `run`), and with `fail_fast` when any of the work fails.
+Operations still queued for the scheduler are dropped. An operation already running in a thread
+cannot be interrupted and finishes before the cancellation completes.
+
+Functions run on the scheduler with `run_blocking` must not themselves wait for work on the
+scheduler, or the pool can deadlock once every thread is taken by such a function.
+"""
+
+# grown-up modules
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import threading
+
+# local modules
+from . import archive
+from . import execute
+from . import instrumentation
+from . import json_utils
+
+DEFAULT_MAX_CONCURRENCY = 32
+
+
+class scheduler(object):
+    """A bounded pool of threads on which the blocking calls of every coroutine are run."""
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """Construct a scheduler.
+
+        Arguments:
+        max_concurrency -- maximum number of blocking calls running at once
+        """
+        if max_concurrency < 1:
+            raise ValueError('max_concurrency must be a positive integer')
+
+        self.max_concurrency = max_concurrency
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency,
+                                                              thread_name_prefix='async_executor')
+
+    async def run(self, fn, *args, **kwargs):
+        """Run the blocking callable `fn` with the given arguments on the pool and return its result."""
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so that, e.g., the tracing phase follows the work.
+        context = contextvars.copy_context()
+        context.run(instrumentation.remember_caller)
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    def shutdown(self):
+        """Stop accepting work and drop anything still queued."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def configure(max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Replace the shared scheduler with one which runs at most `max_concurrency` blocking calls at once."""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown()
+
+        _scheduler = scheduler(max_concurrency)
+
+
+def get_scheduler():
+    """Return the shared scheduler, creating it with the default concurrency if needed."""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = scheduler()
+
+        return _scheduler
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run the blocking callable `fn` with the given arguments on the shared scheduler and return its result."""
+    return await get_scheduler().run(fn, *args, **kwargs)
+
+
+async def execute_command(container, command, user='', workdir=None, stream_output=None):
+    """Asynchronous version of `execute.execute_command`.
+
+    Arguments:
+    container -- container in which the command will be run
+    command -- string representing the command to run
+    user -- the user whose identity will be assumed when running the command (default: root)
+    workdir -- the present working directory for the command (default: root directory)
+    stream_output -- see `execute.execute_command`
+    """
+    return await run_blocking(execute.execute_command, container, command,
+                              user=user, workdir=workdir, stream_output=stream_output)
+
+
+async def copy_archive_to_container(container, path_to_archive, extension='tar'):
+    """Asynchronous version of `archive.copy_archive_to_container`.
+
+    Arguments:
+    container -- the docker container into which the archive is being copied
+    path_to_archive -- local path to the archive being copied
+    extension -- the file extension of the archive (default: tar)
+    """
+    return await run_blocking(archive.copy_archive_to_container, container, path_to_archive, extension)
+
+
+async def get_json_from_file(container, target_file):
+    """Asynchronous version of `json_utils.get_json_from_file`.
+
+    Arguments:
+    container -- docker.Container where the target_file is hosted
+    target_file -- the path inside the container with the JSON contents
+    """
+    return await run_blocking(json_utils.get_json_from_file, container, target_file)
+
+
+async def put_json_to_file(container, target_file, json_contents):
+    """Asynchronous version of `json_utils.put_json_to_file`.
+
+    Arguments:
+    container -- docker.Container where the target_file is hosted
+    target_file -- the path inside the container with the JSON contents to modify
+    json_contents -- JSON contents to write to the target file in the container
+    """
+    return await run_blocking(json_utils.put_json_to_file, container, target_file, json_contents)
+
+
+async def run_for_containers(coroutine_function, containers, description, *args, fail_fast=False, **kwargs):
+    """Run `coroutine_function(container, *args, **kwargs)` concurrently for each container.
+
+    Each result is logged in the same way as the ThreadPoolExecutor loops which this replaces: a return
+    value other than 0 (None counts as 0) or an exception is an error for that container.
+
+    Arguments:
+    coroutine_function -- async function to run for each container
+    containers -- the containers (anything with a `name`) for which `coroutine_function` is run
+    description -- what is being done, for logging (e.g. 'configuring host resolution')
+    fail_fast -- if True, cancel the work for every other container as soon as one fails
+
+    Returns:
+        0 if the work succeeded for every container. Otherwise, the last non-zero return value, or 1
+        if an exception was raised.
+    """
+    tasks_to_containers = {
+        asyncio.ensure_future(coroutine_function(c, *args, **kwargs)): c for c in containers
+    }
+
+    if not tasks_to_containers:
+        return 0
+
+    rc = 0
+
+    try:
+        pending = set(tasks_to_containers)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            for t in done:
+                container = tasks_to_containers[t]
+
+                try:
+                    ec = t.result() or 0
+                    if ec != 0:
+                        logging.error(f'[{container.name}] error while {description}')
+                        rc = ec
+                    else:
+                        logging.info(f'[{container.name}] done {description}')
+
+                except asyncio.CancelledError:
+                    rc = rc or 1
+
+                except Exception as e:
+                    logging.error(f'[{container.name}] exception raised while {description}')
+                    logging.error(e)
+                    rc = 1
+
+            if rc != 0 and fail_fast:
+                break
+
+    finally:
+        # Whether leaving early, failing fast, or being cancelled, nothing is left running behind the caller.
+        remaining = [t for t in tasks_to_containers if not t.done()]
+        for t in remaining:
+            t.cancel()
+
+        if remaining:
+            await asyncio.wait(remaining)
+
+    return rc
+
+
+def run(coroutine):
+    """Run `coroutine` to completion from synchronous code and return its result.
+
+    Must not be called from a thread which is already running an event loop, or from a function
+    running on the scheduler.
+    """
+    return asyncio.run(coroutine)
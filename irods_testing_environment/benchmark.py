@@ -0,0 +1,238 @@
+"""Benchmarks of bringing up and tearing down test environments, run against the fake Docker backend.
+
+Each benchmark times one entry point (e.g. `services.create_topologies`) on a project made of
+fake_docker containers, after preparing the project with whatever the entry point expects to have
+been done already. Besides the time taken, each benchmark reports the Docker operations the entry
+point made (execs, inspects, archive transfers, and so on) and the most execs it had in flight at
+once. The operation counts do not depend on the speed of the host, so comparing them against those
+of an earlier run (see `compare`) catches changes which make setup chattier or less concurrent.
+"""
+
+# grown-up modules
+import logging
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+# local modules
+from . import context
+from . import fake_docker
+from . import federate
+from . import irods_config
+from . import irods_setup
+from . import logs
+from . import services
+from .install import install
+
+
+class environment(object):
+    """Shape of the environment being benchmarked and the fake backend it runs on."""
+    def __init__(self,
+                 client,
+                 zone_count=2,
+                 consumers_per_zone=2,
+                 database_image='postgres:14',
+                 package_size=1024 * 1024):
+        """Construct an environment.
+
+        Arguments:
+        client -- fake_docker.fake_client on which the projects are run
+        zone_count -- number of Zones in each project
+        consumers_per_zone -- number of catalog service consumers in each Zone
+        database_image -- image of the catalog database service
+        package_size -- size in bytes of each of the fake iRODS packages
+        """
+        self.client = client
+        self.zone_count = zone_count
+        self.consumers_per_zone = consumers_per_zone
+        self.database_image = database_image
+        self.package_size = package_size
+        self.package_directory = None
+        self.output_directory = None
+
+    def __enter__(self):
+        self.output_directory = tempfile.mkdtemp(prefix='irods_testing_environment_benchmark_')
+        self.package_directory = os.path.join(self.output_directory, 'packages')
+        os.makedirs(self.package_directory)
+
+        database = context.image_repo(self.database_image)
+        for name in context.irods_package_names(database) + context.irods_externals_package_names():
+            path = os.path.join(self.package_directory, '{}_0.0.0-0_amd64.deb'.format(name))
+            with open(path, 'wb') as f:
+                f.write(os.urandom(self.package_size))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.output_directory, ignore_errors=True)
+
+    def make_context(self, project_name):
+        """Return a context for a new fake project called `project_name`."""
+        project = fake_docker.fake_project(self.client, project_name, database_image=self.database_image)
+        return context.context(self.client, project)
+
+    def bring_up(self, ctx):
+        """Bring up the containers of the project of `ctx` for this environment."""
+        ctx.compose_project.up(scale_override={
+            context.irods_catalog_database_service(): self.zone_count,
+            context.irods_catalog_provider_service(): self.zone_count,
+            context.irods_catalog_consumer_service(): self.consumers_per_zone * self.zone_count
+        })
+
+        # Warm the cached image information so that it is not counted against the entry point.
+        ctx.platform()
+        ctx.database()
+
+    def zone_info_list(self, ctx, distinct_names=False):
+        """Return the zone_info for each Zone in the project of `ctx`."""
+        zone_names = ['tempZone{}'.format(i + 1) if distinct_names else 'tempZone'
+                      for i in range(self.zone_count)]
+        return irods_setup.get_info_for_zones(ctx, zone_names, self.consumers_per_zone)
+
+
+def create_topologies(env, ctx):
+    return lambda: services.create_topologies(ctx,
+                                              zone_count=env.zone_count,
+                                              externals_directory=env.package_directory,
+                                              package_directory=env.package_directory,
+                                              consumer_count=env.consumers_per_zone)
+
+
+def install_irods_packages(env, ctx):
+    env.bring_up(ctx)
+    installer = install.make_installer(ctx.platform_name())
+    return lambda: installer.install_irods_packages(ctx,
+                                                    externals_directory=env.package_directory,
+                                                    package_directory=env.package_directory)
+
+
+def setup_irods_zones(env, ctx):
+    env.bring_up(ctx)
+    zone_info_list = env.zone_info_list(ctx)
+    return lambda: irods_setup.setup_irods_zones(ctx, zone_info_list)
+
+
+def configure_irods_testing(env, ctx):
+    env.bring_up(ctx)
+    return lambda: irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+
+
+def form_federation_clique(env, ctx):
+    env.bring_up(ctx)
+    zone_info_list = env.zone_info_list(ctx, distinct_names=True)
+    return lambda: federate.form_federation_clique(ctx, zone_info_list)
+
+
+def collect_logs(env, ctx):
+    env.bring_up(ctx)
+    output_directory = tempfile.mkdtemp(dir=env.output_directory)
+    return lambda: logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
+
+
+# Each benchmark takes the environment and a context for a fresh project, prepares the project,
+# and returns the callable which is timed.
+BENCHMARKS = {
+    'create_topologies': create_topologies,
+    'install_irods_packages': install_irods_packages,
+    'setup_irods_zones': setup_irods_zones,
+    'configure_irods_testing': configure_irods_testing,
+    'form_federation_clique': form_federation_clique,
+    'collect_logs': collect_logs,
+}
+
+
+def run_benchmark(env, name, repetitions=3):
+    """Run the benchmark called `name` `repetitions` times, each on a fresh project, and return its results.
+
+    Arguments:
+    env -- environment in which the benchmark runs
+    name -- name of the benchmark (a key of BENCHMARKS)
+    repetitions -- number of times to run the benchmark
+
+    Returns:
+        A dict with the time taken by each repetition ('seconds'), its minimum and median, and the
+        Docker operations made by the last repetition ('operations').
+    """
+    seconds = list()
+    operations = None
+
+    for i in range(repetitions):
+        ctx = env.make_context('benchmark{}{}'.format(name.replace('_', ''), i))
+
+        try:
+            fn = BENCHMARKS[name](env, ctx)
+
+            env.client.reset_counters()
+
+            start = time.perf_counter()
+            fn()
+            seconds.append(time.perf_counter() - start)
+
+            operations = env.client.counters()
+
+        finally:
+            ctx.compose_project.down()
+
+        logging.info('[{}] repetition [{}] took [{:.3f}] seconds'.format(name, i + 1, seconds[-1]))
+
+    return {
+        'seconds': seconds,
+        'min_seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'operations': operations
+    }
+
+
+def compare(results, baseline, fan_out_tolerance=0.25):
+    """Return the regressions in `results` relative to `baseline` as a list of strings.
+
+    Any operation made more often than in the baseline is a regression, as is a peak number of
+    execs in flight which is lower than the baseline's by more than `fan_out_tolerance`. Times are
+    not compared because they depend on the host.
+
+    Arguments:
+    results -- dict of benchmark names to results from `run_benchmark`
+    baseline -- results from an earlier run, in the same form
+    fan_out_tolerance -- fraction by which the peak number of execs in flight may drop
+    """
+    regressions = list()
+
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+
+        now = result['operations']
+        before = baseline[name]['operations']
+
+        for operation, count in sorted(now.items()):
+            if operation in ('bytes_transferred', 'max_execs_in_flight'):
+                continue
+
+            if count > before.get(operation, 0):
+                regressions.append('[{}] [{}] went from [{}] to [{}]'
+                                   .format(name, operation, before.get(operation, 0), count))
+
+        fan_out = before.get('max_execs_in_flight', 0)
+        if now['max_execs_in_flight'] < fan_out * (1 - fan_out_tolerance):
+            regressions.append('[{}] peak execs in flight went from [{}] to [{}]'
+                               .format(name, fan_out, now['max_execs_in_flight']))
+
+    return regressions
+
+
+def summary(results):
+    """Return a table of the times and main operation counts in `results` as a string."""
+    columns = ['exec', 'inspect', 'get_archive', 'put_archive', 'max_execs_in_flight']
+
+    widths = [max(12, len(c) + 2) for c in columns]
+
+    lines = ['{:<26}{:>12}{:>12}'.format('benchmark', 'min (s)', 'median (s)') +
+             ''.join('{:>{}}'.format(c, w) for c, w in zip(columns, widths))]
+
+    for name, result in results.items():
+        lines.append('{:<26}{:>12.3f}{:>12.3f}'.format(name, result['min_seconds'], result['median_seconds']) +
+                     ''.join('{:>{}}'.format(result['operations'].get(c, 0), w) for c, w in zip(columns, widths)))
+
+    return '\n'.join(lines)
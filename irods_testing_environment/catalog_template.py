@@ -0,0 +1,109 @@
+"""Pristine copies of set-up catalogs from which the catalogs are quickly re-created.
+
+Re-creating a catalog by dropping it and running the iRODS setup again takes minutes. Instead, the
+catalog is saved as a template once the Zone is set up, and later resets clone the catalog from the
+template. Postgres keeps the template as a database in the server and clones it with `CREATE
+DATABASE ... TEMPLATE`; MySQL and MariaDB keep a dump in the database container. Because a dump is
+a file, it can also be cached on the host under a key identifying the setup inputs, so that it
+outlives the container.
+
+No iRODS server may be connected to a catalog while its template is saved or cloned.
+"""
+
+# grown-up modules
+import logging
+import os
+
+# local modules
+from . import archive
+from . import context
+from . import database_setup
+
+TEMPLATE_SUFFIX = '_template'
+
+
+def template_name(database_name):
+    """Return the name of the template for the database called `database_name`."""
+    return database_name + TEMPLATE_SUFFIX
+
+
+def _database_containers(ctx):
+    return [ctx.docker_client.containers.get(c.name)
+            for c in ctx.compose_project.containers()
+            if context.is_catalog_database_container(c)]
+
+
+def _host_copy(key, container):
+    return context.host_cache_directory('catalog_templates', key,
+                                        str(context.service_instance(container.name)))
+
+
+def save_templates(ctx, database_name='ICAT', key=None):
+    """Save the catalog in every database container of the project as a template.
+
+    Arguments:
+    ctx -- context object which contains information about the Docker environment
+    database_name -- name of the iRODS database
+    key -- string identifying the setup inputs, under which templates kept in files are also
+           cached on the host (default: they are only kept in the container)
+    """
+    template = template_name(database_name)
+
+    for container in _database_containers(ctx):
+        strat = database_setup.make_strategy(ctx.database(), container)
+
+        if strat.save_template(database_name, template) != 0:
+            raise RuntimeError(f'[{container.name}] failed to save catalog template [{template}]')
+
+        path = strat.template_path(template)
+        if key and path:
+            host_directory = _host_copy(key, container)
+            os.makedirs(host_directory, exist_ok=True)
+            archive.copy_from_container(container, path, host_directory)
+
+        logging.info(f'[{container.name}] saved catalog template [{template}]')
+
+
+def clone_templates(ctx, database_name='ICAT', database_user='irods', key=None):
+    """Re-create the catalog in every database container of the project from its template.
+
+    Nothing is changed unless a template is available for every catalog.
+
+    Arguments:
+    ctx -- context object which contains information about the Docker environment
+    database_name -- name of the iRODS database
+    database_user -- name of the iRODS database user which owns the database
+    key -- string identifying the setup inputs, under which templates kept in files were cached
+           on the host by `save_templates`
+
+    Returns:
+        True if every catalog was cloned, or False if a template was missing.
+    """
+    template = template_name(database_name)
+
+    strategies = [database_setup.make_strategy(ctx.database(), c) for c in _database_containers(ctx)]
+
+    for strat in strategies:
+        if strat.template_exists(template):
+            continue
+
+        path = strat.template_path(template)
+        host_path = os.path.join(_host_copy(key, strat.container), os.path.basename(path)) \
+                    if key and path else None
+
+        if not host_path or not os.path.exists(host_path):
+            logging.info(f'[{strat.container.name}] no catalog template [{template}]')
+            return False
+
+        logging.info(f'[{strat.container.name}] restoring catalog template from [{host_path}]')
+
+        with open(host_path, 'rb') as f:
+            archive.write_file_to_container(strat.container, path, f.read())
+
+    for strat in strategies:
+        if strat.clone_template(template, database_name, database_user) != 0:
+            raise RuntimeError(f'[{strat.container.name}] failed to clone catalog from template [{template}]')
+
+        logging.info(f'[{strat.container.name}] cloned catalog from template [{template}]')
+
+    return True
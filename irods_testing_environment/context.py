@@ -1,8 +1,22 @@
 """Manages information about iRODS test containers and services, and provides other utilities."""
 
+import threading
+
+import compose.project
 import docker
 
 _docker_client = None
+_docker_client_lock = threading.Lock()
+
+
+def _shared_docker_client():
+    global _docker_client
+
+    with _docker_client_lock:
+        if _docker_client is None:
+            _docker_client = docker.from_env()
+
+    return _docker_client
 
 
 def docker_client():
@@ -12,7 +26,126 @@ def docker_client():
     Returns:
         A docker.client instance.
     """
-    return _docker_client or docker.from_env()
+    return _shared_docker_client()
+
+
+def set_docker_client(client):
+    """
+    Use `client` as the static docker.client instance from now on (e.g. a stand-in for the daemon).
+
+    Arguments:
+        client: the client to use in place of the one constructed from the local environment
+    """
+    global _docker_client
+
+    with _docker_client_lock:
+        _docker_client = client
+
+    invalidate_inspection_index()
+
+
+class inspection_index(object):
+    """Cache of `docker inspect` results for the containers in Compose projects, keyed by container name.
+
+    The first lookup of a container from a project loads every container in that project with a single
+    filtered list call, so the repeated lookups done by the setup loops do not each go to the daemon. The
+    entries for a project are dropped whenever `up` or `down` runs on that project.
+    """
+
+    def __init__(self):
+        """Construct an empty inspection_index."""
+        self.lock = threading.Lock()
+        self.attrs = dict()
+        self.projects = dict()
+
+    def load_project(self, project_name):
+        """
+        Load the inspection results for every container in the named Compose project.
+
+        Arguments:
+            project_name: name of the Compose project whose containers are loaded
+        """
+        containers = docker_client().containers.list(
+            all=True, filters={"label": [f"com.docker.compose.project={project_name}"]}
+        )
+
+        with self.lock:
+            self._drop_project(project_name)
+            self.projects[project_name] = [c.name for c in containers]
+            for c in containers:
+                self.attrs[c.name] = c.attrs
+
+    def _drop_project(self, project_name):
+        for name in self.projects.pop(project_name, []):
+            self.attrs.pop(name, None)
+
+    def invalidate(self, project_name=None):
+        """
+        Drop cached inspection results.
+
+        Arguments:
+            project_name: name of the Compose project whose results are dropped (if None, all are dropped)
+        """
+        with self.lock:
+            if project_name is None:
+                self.attrs.clear()
+                self.projects.clear()
+            else:
+                self._drop_project(project_name)
+
+    def inspect(self, container_name):
+        """
+        Return the inspection results for the named container.
+
+        Arguments:
+            container_name: the name of the container to inspect
+
+        Returns:
+            The dict returned by `docker inspect` for the named container.
+        """
+        with self.lock:
+            if container_name in self.attrs:
+                return self.attrs[container_name]
+
+        attrs = docker_client().api.inspect_container(container_name)
+
+        project = attrs["Config"]["Labels"].get("com.docker.compose.project")
+        if project is None:
+            return attrs
+
+        self.load_project(project)
+
+        with self.lock:
+            # The container could have gone away between the inspect and the list call.
+            return self.attrs.get(container_name, attrs)
+
+
+_inspection_index = inspection_index()
+
+compose.project.register_change_callback(_inspection_index.invalidate)
+
+
+def inspect_container(container_name):
+    """
+    Return the (cached) inspection results for the named container.
+
+    Arguments:
+        container_name: the name of the container to inspect
+
+    Returns:
+        The dict returned by `docker inspect` for the named container.
+    """
+    return _inspection_index.inspect(container_name)
+
+
+def invalidate_inspection_index(project_name=None):
+    """
+    Drop cached inspection results so that the next lookup goes to the Docker daemon.
+
+    Arguments:
+        project_name: name of the Compose project whose results are dropped (if None, all are dropped)
+    """
+    _inspection_index.invalidate(project_name)
 
 
 class context(object):
@@ -25,7 +158,7 @@ class context(object):
         docker_client -- Docker client environment with which we communicate with the daemon
         compose_project -- compose.project information
         """
-        self.docker_client = docker_client or docker_client()
+        self.docker_client = docker_client or _shared_docker_client()
         self.compose_project = compose_project
         self.platform_image_tag = None
         self.database_image_tag = None
@@ -124,6 +257,17 @@ def irods_catalog_consumer_service():
     return 'irods-catalog-consumer'
 
 
+def host_cache_directory(*subdirectories):
+    """Return the path to the testing environment's cache directory on the host (respects XDG_CACHE_HOME).
+
+    Arguments:
+    subdirectories -- path components to join onto the cache directory
+    """
+    import os
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'irods_testing_environment', *subdirectories)
+
+
 def irods_home():
     """Return the path to the iRODS Linux user's home directory."""
     import os
@@ -187,7 +331,7 @@ def project_name(container_name):
     Returns:
         The Compose project name associated with the named container.
     """
-    return docker_client().api.inspect_container(container_name)["Config"]["Labels"]["com.docker.compose.project"]
+    return inspect_container(container_name)["Config"]["Labels"]["com.docker.compose.project"]
 
 
 def service_name(container_name):
@@ -200,7 +344,7 @@ def service_name(container_name):
     Returns:
         The Compose service name associated with the named container.
     """
-    return docker_client().api.inspect_container(container_name)["Config"]["Labels"]["com.docker.compose.service"]
+    return inspect_container(container_name)["Config"]["Labels"]["com.docker.compose.service"]
 
 
 def service_instance(container_name):
@@ -213,9 +357,7 @@ def service_instance(container_name):
     Returns:
         The Compose service instance (i.e. container number) associated with the named container.
     """
-    return int(
-        docker_client().api.inspect_container(container_name)["Config"]["Labels"]["com.docker.compose.container-number"]
-    )
+    return int(inspect_container(container_name)["Config"]["Labels"]["com.docker.compose.container-number"])
 
 
 def container_name(project_name, service_name, service_instance=1):
@@ -248,7 +390,7 @@ def base_image(container, tag=0):
     """
     return [image for image in
                 container.client.images.get(
-                    container.client.api.inspect_container(container.name)['Config']['Image']
+                    inspect_container(container.name)['Config']['Image']
                 ).history()
             if '<missing>' not in image['Id']][-1]['Tags'][tag]
 
@@ -263,7 +405,7 @@ def container_hostname(container):
     Returns:
         The hostname for the specified container.
     """
-    return docker_client().api.inspect_container(container.name)['Config']['Hostname']
+    return inspect_container(container.name)['Config']['Hostname']
 
 
 def container_ip(container, network_name=None):
@@ -277,7 +419,7 @@ def container_ip(container, network_name=None):
     Returns:
         The IP address for the specified container.
     """
-    return (docker_client().api.inspect_container(container.name)
+    return (inspect_container(container.name)
         ['NetworkSettings']
         ['Networks']
         [network_name or '_'.join([project_name(container.name), 'default'])]
@@ -392,6 +534,6 @@ def project_hostnames(docker_client, compose_project):
     compose_project -- compose.Project from which hostnames will be derived
     """
     return {
-        c.name : container_hostname(docker_client.containers.get(c.name))
+        c.name : container_hostname(c)
         for c in compose_project.containers()
     }
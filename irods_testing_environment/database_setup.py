@@ -1,9 +1,12 @@
 # grown-up modules
+import collections
 import docker
 import logging
+import re
 import time
 
 # local modules
+from . import archive
 from . import context
 from . import execute
 
@@ -23,11 +26,63 @@ def database_server_port(database_image):
         raise NotImplementedError('database not supported [{}]'.format(database_image))
 
 
+statement_result = collections.namedtuple('statement_result', ['description', 'succeeded', 'message'])
+
+
+class sql_batch(object):
+    """A script of SQL statements to run in a single database client session.
+
+    Every statement is described so that errors reported by the client, which refer to lines of the
+    script, can be traced back to the statement which caused them.
+    """
+    def __init__(self):
+        self.statements = list()
+
+    def add(self, description, sql):
+        """Add a statement to the end of the script.
+
+        Arguments:
+        description -- what the statement does, for reporting its result
+        sql -- the statement (or client meta-command), which may span several lines
+        """
+        self.statements.append((description, sql.strip()))
+
+    def script(self):
+        """Return the script which runs every statement in order."""
+        return '\n'.join(sql for _, sql in self.statements) + '\n'
+
+    def results(self, output, error_pattern):
+        """Return a statement_result for each statement given the output of running the script.
+
+        Arguments:
+        output -- combined stdout and stderr of the client which ran the script
+        error_pattern -- regular expression matching an error line in `output`, with named groups
+                         'line' (the line of the script) and 'message'
+        """
+        errors = dict()
+        for m in re.finditer(error_pattern, output, re.MULTILINE):
+            errors.setdefault(int(m.group('line')), m.group('message').strip())
+
+        results = list()
+        first_line = 1
+        for description, sql in self.statements:
+            last_line = first_line + sql.count('\n')
+            messages = [errors.pop(l) for l in range(first_line, last_line + 1) if l in errors]
+            results.append(statement_result(description, not messages, '; '.join(messages)))
+            first_line = last_line + 1
+
+        return results
+
+
 class database_setup_strategy(object):
     """'Base class' for strategies for database setup.
 
     This class should not be instantiated directly.
     """
+    # Regular expression matching the errors printed by the client for a statement in a script run
+    # by `execute_batch`, with named groups 'line' and 'message'.
+    batch_error_pattern = None
+
     def create_database(self, name, force_recreate=False):
         """Create a database.
 
@@ -89,9 +144,156 @@ class database_setup_strategy(object):
         """
         raise NotImplementedError('method not implemented for database strategy')
 
+    def dump_database(self, name, path):
+        """Dump the contents of the database called `name` to a file in the database container.
+
+        This method must be overridden by strategies which keep templates in files (see `template_path`).
+
+        Arguments:
+        name -- name of the database to dump
+        path -- path in the database container to the file which will hold the dump
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def restore_database(self, name, path):
+        """Replace the contents of the database called `name` with a dump made by `dump_database`.
+
+        Nothing should be connected to the database while it is being restored.
+
+        This method must be overridden by strategies which keep templates in files (see `template_path`).
+
+        Arguments:
+        name -- name of the database to restore
+        path -- path in the database container to the file holding the dump
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def readiness_command(self):
+        """Return a (command, user) tuple which succeeds in the database container once it accepts connections.
+
+        This method must be overridden.
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def template_path(self, template):
+        """Return the path in the database container to the file holding `template`, or None.
+
+        Templates which are kept in the database server rather than in a file return None.
+
+        Arguments:
+        template -- name of the template
+        """
+        return None
+
+    def template_exists(self, template):
+        """Return True if a template called `template` has been saved.
+
+        This method must be overridden.
+
+        Arguments:
+        template -- name of the template
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def save_template(self, name, template):
+        """Save the contents of the database called `name` as a template called `template`.
+
+        Nothing should be connected to the database while the template is being saved.
+
+        This method must be overridden.
+
+        Arguments:
+        name -- name of the database to save
+        template -- name of the template
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def clone_template(self, template, name, owner):
+        """Replace the database called `name` with a clone of the template called `template`.
+
+        Nothing should be connected to the database while it is being replaced.
+
+        This method must be overridden.
+
+        Arguments:
+        template -- name of the template saved by `save_template`
+        name -- name of the database to replace
+        owner -- name of the user owning the database
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def batch_command(self, path):
+        """Return a (command, user) tuple which runs the SQL script at `path` in one client session.
+
+        The client must carry on past failed statements so that every statement gets a result.
+
+        This method must be overridden.
+
+        Arguments:
+        path -- path in the database container to the script
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def provisioning_batch(self, database, username, password, force_recreate=False):
+        """Return an sql_batch which idempotently creates the database and user and grants privileges.
+
+        This method must be overridden.
+
+        Arguments:
+        database -- name of the database to create
+        username -- name of the user to create
+        password -- password for the new user
+        force_recreate -- if True, drops any database and user by the specified names before creating
+        """
+        raise NotImplementedError('method not implemented for database strategy')
+
+    def execute_batch(self, batch, path='/tmp/irods_testing_environment_batch.sql'):
+        """Run the statements in `batch` in a single client session and return a statement_result for each.
+
+        The script is removed once it has run, because it may hold passwords.
+
+        Arguments:
+        batch -- sql_batch to run
+        path -- path in the database container to which the script is written
+        """
+        archive.write_file_to_container(self.container, path, batch.script().encode('utf-8'))
+
+        command, user = self.batch_command(path)
+
+        logging.debug('executing batch of [{}] statements on [{}] [{}]'
+                      .format(len(batch.statements), self.container.name, command))
+
+        try:
+            ec, output = execute.get_command_output(self.container, command, user=user, stderr=True)
+
+        finally:
+            if execute.execute_command(self.container, 'rm -f {}'.format(path), stream_output=False) != 0:
+                logging.warning('[{}] failed to remove batch script [{}]'.format(self.container.name, path))
+
+        output = output.decode('utf-8')
+
+        logging.debug(output)
+
+        results = batch.results(output, self.batch_error_pattern)
+
+        for r in results:
+            if r.succeeded:
+                logging.debug('[{}] succeeded [{}]'.format(self.container.name, r.description))
+            else:
+                logging.error('[{}] failed [{}]: [{}]'.format(self.container.name, r.description, r.message))
+
+        # An error which cannot be traced to a statement means the script did not run at all.
+        if ec != 0 and all(r.succeeded for r in results):
+            raise RuntimeError('[{}] failed to run batch, ec=[{}]: [{}]'
+                               .format(self.container.name, ec, output.strip()))
+
+        return results
+
 
 class postgres_database_setup_strategy(database_setup_strategy):
     """Database setup strategy for postgres"""
+    batch_error_pattern = r'^psql:[^:]+:(?P<line>\d+): (?P<message>(ERROR|FATAL):.*)$'
+
     def __init__(self, container=None, root_password=None, port=None):
         """Construct a postgres_database_setup_strategy.
 
@@ -198,9 +400,101 @@ class postgres_database_setup_strategy(database_setup_strategy):
         """List databases."""
         return self.execute_psql_command('\l')
 
+    def readiness_command(self):
+        """Return a (command, user) tuple which succeeds once postgres accepts connections."""
+        return 'pg_isready --host 127.0.0.1 --port {0}'.format(self.port), 'postgres'
+
+    def batch_command(self, path):
+        """Return a (command, user) tuple which runs the SQL script at `path` with psql."""
+        return 'psql --port {0} --no-psqlrc --file {1}'.format(self.port, path), 'postgres'
+
+    def template_exists(self, template):
+        """Return True if a template database called `template` exists.
+
+        Arguments:
+        template -- name of the template database
+        """
+        return self.database_exists(template)
+
+    def _terminate_connections(self, batch, name):
+        batch.add('disconnect clients from [{}]'.format(name),
+                  'select pg_terminate_backend(pid) from pg_stat_activity '
+                  'where datname = \'{}\' and pid <> pg_backend_pid();'.format(name))
+
+    def save_template(self, name, template):
+        """Copy the database called `name` to a template database called `template`.
+
+        Arguments:
+        name -- name of the database to save
+        template -- name of the template database
+        """
+        batch = sql_batch()
+        self._terminate_connections(batch, name)
+        batch.add('drop template [{}]'.format(template),
+                  'drop database if exists "{}";'.format(template))
+        batch.add('create template [{}] from [{}]'.format(template, name),
+                  'create database "{0}" template "{1}";'.format(template, name))
+
+        return 0 if all(r.succeeded for r in self.execute_batch(batch)) else 1
+
+    def clone_template(self, template, name, owner):
+        """Replace the database called `name` with a copy of the template database `template`.
+
+        The copy is made by the server from the template's files, which is far quicker than
+        restoring a dump or populating the database again.
+
+        Arguments:
+        template -- name of the template database
+        name -- name of the database to replace
+        owner -- name of the user owning the database
+        """
+        batch = sql_batch()
+        self._terminate_connections(batch, name)
+        batch.add('drop database [{}]'.format(name),
+                  'drop database if exists "{}";'.format(name))
+        batch.add('clone [{}] from [{}]'.format(name, template),
+                  'create database "{0}" template "{1}" owner {2};'.format(name, template, owner))
+
+        return 0 if all(r.succeeded for r in self.execute_batch(batch)) else 1
+
+    def provisioning_batch(self, database, username, password, force_recreate=False):
+        """Return an sql_batch which idempotently creates the database and user and grants privileges.
+
+        Arguments:
+        database -- name of the database to create
+        username -- name of the user to create
+        password -- password for the new user
+        force_recreate -- if True, drops any database and user by the specified names before creating
+        """
+        batch = sql_batch()
+
+        if force_recreate:
+            batch.add('drop database [{}]'.format(database),
+                      'drop database if exists "{}";'.format(database))
+            batch.add('drop user [{}]'.format(username),
+                      'drop user if exists {};'.format(username))
+
+        # create database cannot run inside a function or DO block, so it is generated by a query
+        # which only returns a row when the database does not exist.
+        batch.add('create database [{}]'.format(database),
+                  'select \'create database "{0}"\' where not exists '
+                  '(select from pg_database where datname = \'{0}\')\\gexec'.format(database))
+        batch.add('create user [{}]'.format(username),
+                  'do $$ begin if not exists (select from pg_roles where rolname = \'{0}\') then '
+                  'create user {0} with password \'{1}\'; end if; end $$;'.format(username, password))
+        batch.add('grant privileges on [{}] to [{}]'.format(database, username),
+                  'grant all privileges on database "{0}" to {1};'.format(database, username))
+        batch.add('make [{}] owner of [{}]'.format(username, database),
+                  'alter database "{0}" owner to {1};'.format(database, username))
+        batch.add('list databases', '\\l')
+
+        return batch
+
 
 class mysql_database_setup_strategy(database_setup_strategy):
     """Database setup strategy for mysql"""
+    batch_error_pattern = r'^(?P<message>ERROR \d+ \(\w+\) at line (?P<line>\d+).*)$'
+
     def __init__(self, container=None, root_password=None, port=None, db_exec=None):
         """Construct a mysql_database_setup_strategy.
 
@@ -214,6 +508,8 @@ class mysql_database_setup_strategy(database_setup_strategy):
         self.root_password = root_password if root_password else 'testpassword'
         self.port = port if port else 3306
         self.db_exec = db_exec if db_exec else 'mysql'
+        self.dump_exec = 'mariadb-dump' if self.db_exec == 'mariadb' else 'mysqldump'
+        self.admin_exec = 'mariadb-admin' if self.db_exec == 'mariadb' else 'mysqladmin'
         # TODO: 'irods'@'%' is generated by the docker entrypoint for mysql container...
         # should be 'irods'@'localhost', but that doesn't work right now
         self.host = '%'
@@ -330,6 +626,110 @@ class mysql_database_setup_strategy(database_setup_strategy):
         """List databases."""
         return self.execute_mysql_command('SHOW DATABASES;')
 
+    def dump_database(self, name, path):
+        """Dump the contents of the database called `name` to a file in the database container.
+
+        Arguments:
+        name -- name of the database to dump
+        path -- path in the database container to the file which will hold the dump
+        """
+        return execute.execute_command(self.container,
+            'bash -c \'{0} --host 127.0.0.1 --port {1} --user root --password={2} '
+            '--add-drop-database --databases {3} > {4}\''
+            .format(self.dump_exec, self.port, self.root_password, name, path))
+
+    def restore_database(self, name, path):
+        """Replace the contents of the database called `name` with a dump made by `dump_database`.
+
+        The dump drops and recreates the database, so `name` is only used for logging.
+
+        Arguments:
+        name -- name of the database to restore
+        path -- path in the database container to the file holding the dump
+        """
+        logging.debug('restoring database [{}] from [{}]'.format(name, path))
+
+        return execute.execute_command(self.container,
+            'bash -c \'{0} --host 127.0.0.1 --port {1} --user root --password={2} < {3}\''
+            .format(self.db_exec, self.port, self.root_password, path))
+
+    def readiness_command(self):
+        """Return a (command, user) tuple which succeeds once the server accepts connections."""
+        return ('{0} ping --host 127.0.0.1 --port {1} --user root --password={2}'
+                .format(self.admin_exec, self.port, self.root_password), '')
+
+    def template_path(self, template):
+        """Return the path in the database container to the dump holding `template`.
+
+        Arguments:
+        template -- name of the template
+        """
+        return '/var/tmp/{}.sql'.format(template)
+
+    def template_exists(self, template):
+        """Return True if the dump holding `template` exists in the database container.
+
+        Arguments:
+        template -- name of the template
+        """
+        return execute.execute_command(self.container, 'test -f {}'.format(self.template_path(template))) == 0
+
+    def save_template(self, name, template):
+        """Dump the database called `name` to the file holding `template`.
+
+        Arguments:
+        name -- name of the database to save
+        template -- name of the template
+        """
+        return self.dump_database(name, self.template_path(template))
+
+    def clone_template(self, template, name, owner):
+        """Replace the database called `name` with the contents of the dump holding `template`.
+
+        The privileges of `owner` are granted on the database by name, so they survive the database
+        being dropped and recreated by the dump.
+
+        Arguments:
+        template -- name of the template
+        name -- name of the database to replace
+        owner -- name of the user owning the database
+        """
+        return self.restore_database(name, self.template_path(template))
+
+    def batch_command(self, path):
+        """Return a (command, user) tuple which runs the SQL script at `path` with the mysql client."""
+        return ('bash -c \'{0} --host 127.0.0.1 --port {1} --user root --password={2} --force --table < {3}\''
+                .format(self.db_exec, self.port, self.root_password, path), '')
+
+    def provisioning_batch(self, database, username, password, force_recreate=False):
+        """Return an sql_batch which idempotently creates the database and user and grants privileges.
+
+        Arguments:
+        database -- name of the database to create
+        username -- name of the user to create
+        password -- password for the new user
+        force_recreate -- if True, drops any database and user by the specified names before creating
+        """
+        user = '\'{}\'@\'{}\''.format(username, self.host)
+
+        batch = sql_batch()
+
+        if force_recreate:
+            batch.add('drop database [{}]'.format(database),
+                      'DROP DATABASE IF EXISTS {};'.format(database))
+            batch.add('drop user [{}]'.format(user),
+                      'DROP USER IF EXISTS {};'.format(user))
+
+        batch.add('create database [{}]'.format(database),
+                  'CREATE DATABASE IF NOT EXISTS {};'.format(database))
+        batch.add('create user [{}]'.format(user),
+                  'CREATE USER IF NOT EXISTS {} IDENTIFIED BY \'{}\';'.format(user, password))
+        batch.add('grant privileges on [{}] to [{}]'.format(database, user),
+                  'GRANT ALL ON {}.* to {};'.format(database, user))
+        batch.add('list databases', 'SHOW DATABASES;')
+
+        return batch
+
 
 class mariadb_database_setup_strategy(mysql_database_setup_strategy):
     """Database setup strategy for mariadb"""
@@ -374,7 +774,8 @@ def setup_catalog(ctx,
                   database_name='ICAT',
                   database_user='irods',
                   database_password='testpassword',
-                  root_password=None):
+                  root_password=None,
+                  batched=True):
     """Set up the iRODS catalog on the specified database service.
 
     Arguments:
@@ -386,6 +787,8 @@ def setup_catalog(ctx,
     database_password -- password for the iRODS database user (for testing this should be
                          'testpassword')
     root_password -- password for the root database user
+    batched -- if True, every statement is run in a single database client session rather than
+               one docker exec per statement
     """
     db_container = ctx.docker_client.containers.get(
         context.irods_catalog_database_container(ctx.compose_project.name, service_instance))
@@ -394,6 +797,16 @@ def setup_catalog(ctx,
 
     strat = make_strategy(ctx.database(), db_container, database_port, root_password)
 
+    if batched:
+        batch = strat.provisioning_batch(database_name, database_user, database_password, force_recreate)
+
+        failed = [r.description for r in strat.execute_batch(batch) if not r.succeeded]
+        if failed:
+            raise RuntimeError('failed to set up catalog [{}]: [{}]'
+                               .format(db_container.name, ', '.join(failed)))
+
+        return
+
     ec = strat.create_database(database_name, force_recreate)
     if ec != 0:
         raise RuntimeError('failed to create database [{}]'.format(database_name))
@@ -408,23 +821,20 @@ def setup_catalog(ctx,
 
     strat.list_databases()
 
-def wait_for_database_service(ctx,
-                              database_service_instance=1,
-                              seconds_between_retries=1,
-                              retry_count=60):
-    """Attempt to connect to the database service, looping until successful.
+def readiness_probes(ctx, database_service_instance=1):
+    """Return the readiness probes for a catalog database service, cheapest first.
+
+    The port is first tried from the host (falling back to trying it from the catalog provider if
+    the host cannot reach the container network), then the container's healthcheck is consulted,
+    and finally the database server itself is asked whether it accepts connections.
 
     Arguments:
     ctx -- context object which contains information about the Docker environment
     database_service_instance -- the service instance number of the container running the
                                  database server
-    seconds_between_retries -- seconds to sleep between retries to connect
-    retry_count -- number of times to retry (note: must be a non-negative integer)
     """
     from . import container_info
-
-    if retry_count < 0:
-        raise ValueError('retry_count must be a non-negative integer')
+    from . import readiness
 
     irods_container = ctx.docker_client.containers.get(
         context.irods_catalog_provider_container(ctx.compose_project.name))
@@ -434,26 +844,48 @@ def wait_for_database_service(ctx,
     db_address = context.container_ip(db_container, ctx.compose_project.name + '_default')
     db_port = database_server_port(ctx.database())
 
-    logging.info(f'waiting for catalog to be ready [{db_container.name}]')
+    command, user = make_strategy(ctx.database(), db_container).readiness_command()
+
+    return [
+        readiness.tcp_probe(db_address, db_port,
+                            fallback=readiness.container_tcp_probe(irods_container,
+                                                                   db_address,
+                                                                   db_port,
+                                                                   container_info.python(irods_container))),
+        readiness.healthcheck_probe(db_container),
+        readiness.command_probe(db_container, command, user)
+    ]
+
 
-    retries = -1
-    while retries < retry_count:
-        logging.debug(
-            f'[{irods_container.name}] trying database on [{db_container.name}] ip:[{db_address}] port:[{db_port}]')
+def wait_for_database_services(ctx, database_service_instances, timeout=60):
+    """Wait concurrently until each of the specified database services accepts connections.
 
-        socket_cmd = str('import socket; '
-            's = socket.socket(socket.AF_INET, socket.SOCK_STREAM); '
-            f'ec = s.connect_ex((\'{db_address}\', {db_port})); '
-            's.close(); print(ec); exit(ec)'
-        )
+    Arguments:
+    ctx -- context object which contains information about the Docker environment
+    database_service_instances -- the service instance numbers of the containers running the
+                                  database servers
+    timeout -- seconds to wait for each database service before raising a RuntimeError
+    """
+    from . import async_executor
+    from . import readiness
+
+    probes_by_description = {
+        context.irods_catalog_database_container(ctx.compose_project.name, i): readiness_probes(ctx, i)
+        for i in database_service_instances
+    }
+
+    logging.info('waiting for catalogs to be ready [{}]'.format(list(probes_by_description)))
+
+    async_executor.run(readiness.wait_for_all_async(probes_by_description, timeout))
 
-        cmd = ' '.join([container_info.python(irods_container), '-c', f'"{socket_cmd}"'])
-        if execute.execute_command(irods_container, cmd) == 0:
-            logging.debug(
-                f'[{irods_container.name}] database service ready on [{db_container.name}]')
-            return
 
-        retries = retries + 1
-        time.sleep(seconds_between_retries)
+def wait_for_database_service(ctx, database_service_instance=1, timeout=60):
+    """Wait until the database service accepts connections.
 
-    raise RuntimeError(f'maximum retries reached attempting to connect to database [{db_container.name}]')
+    Arguments:
+    ctx -- context object which contains information about the Docker environment
+    database_service_instance -- the service instance number of the container running the
+                                 database server
+    timeout -- seconds to wait before raising a RuntimeError
+    """
+    wait_for_database_services(ctx, [database_service_instance], timeout)
@@ -0,0 +1,305 @@
+"""Long-lived shell sessions in containers for running many small commands cheaply.
+
+Every call to `execute.execute_command` normally costs an exec_create, exec_start, and exec_inspect
+round trip with the Docker daemon. Setup code sends dozens of tiny commands per container, so this
+module keeps one `sh` process per (container, user, workdir) running and feeds commands to its
+stdin. Each command is followed by a unique marker line carrying its exit code so that output and
+exit codes can be framed on the way back.
+
+Sessions are disabled by default. Use `enable()` (or `--use-exec-sessions` on the command line) to
+turn them on. Whenever a session cannot be used - it cannot be started, another thread is using it,
+or the command could not be delivered - the caller falls back to a plain `docker exec`.
+"""
+
+# grown-up modules
+import atexit
+import logging
+import re
+import shlex
+import threading
+import uuid
+
+import compose.project
+from docker.utils import socket as docker_socket
+
+OUTPUT_ENCODING = 'utf-8'
+
+# Frame headers in the multiplexed stream identify stdout (1) and stderr (2). Anything else is noise.
+STDOUT = 1
+STDERR = 2
+
+enabled = False
+
+_sessions = dict()
+_sessions_lock = threading.Lock()
+
+
+def enable(value=True):
+    """Enable (or disable, if `value` is False) the use of exec sessions by `execute.execute_command`."""
+    global enabled
+    enabled = bool(value)
+
+    if not enabled:
+        close_all()
+
+
+class exec_session(object):
+    """A long-lived `sh` process in a container which runs commands sent to its stdin."""
+
+    def __init__(self, container, user='', workdir=None):
+        """Construct an exec_session. The shell is not started until `open` is called.
+
+        Arguments:
+        container -- docker.Container in which the shell will run
+        user -- the user whose identity the shell assumes (default: root)
+        workdir -- the working directory of the shell (default: root directory)
+        """
+        self.container = container
+        self.user = user
+        self.workdir = workdir
+        self.exec_id = None
+        self.sock = None
+        self.lock = threading.Lock()
+
+
+    def __str__(self):
+        """Return a string identifying the container, user, and workdir of this session."""
+        return f'[{self.container.name}] user:[{self.user}] workdir:[{self.workdir}]'
+
+
+    def is_open(self):
+        """Return True if the shell has been started and has not been closed."""
+        return self.sock is not None
+
+
+    def open(self):
+        """Start the shell process in the container and attach to its stdin and output."""
+        api = self.container.client.api
+
+        self.exec_id = api.exec_create(self.container.id,
+                                       ['/bin/sh'],
+                                       stdin=True,
+                                       tty=False,
+                                       user=self.user,
+                                       workdir=self.workdir)['Id']
+        self.sock = api.exec_start(self.exec_id, socket=True)
+
+        # Commands such as test runs can take hours, so the client's request timeout cannot apply here.
+        self._raw_socket().settimeout(None)
+
+        logging.debug(f'opened exec session {self}')
+
+
+    def close(self):
+        """Close the connection to the shell, which causes the shell to exit."""
+        if self.sock is None:
+            return
+
+        try:
+            self.sock.close()
+
+        except OSError as e:
+            logging.debug(f'error while closing exec session {self}: {e}')
+
+        finally:
+            self.sock = None
+            self.exec_id = None
+
+        logging.debug(f'closed exec session {self}')
+
+
+    def _raw_socket(self):
+        # docker-py hands back a SocketIO (or an SSL socket wrapper) - writes need the underlying socket.
+        return getattr(self.sock, '_sock', self.sock)
+
+
+    def _send(self, data):
+        self._raw_socket().sendall(data.encode(OUTPUT_ENCODING))
+
+
+    def _read_frame(self):
+        stream, size = docker_socket.next_frame_header(self.sock)
+        if stream < 0:
+            return None, None
+
+        return stream, docker_socket.read_exact(self.sock, size)
+
+
+    def run(self, command, stream_output=False):
+        """Run `command` in the shell and return a tuple of (exit code, output).
+
+        `command` is split exactly as `docker exec` would split it and is run in a subshell with
+        stdin closed and stderr merged into stdout, so it behaves as it would in its own exec.
+
+        Raises ConnectionError if `command` could not be delivered to the shell, in which case the
+        command has not been run. Raises RuntimeError if the shell went away while `command` was
+        running, in which case it is unknown whether the command completed.
+
+        Arguments:
+        command -- string representing the command to run
+        stream_output -- if True, output is sent to the logging module as it arrives
+        """
+        marker = f'__irods_testing_environment_exec_{uuid.uuid4().hex}__'
+        marker_bytes = marker.encode(OUTPUT_ENCODING)
+        marker_pattern = re.compile(b'\n' + re.escape(marker_bytes) + b' (\\d+)\n')
+
+        line = "( {} ) </dev/null 2>&1; printf '\\n%s %d\\n' {} $?\n".format(
+            shlex.join(shlex.split(command)), marker)
+
+        try:
+            self._send(line)
+
+        except OSError as e:
+            raise ConnectionError(f'failed to send command to exec session {self}') from e
+
+        output = b''
+        # Hold back enough bytes to never stream out a partial marker line.
+        streamed = 0
+        holdback = len(marker_bytes) + 16
+
+        while True:
+            try:
+                stream, payload = self._read_frame()
+
+            except OSError as e:
+                raise RuntimeError(f'exec session {self} failed while running command [{command}]') from e
+
+            if payload is None:
+                raise RuntimeError(f'exec session {self} exited while running command [{command}]')
+
+            if stream not in (STDOUT, STDERR):
+                continue
+
+            output += payload
+
+            match = marker_pattern.search(output)
+            if match:
+                ec = int(match.group(1))
+                output = output[:match.start()]
+
+                if stream_output and streamed < len(output):
+                    logging.error(output[streamed:].decode(OUTPUT_ENCODING, errors='replace'))
+
+                return ec, output.decode(OUTPUT_ENCODING, errors='replace')
+
+            if stream_output and len(output) - holdback > streamed:
+                logging.error(output[streamed:len(output) - holdback].decode(OUTPUT_ENCODING, errors='replace'))
+                streamed = len(output) - holdback
+
+
+def _session_key(container, user, workdir):
+    return (container.id, user or '', workdir or '')
+
+
+def get_session(container, user='', workdir=None):
+    """Return the open exec_session for `container`, `user`, and `workdir`, starting one if needed.
+
+    Returns None if a session could not be started.
+
+    Arguments:
+    container -- docker.Container in which the session runs
+    user -- the user whose identity the session assumes (default: root)
+    workdir -- the working directory of the session (default: root directory)
+    """
+    key = _session_key(container, user, workdir)
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = exec_session(container, user, workdir)
+
+    with session.lock:
+        if not session.is_open():
+            try:
+                session.open()
+
+            except Exception as e:
+                logging.debug(f'failed to open exec session {session}: {e}')
+                return None
+
+    return session
+
+
+def execute_command(container, command, user='', workdir=None, stream_output=False):
+    """Run `command` in a session in `container` and return its exit code.
+
+    Returns None if the command could not be run in a session, in which case the command has not
+    been run and the caller should fall back to a plain exec.
+
+    Arguments:
+    container -- container in which the command will be run
+    command -- string representing the command to run
+    user -- the user whose identity will be assumed when running the command (default: root)
+    workdir -- the present working directory for the command (default: root directory)
+    stream_output -- if True, output is sent to the logging module as it arrives
+    """
+    session = get_session(container, user, workdir)
+    if session is None:
+        return None
+
+    # A session runs one command at a time. Rather than wait for a busy session, use a plain exec.
+    if not session.lock.acquire(blocking=False):
+        return None
+
+    try:
+        if not session.is_open():
+            return None
+
+        ec, output = session.run(command, stream_output=stream_output)
+
+    except ConnectionError as e:
+        logging.debug(e)
+        session.close()
+        return None
+
+    except RuntimeError:
+        session.close()
+        raise
+
+    finally:
+        session.lock.release()
+
+    if not stream_output:
+        logging.debug(output)
+
+    return ec
+
+
+def close_sessions_for_container(container_name):
+    """Close all sessions running in the container called `container_name`."""
+    with _sessions_lock:
+        keys = [k for k, s in _sessions.items() if s.container.name == container_name]
+        sessions = [_sessions.pop(k) for k in keys]
+
+    for s in sessions:
+        with s.lock:
+            s.close()
+
+
+def close_sessions_for_project(project_name):
+    """Close all sessions running in containers belonging to the Compose project called `project_name`."""
+    with _sessions_lock:
+        keys = [k for k, s in _sessions.items()
+                if s.container.labels.get('com.docker.compose.project') == project_name]
+        sessions = [_sessions.pop(k) for k in keys]
+
+    for s in sessions:
+        with s.lock:
+            s.close()
+
+
+def close_all():
+    """Close all open sessions."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+
+    for s in sessions:
+        with s.lock:
+            s.close()
+
+
+atexit.register(close_all)
+
+# Containers replaced by `up` or removed by `down` take their shells with them.
+compose.project.register_change_callback(close_sessions_for_project)
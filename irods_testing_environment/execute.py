@@ -6,7 +6,12 @@ import os
 
 # local modules
 from . import context
+from . import exec_session
+from . import instrumentation
+from . import tracing
 
+@tracing.traced('exec', attributes=['command', 'user', 'workdir'])
+@instrumentation.counted('exec')
 def execute_command(container, command, user='', workdir=None, stream_output=None):
     """Execute `command` in `container` as `user` in `workdir`.
 
@@ -23,6 +28,9 @@ def execute_command(container, command, user='', workdir=None, stream_output=Non
                      the user: If the log level is set to INFO or higher (INFO, DEBUG) then the
                      output will be streamed. Otherwise, the output will stream no matter what
                      if True and it will not stream no matter what if False.
+
+    If exec sessions are enabled (see `exec_session.enable`), the command is run in a long-lived
+    shell in the container instead of its own exec, falling back to a plain exec if necessary.
     """
     OUTPUT_ENCODING = 'utf-8'
 
@@ -32,6 +40,11 @@ def execute_command(container, command, user='', workdir=None, stream_output=Non
         log_level = logging.getLogger().getEffectiveLevel()
         stream_output = log_level <= logging.INFO
 
+    if exec_session.enabled:
+        ec = exec_session.execute_command(container, command, user=user, workdir=workdir, stream_output=stream_output)
+        if ec is not None:
+            return ec
+
     exec_instance = container.client.api.exec_create(container.id, command, user=user, workdir=workdir)
     exec_out = container.client.api.exec_start(exec_instance['Id'], stream=stream_output)
 
@@ -49,3 +62,26 @@ def execute_command(container, command, user='', workdir=None, stream_output=Non
         logging.debug(exec_out.decode(OUTPUT_ENCODING))
 
     return container.client.api.exec_inspect(exec_instance['Id'])['ExitCode']
+
+
+@tracing.traced('exec', attributes=['command', 'user', 'workdir'])
+@instrumentation.counted('exec')
+def get_command_output(container, command, user='', workdir=None, stderr=False):
+    """Execute `command` in `container` as `user` in `workdir` and return its exit code and output.
+
+    Unlike `execute_command`, the output is returned as it was written (as bytes) rather than
+    logged, so this always uses its own exec rather than an exec session.
+
+    Arguments:
+    container -- container in which the command will be run
+    command -- string or list of strings representing the command to run
+    user -- the user whose identity will be assumed when running the command (default: root)
+    workdir -- the present working directory for the command (default: root directory)
+    stderr -- if True, what the command writes to stderr is included in the output
+
+    Returns:
+        A tuple of the exit code and the bytes written to stdout (and stderr) by the command.
+    """
+    logging.debug('executing on [{0}] [{1}]'.format(container.name, command))
+
+    return container.exec_run(command, user=user, workdir=workdir, stderr=stderr)
@@ -0,0 +1,663 @@
+"""An in-process stand-in for the Docker daemon and Compose, for benchmarking without Docker.
+
+The stand-in implements the subset of the Docker SDK used by this package (container lookup and
+listing, inspect, exec, get_archive and put_archive) on top of an in-memory file system per
+container, and `fake_project` runs Compose projects made of such containers. Nothing runs in the
+containers: commands succeed unless a command handler says otherwise, and the few commands whose
+output or exit code the setup code relies on (file tests, copies, reading the platform tag) are
+emulated.
+
+Each operation sleeps for a time given by a `latency_model` (a fixed cost per exec, per inspect, and
+per archive transfer, plus transfer time at a given bandwidth), so that timings reflect how much
+work is sent to the daemon and how well it is spread across containers. Every call is counted in
+`fake_client.calls`, which makes regressions in the number of calls (e.g. inspecting every
+container once per container) visible without timing anything.
+
+Containers on the stand-in all have the loopback address. When a database service is brought up,
+the client listens on the database port on the loopback interface (unless something already does)
+so that readiness probes which connect from the host succeed.
+"""
+
+# grown-up modules
+import collections
+import io
+import json
+import logging
+import os
+import re
+import socket
+import subprocess
+import tarfile
+import threading
+import time
+import uuid
+
+import compose.project
+
+# local modules
+from . import context
+
+# Address of every container on the stand-in.
+CONTAINER_ADDRESS = '127.0.0.1'
+
+DATABASE_PORTS = {
+    'postgres': 5432,
+    'mysql': 3306,
+    'mariadb': 3306
+}
+
+
+class latency_model(object):
+    """Simulated costs of the operations of the Docker daemon."""
+    def __init__(self,
+                 exec_latency=0.02,
+                 api_latency=0.002,
+                 inspect_latency=0.005,
+                 archive_latency=0.01,
+                 archive_bandwidth=200 * 1024 * 1024,
+                 command_latencies=None):
+        """Construct a latency_model.
+
+        Arguments:
+        exec_latency -- seconds taken by running a command in a container
+        api_latency -- seconds taken by any other API call (e.g. creating or inspecting an exec)
+        inspect_latency -- seconds taken by inspecting a container
+        archive_latency -- seconds taken by a get_archive or put_archive call, besides the transfer
+        archive_bandwidth -- bytes per second at which archives are transferred
+        command_latencies -- list of (regular expression, seconds) pairs giving the time taken by
+                             commands matching the expression instead of `exec_latency` (the first
+                             match wins)
+        """
+        self.exec_latency = exec_latency
+        self.api_latency = api_latency
+        self.inspect_latency = inspect_latency
+        self.archive_latency = archive_latency
+        self.archive_bandwidth = archive_bandwidth
+        self.command_latencies = [(re.compile(p), s) for p, s in command_latencies or []]
+
+    def exec_time(self, command):
+        """Return the seconds taken by running `command`."""
+        for pattern, seconds in self.command_latencies:
+            if pattern.search(command):
+                return seconds
+
+        return self.exec_latency
+
+    def transfer_time(self, size):
+        """Return the seconds taken by transferring an archive of `size` bytes."""
+        return self.archive_latency + float(size) / self.archive_bandwidth
+
+
+class exec_result(collections.namedtuple('exec_result', ['exit_code', 'output'])):
+    """Result of `fake_container.exec_run`, like docker.models.containers.ExecResult."""
+
+
+class fake_image(object):
+    """Image of a fake_container."""
+    def __init__(self, name):
+        self.tags = [name]
+        self.id = 'sha256:' + uuid.uuid5(uuid.NAMESPACE_DNS, name).hex
+
+    def history(self):
+        return [{'Id': self.id, 'Tags': list(self.tags)}]
+
+
+class fake_filesystem(object):
+    """Files and directories of a fake_container, kept in memory."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = dict()
+        self.directories = {'/'}
+
+    def _make_parents(self, path):
+        parent = os.path.dirname(path)
+        while parent not in self.directories:
+            self.directories.add(parent)
+            parent = os.path.dirname(parent)
+
+    def write(self, path, contents, mode=0o644):
+        """Create or replace the file at `path` with `contents` (bytes)."""
+        path = os.path.normpath(path)
+        with self.lock:
+            self._make_parents(path)
+            self.files[path] = (contents, mode)
+
+    def make_directory(self, path):
+        """Create the directory at `path` and its parents."""
+        path = os.path.normpath(path)
+        with self.lock:
+            self._make_parents(path)
+            self.directories.add(path)
+
+    def read(self, path):
+        """Return the contents of the file at `path`, or None if there is no such file."""
+        with self.lock:
+            entry = self.files.get(os.path.normpath(path))
+        return entry[0] if entry else None
+
+    def is_file(self, path):
+        with self.lock:
+            return os.path.normpath(path) in self.files
+
+    def exists(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            return path in self.files or path in self.directories
+
+    def get_archive(self, path):
+        """Return a tar archive (bytes) of the file or directory at `path`, or None if it does not exist."""
+        path = os.path.normpath(path)
+        base = os.path.dirname(path)
+
+        buf = io.BytesIO()
+
+        with self.lock, tarfile.open(fileobj=buf, mode='w') as tf:
+            if path in self.files:
+                members = [path]
+            elif path in self.directories:
+                prefix = path.rstrip('/') + '/'
+                members = sorted([d for d in self.directories if d == path or d.startswith(prefix)] +
+                                 [f for f in self.files if f.startswith(prefix)])
+            else:
+                return None
+
+            for m in members:
+                info = tarfile.TarInfo(os.path.relpath(m, base))
+
+                if m in self.files:
+                    contents, info.mode = self.files[m]
+                    info.size = len(contents)
+                    tf.addfile(info, io.BytesIO(contents))
+                else:
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    tf.addfile(info)
+
+        return buf.getvalue()
+
+    def put_archive(self, path, data):
+        """Extract the tar archive `data` (bytes) into the directory at `path`. Returns the number of files."""
+        count = 0
+
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r|') as tf:
+            for member in tf:
+                target = os.path.normpath(os.path.join(path, member.name))
+
+                if member.isdir():
+                    self.make_directory(target)
+                elif member.isfile():
+                    self.write(target, tf.extractfile(member).read(), member.mode)
+                    count += 1
+
+        return count
+
+
+class fake_container(object):
+    """A container on the stand-in, with the interface of docker.models.containers.Container."""
+    def __init__(self, client, name, image, labels):
+        """Construct a fake_container.
+
+        Arguments:
+        client -- fake_client which owns the container
+        name -- name of the container
+        image -- name of the image of the container (repo:tag)
+        labels -- labels of the container (e.g. the Compose project and service)
+        """
+        self.client = client
+        self.name = name
+        self.id = uuid.uuid4().hex
+        self.image = fake_image(image)
+        self.labels = dict(labels)
+        self.filesystem = fake_filesystem()
+        self.state = 'running'
+
+    @property
+    def attrs(self):
+        project = self.labels.get('com.docker.compose.project')
+        return {
+            'Id': self.id,
+            'Name': '/' + self.name,
+            'Config': {
+                'Hostname': self.name,
+                'Image': self.image.tags[0],
+                'Labels': dict(self.labels)
+            },
+            'NetworkSettings': {
+                'Networks': {
+                    '{}_default'.format(project): {'IPAddress': CONTAINER_ADDRESS}
+                }
+            },
+            'State': {'Status': self.state, 'Running': self.state == 'running'}
+        }
+
+    @property
+    def status(self):
+        return self.state
+
+    def reload(self):
+        self.client._inspect()
+
+    def start(self):
+        self.client._call('start', self.client.latency.api_latency)
+        self.state = 'running'
+
+    def stop(self, timeout=None):
+        self.client._call('stop', self.client.latency.api_latency)
+        self.state = 'exited'
+
+    def restart(self, timeout=None):
+        self.client._call('restart', self.client.latency.api_latency)
+        self.state = 'running'
+
+    def exec_run(self, cmd, user='', workdir=None, stream=False, **kwargs):
+        """Run `cmd` and return an exec_result of its exit code and output."""
+        ec, output = self.client._exec(self, cmd, user, workdir)
+        return exec_result(ec, iter([output]) if stream else output)
+
+    def get_archive(self, path, chunk_size=None, **kwargs):
+        """Return a tar archive of `path` as an iterator of chunks, and a stat dict, like the Docker SDK."""
+        data = self.filesystem.get_archive(path)
+
+        if data is None:
+            self.client._call('get_archive', self.client.latency.archive_latency)
+            import docker.errors
+            raise docker.errors.NotFound('Could not find the file {} in container {}'.format(path, self.name))
+
+        self.client._call('get_archive', self.client.latency.transfer_time(len(data)), len(data))
+
+        stat = {'name': os.path.basename(os.path.normpath(path)), 'size': len(data)}
+
+        chunk_size = chunk_size or 2 * 1024 * 1024
+        return (data[i:i + chunk_size] for i in range(0, len(data), chunk_size)), stat
+
+    def put_archive(self, path, data):
+        """Extract the tar archive `data` (bytes, a file object, or an iterable of chunks) into `path`."""
+        if hasattr(data, 'read'):
+            data = data.read()
+        elif not isinstance(data, (bytes, bytearray)):
+            data = b''.join(data)
+
+        self.client._call('put_archive', self.client.latency.transfer_time(len(data)), len(data))
+
+        self.filesystem.put_archive(path, bytes(data))
+
+        return True
+
+
+class fake_api(object):
+    """Low-level API of a fake_client, like docker.APIClient."""
+    def __init__(self, client):
+        self.client = client
+        self.execs = dict()
+        self.lock = threading.Lock()
+
+    def inspect_container(self, container):
+        return self.client.containers._find(container, count_inspect=True).attrs
+
+    def exec_create(self, container, cmd, user='', workdir=None, **kwargs):
+        self.client._call('exec_create', self.client.latency.api_latency)
+
+        c = self.client.containers._find(container)
+        exec_id = uuid.uuid4().hex
+
+        with self.lock:
+            self.execs[exec_id] = {'container': c, 'cmd': cmd, 'user': user, 'workdir': workdir,
+                                   'ExitCode': None}
+
+        return {'Id': exec_id}
+
+    def exec_start(self, exec_id, stream=False, **kwargs):
+        with self.lock:
+            e = self.execs[exec_id]
+
+        ec, output = self.client._exec(e['container'], e['cmd'], e['user'], e['workdir'])
+        e['ExitCode'] = ec
+
+        if stream:
+            return iter([output] if output else [])
+
+        return output
+
+    def exec_inspect(self, exec_id):
+        self.client._call('exec_inspect', self.client.latency.api_latency)
+
+        with self.lock:
+            e = self.execs[exec_id]
+
+        return {'ExitCode': e['ExitCode'], 'Running': False}
+
+
+class fake_container_collection(object):
+    """Containers of a fake_client, like docker.models.containers.ContainerCollection."""
+    def __init__(self, client):
+        self.client = client
+        self.lock = threading.Lock()
+        self.by_name = dict()
+
+    def _find(self, name_or_id, count_inspect=False):
+        if count_inspect:
+            self.client._inspect()
+
+        with self.lock:
+            c = self.by_name.get(name_or_id)
+            if c is None:
+                c = next((c for c in self.by_name.values() if c.id == name_or_id), None)
+
+        if c is None:
+            import docker.errors
+            raise docker.errors.NotFound('No such container: {}'.format(name_or_id))
+
+        return c
+
+    def get(self, container_id):
+        """Return the container with the given name or ID (this inspects it, as the Docker SDK does)."""
+        return self._find(container_id, count_inspect=True)
+
+    def list(self, all=False, filters=None, **kwargs):
+        """Return the containers matching the label filters.
+
+        As with the Docker SDK, listing is one API call plus an inspect of each container listed.
+        """
+        labels = (filters or dict()).get('label', [])
+        if isinstance(labels, str):
+            labels = [labels]
+
+        wanted = [tuple(l.split('=', 1)) for l in labels]
+
+        with self.lock:
+            containers = [c for c in self.by_name.values()
+                          if (all or c.state == 'running')
+                          and _labels_match(c.labels, wanted)]
+
+        self.client._call('list', self.client.latency.api_latency)
+        for _ in containers:
+            self.client._inspect()
+
+        return sorted(containers, key=lambda c: c.name)
+
+    def create(self, name, image, labels):
+        with self.lock:
+            c = self.by_name[name] = fake_container(self.client, name, image, labels)
+        return c
+
+    def remove(self, name):
+        with self.lock:
+            self.by_name.pop(name, None)
+
+
+def _labels_match(labels, wanted):
+    # Each wanted label is (key,) to match any value or (key, value) to match the value.
+    return all(kv[0] in labels and (len(kv) == 1 or labels[kv[0]] == kv[1]) for kv in wanted)
+
+
+class fake_image_collection(object):
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, name):
+        self.client._call('image_inspect', self.client.latency.api_latency)
+        return fake_image(name)
+
+
+class fake_client(object):
+    """A stand-in for docker.DockerClient whose containers live in this process."""
+    def __init__(self, latency=None, platform_image_tag='ubuntu:22.04'):
+        """Construct a fake_client.
+
+        Arguments:
+        latency -- latency_model for the simulated operations (default: latency_model())
+        platform_image_tag -- tag reported by the iRODS containers as their platform (BASE_IMAGE_TAG)
+        """
+        self.latency = latency or latency_model()
+        self.platform_image_tag = platform_image_tag
+
+        self.api = fake_api(self)
+        self.containers = fake_container_collection(self)
+        self.images = fake_image_collection(self)
+
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        self.bytes_transferred = 0
+        self.execs_in_flight = 0
+        self.max_execs_in_flight = 0
+
+        self.command_handlers = list()
+        self.add_command_handler(r'echo \$\{BASE_IMAGE_TAG\}',
+                                 lambda c, m: (0, (self.platform_image_tag + '\n').encode()))
+        self.add_command_handler(r'\[\[? -f ([^\s\]"\']+) \]\]?',
+                                 lambda c, m: (0 if c.filesystem.is_file(m.group(1)) else 1, b''))
+        self.add_command_handler(r'^cp ([^\s]+) ([^\s]+)$', _copy_file)
+        self.add_command_handler(r'^cat ([^\s]+)$', _cat_file)
+
+        self.listeners = dict()
+
+    def add_command_handler(self, pattern, handler):
+        """Emulate commands matching `pattern`.
+
+        Handlers are tried in the order they were added, and the first whose pattern matches is used.
+        Commands which no handler matches succeed with no output.
+
+        Arguments:
+        pattern -- regular expression searched for in the command
+        handler -- callable taking the fake_container and the match which returns (exit code, output bytes)
+        """
+        self.command_handlers.append((re.compile(pattern), handler))
+
+    def _call(self, name, seconds, size=0):
+        with self.lock:
+            self.calls[name] += 1
+            self.bytes_transferred += size
+
+        if seconds:
+            time.sleep(seconds)
+
+    def _inspect(self):
+        self._call('inspect', self.latency.inspect_latency)
+
+    def _exec(self, container, cmd, user, workdir):
+        command = cmd if isinstance(cmd, str) else ' '.join(cmd)
+
+        with self.lock:
+            self.execs_in_flight += 1
+            self.max_execs_in_flight = max(self.max_execs_in_flight, self.execs_in_flight)
+
+        try:
+            self._call('exec', self.latency.exec_time(command))
+
+        finally:
+            with self.lock:
+                self.execs_in_flight -= 1
+
+        for pattern, handler in self.command_handlers:
+            m = pattern.search(command)
+            if m:
+                return handler(container, m)
+
+        return 0, b''
+
+    def reset_counters(self):
+        """Forget the calls counted so far."""
+        with self.lock:
+            self.calls.clear()
+            self.bytes_transferred = 0
+            self.max_execs_in_flight = self.execs_in_flight
+
+    def counters(self):
+        """Return the calls counted so far as a dict, along with the bytes transferred and peak concurrent execs."""
+        with self.lock:
+            counters = dict(self.calls)
+            counters['bytes_transferred'] = self.bytes_transferred
+            counters['max_execs_in_flight'] = self.max_execs_in_flight
+
+        return counters
+
+    def ensure_listening(self, port):
+        """Accept connections on `port` of the loopback interface, unless something already does."""
+        with self.lock:
+            if port in self.listeners:
+                return
+
+            try:
+                server = socket.create_server((CONTAINER_ADDRESS, port))
+
+            except OSError as e:
+                logging.info('not listening on [{}:{}]: {}'.format(CONTAINER_ADDRESS, port, e))
+                self.listeners[port] = None
+                return
+
+            self.listeners[port] = server
+
+        def accept():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                conn.close()
+
+        threading.Thread(target=accept, name='fake_docker_listener', daemon=True).start()
+
+    def close(self):
+        """Stop listening on the ports opened by `ensure_listening`."""
+        with self.lock:
+            listeners, self.listeners = self.listeners, dict()
+
+        for server in listeners.values():
+            if server:
+                server.close()
+
+
+def _copy_file(container, match):
+    contents = container.filesystem.read(match.group(1))
+    if contents is None:
+        return 1, 'cp: cannot stat \'{}\''.format(match.group(1)).encode()
+
+    container.filesystem.write(match.group(2), contents)
+    return 0, b''
+
+
+def _cat_file(container, match):
+    contents = container.filesystem.read(match.group(1))
+    if contents is None:
+        return 1, 'cat: {}: No such file or directory'.format(match.group(1)).encode()
+
+    return 0, contents
+
+
+def irods_server_files(irods_version='4.3.4', zone_name='tempZone', log_size=64 * 1024):
+    """Return the files (a dict of paths to contents) of a container in which iRODS is set up.
+
+    Arguments:
+    irods_version -- version of iRODS reported by the version file
+    zone_name -- name of the Zone in the server configuration
+    log_size -- size in bytes of each of the server's log files
+    """
+    log = (b'x' * 127 + b'\n') * (log_size // 128)
+
+    def json_file(contents):
+        return json.dumps(contents, indent=4).encode()
+
+    irods_home = context.irods_home()
+    msiexec = os.path.join(irods_home, 'msiExecCmd_bin')
+
+    return {
+        os.path.join(irods_home, 'version.json.dist'): json_file({
+            'irods_version': irods_version,
+            'commit_id': '0' * 40
+        }),
+        context.server_config(): json_file({
+            'zone_name': zone_name,
+            'catalog_provider_hosts': [],
+            'federation': [],
+            'host_resolution': {'host_entries': []}
+        }),
+        context.service_account_irods_env(): json_file({
+            'irods_zone_name': zone_name
+        }),
+        os.path.join(msiexec, 'hello.template'): b'#!/bin/sh\necho Hello $*\n',
+        os.path.join(msiexec, 'univMSSInterface.sh.template'): b'#!/bin/sh\n',
+        os.path.join(irods_home, 'log', 'setup.log'): log,
+        os.path.join('/var', 'log', 'irods', 'irods.log'): log,
+    }
+
+
+class fake_project(compose.project.Project):
+    """A Compose project whose containers are created on a fake_client instead of by `docker compose`."""
+    def __init__(self,
+                 docker_client,
+                 project_name,
+                 database_image='postgres:14',
+                 platform_image='irods_testing_environment/ubuntu-22.04',
+                 irods_files=None):
+        """Construct a fake_project.
+
+        Arguments:
+        docker_client -- fake_client on which the containers are created
+        project_name -- name of the project
+        database_image -- image of the catalog database service
+        platform_image -- image of the iRODS services
+        irods_files -- dict of paths to contents of the files in each iRODS container when it is
+                       created (default: irods_server_files())
+        """
+        super(fake_project, self).__init__(os.getcwd(), project_name=project_name, docker_client=docker_client)
+
+        self.services = {
+            context.irods_catalog_database_service(): database_image,
+            context.irods_catalog_provider_service(): platform_image,
+            context.irods_catalog_consumer_service(): platform_image
+        }
+
+        self.irods_files = irods_server_files() if irods_files is None else irods_files
+
+    def _compose_cmd(self, args, capture_output=False):
+        client = self._docker_client
+        command = args[0]
+
+        if command == 'config':
+            config = {'name': self.name,
+                      'services': {s: {'image': i} for s, i in self.services.items()}}
+            return subprocess.CompletedProcess(args, 0, stdout=json.dumps(config), stderr='')
+
+        if command == 'up':
+            scale = dict(a.split('=') for a in args[args.index('--scale') + 1::2]) if '--scale' in args else dict()
+            for service, image in self.services.items():
+                self._scale(service, image, int(scale.get(service, 1)))
+
+        elif command == 'down':
+            for c in client.containers.list(all=True,
+                                            filters={'label': ['com.docker.compose.project=' + self.name]}):
+                client.containers.remove(c.name)
+
+        client._call('compose_' + command, client.latency.api_latency)
+
+        return subprocess.CompletedProcess(args, 0, stdout='', stderr='')
+
+    def _scale(self, service, image, count):
+        client = self._docker_client
+
+        for i in range(1, count + 1):
+            name = context.container_name(self.name, service, i)
+
+            if name in client.containers.by_name:
+                continue
+
+            c = client.containers.create(name, image, {
+                'com.docker.compose.project': self.name,
+                'com.docker.compose.service': service,
+                'com.docker.compose.container-number': str(i)
+            })
+
+            if service == context.irods_catalog_database_service():
+                port = DATABASE_PORTS.get(context.image_repo(image))
+                if port:
+                    client.ensure_listening(port)
+                continue
+
+            for path, contents in self.irods_files.items():
+                c.filesystem.write(path, contents)
+
+        # Remove containers beyond the requested scale, as `docker compose up --scale` does.
+        i = count + 1
+        while context.container_name(self.name, service, i) in client.containers.by_name:
+            client.containers.remove(context.container_name(self.name, service, i))
+            i += 1
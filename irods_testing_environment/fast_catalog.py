@@ -0,0 +1,123 @@
+"""Run catalog database services on tmpfs with durability turned off.
+
+Test catalogs are thrown away with the containers, so making every commit durable only costs time,
+and on busy hosts syncing to disk dominates the time the core test suite spends in the catalog.
+`enable` adds a Compose override file to a project which, for the catalog service only:
+
+ - mounts the database server's data directory on a tmpfs
+ - turns off the server's syncing of data to disk on commit (fsync, synchronous_commit and
+   full_page_writes for Postgres; innodb_flush_log_at_trx_commit, sync_binlog and the doublewrite
+   buffer for MySQL and MariaDB)
+
+The contents of a tmpfs are lost when the container stops, so fast catalogs cannot be saved in zone
+snapshots and do not survive restarting the database container.
+"""
+
+# grown-up modules
+import json
+import logging
+import os
+
+# local modules
+from . import context
+
+# tmpfs mount point in the catalog container under which the data directory is kept.
+TMPFS_MOUNT_POINT = '/fast_catalog'
+
+POSTGRES_DATA_DIRECTORY = os.path.join(TMPFS_MOUNT_POINT, 'pgdata')
+
+MYSQL_DATA_DIRECTORY = os.path.join('/var', 'lib', 'mysql')
+
+POSTGRES_OPTIONS = [
+    'fsync=off',
+    'synchronous_commit=off',
+    'full_page_writes=off',
+]
+
+MYSQL_OPTIONS = [
+    '--innodb-flush-log-at-trx-commit=0',
+    '--sync-binlog=0',
+    '--skip-innodb-doublewrite',
+    # Native asynchronous I/O is not available on tmpfs.
+    '--innodb-use-native-aio=0',
+]
+
+
+def _command(service_config):
+    command = service_config.get('command') or []
+    if isinstance(command, str):
+        command = command.split()
+    return list(command)
+
+
+def service_override(service_config):
+    """Return the Compose settings which make the catalog service described by `service_config` fast.
+
+    Arguments:
+    service_config -- resolved Compose configuration of the catalog service (from `docker compose config`)
+    """
+    image = service_config['image']
+    db = context.image_repo(image)
+
+    command = _command(service_config)
+
+    if 'postgres' in db:
+        # The image's data directory is a volume, so the data is kept in a directory on the tmpfs
+        # instead of mounting the tmpfs over it.
+        if not command:
+            command = ['postgres']
+
+        for option in POSTGRES_OPTIONS:
+            command.extend(['-c', option])
+
+        return {
+            'tmpfs': [TMPFS_MOUNT_POINT],
+            'environment': {'PGDATA': POSTGRES_DATA_DIRECTORY},
+            'command': command
+        }
+
+    if 'mysql' in db or 'mariadb' in db:
+        return {
+            'tmpfs': [MYSQL_DATA_DIRECTORY],
+            'command': command + MYSQL_OPTIONS
+        }
+
+    raise NotImplementedError('fast catalog not supported for database [{}]'.format(image))
+
+
+def enable(compose_project):
+    """Run the catalog service of `compose_project` as a fast catalog the next time it is brought up.
+
+    The override file is written to the host cache directory and applied by the Compose project to
+    every later command.
+
+    Arguments:
+    compose_project -- compose.Project whose catalog service is made fast
+    """
+    service = context.irods_catalog_database_service()
+
+    directory = context.host_cache_directory('compose_overrides')
+    path = os.path.join(directory, '{}.fast_catalog.yml'.format(compose_project.name))
+
+    if any(str(f) == path for f in compose_project.override_files):
+        return
+
+    # The command in the override replaces the one in the project, so it is built from the resolved
+    # configuration of the project itself, before any override is applied.
+    if compose_project.override_files:
+        raise RuntimeError('fast catalog must be enabled before other override files are added to [{}]'
+                           .format(compose_project.name))
+
+    service_config = compose_project.config()['services'][service]
+
+    override = {'services': {service: service_override(service_config)}}
+
+    os.makedirs(directory, exist_ok=True)
+
+    # JSON is YAML, so the override does not need a YAML library to write.
+    with open(path, 'w') as f:
+        json.dump(override, f, indent=4)
+
+    logging.info('using fast catalog for [{}] [{}]'.format(compose_project.name, json.dumps(override)))
+
+    compose_project.add_override_file(path)
@@ -7,6 +7,7 @@ from . import execute
 from . import irods_config
 from . import irods_setup
 from . import json_utils
+from . import tracing
 
 def make_federation_entry(ctx, local_zone, remote_zone):
     """Create an entry for the federation stanza to federate two zones together.
@@ -27,6 +28,7 @@ def make_federation_entry(ctx, local_zone, remote_zone):
     }
 
 
+@tracing.phase('federate zones')
 def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True):
     """Federate `local_zone` with each zone in `zone_info_list`.
 
@@ -51,7 +53,7 @@ def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True):
 
         container = ctx.docker_client.containers.get(c.name)
 
-        server_config = json_utils.get_json_from_file(container, context.server_config())
+        server_config = json_utils.json_file_editor(container, context.server_config())
 
         for remote_zone in zone_info_list:
             if remote_zone.zone_name == local_zone.zone_name: continue
@@ -74,7 +76,7 @@ def federate_zones(ctx, zone_info_list, local_zone, include_consumers=True):
                                        .format(container.name))
 
         # Write out the server_config.json to the iRODS server container to complete the federation
-        json_utils.put_json_to_file(container, context.server_config(), server_config)
+        server_config.commit()
 
         # Restart iRODS server in order for federation configuration to take effect.
         if irods_config.server_version_is_irods_5(container) and irods_setup.restart_irods(container) != 0:
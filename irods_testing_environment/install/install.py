@@ -3,10 +3,12 @@ import logging
 import os
 
 # local modules
-from .. import archive
+from .. import archive_cache
+from .. import async_executor
 from .. import container_info
 from .. import context
 from .. import execute
+from .. import tracing
 
 class installer(object):
     def update_command(self):
@@ -62,6 +64,7 @@ class installer(object):
         return packages
 
 
+    @tracing.traced('install', container_argument='container_name')
     def install_packages_on_container_from_tarfile(self,
                                                    ctx,
                                                    container_name,
@@ -73,14 +76,14 @@ class installer(object):
         ctx -- context object which contains a docker_client
         container_name -- name of the container on which packages are being installed
         package_paths -- full paths to where the packages will be inside the container
-        tarfile_path -- full path to the tarfile on the host to be copied into hte container
+        tarfile_path -- full path to the cached tarfile on the host to be copied into the container
         """
         container = ctx.docker_client.containers.get(container_name)
 
         # Only the iRODS containers need to have packages installed
         if context.is_catalog_database_container(container): return 0
 
-        archive.copy_archive_to_container(container, tarfile_path)
+        archive_cache.copy_archive_to_container(container, tarfile_path)
 
         package_list = ' '.join([
             p for p in package_paths
@@ -106,41 +109,17 @@ class installer(object):
 
 
     def install_packages(self, ctx, package_directory, containers, package_name_list=None):
-        import concurrent.futures
-
         packages = self.get_list_of_package_paths(package_directory, package_name_list)
 
-        tarfile_path = archive.create_archive(packages)
-
-        rc = 0
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_containers = {
-                executor.submit(
-                    self.install_packages_on_container_from_tarfile,
-                    ctx, c.name, packages, tarfile_path
-                ): c for c in containers
-            }
-            logging.debug(futures_to_containers)
-
-            for f in concurrent.futures.as_completed(futures_to_containers):
-                container = futures_to_containers[f]
-                try:
-                    ec = f.result()
-                    if ec != 0:
-                        logging.error('error while installing packages on container [{}]'
-                                      .format(container.name))
-                        rc = ec
-                    else:
-                        logging.info('packages installed successfully [{}]'
-                                     .format(container.name))
-
-                except Exception as e:
-                    logging.error('exception raised while installing packages [{}]'
-                                  .format(container.name))
-                    logging.error(e)
-                    rc = 1
-
-        return rc
+        # The same packages are installed over and over across runs and projects, so the tarball
+        # is cached on the host and reused as long as the package files have not changed.
+        tarfile_path = archive_cache.get_or_create_archive(packages)
+
+        return async_executor.run(async_executor.run_for_containers(
+            lambda c: async_executor.run_blocking(
+                self.install_packages_on_container_from_tarfile, ctx, c.name, packages, tarfile_path),
+            containers,
+            'installing packages'))
 
 
     def install_official_irods_packages(self, ctx, version, containers):
@@ -155,65 +134,63 @@ class installer(object):
         Returns:
             An integer value with 0 indicating success, and any other value indicating an error code.
         """
-        def install_packages_(ctx, docker_compose_container, packages_list):
-            container = ctx.docker_client.containers.get(docker_compose_container.name)
+        packages = self.official_irods_package_list(ctx, version)
 
-            package_list = ' '.join([p for p in packages_list if not context.is_database_plugin(p) or context.is_irods_catalog_provider_container(container)])
+        return async_executor.run(async_executor.run_for_containers(
+            lambda c: async_executor.run_blocking(
+                self.install_official_packages_on_container, ctx, c.name, packages),
+            [c for c in containers if not context.is_catalog_database_container(c)],
+            'installing packages'))
 
-            cmd = ' '.join([self.install_official_packages_command(), package_list])
 
-            logging.warning('executing cmd [{0}] on container [{1}]'.format(cmd, container.name))
+    def official_irods_package_list(self, ctx, version=None):
+        """Return the names of the official iRODS packages to install, pinned to `version` if provided.
 
-            ec = execute.execute_command(container, self.update_command())
-            if ec != 0:
-                logging.error('failed to update local repositories [{}]'.format(container.name))
-                return ec
+        Arguments:
+        ctx -- context object which contains information about the Compose environment
+        version -- version string to pin the packages to (if None, the latest available is used)
+        """
+        # If a version is not provided, just install the latest
+        if version:
+            return ['{}{}{}'.format(p, self.version_joinery(), version)
+                    for p in context.irods_package_names(ctx.database_name())]
 
-            ec = execute.execute_command(container, cmd)
-            if ec != 0:
-                logging.error(
-                    'failed to install packages on container [ec=[{0}], container=[{1}]'.format(ec, container.name))
+        return context.irods_package_names(ctx.database_name())
 
-                return ec
 
-            return 0
+    @tracing.traced('install', container_argument='container_name')
+    def install_official_packages_on_container(self, ctx, container_name, packages_list):
+        """Install packages from the Consortium repositories on the specified container.
 
-        import concurrent.futures
+        Arguments:
+        ctx -- context object which contains a docker_client
+        container_name -- name of the container on which packages are being installed
+        packages_list -- names of the packages to install (see `official_irods_package_list`)
+        """
+        container = ctx.docker_client.containers.get(container_name)
 
-        # If a version is not provided, just install the latest
-        if version:
-            packages = ['{}{}{}'.format(p, self.version_joinery(), version)
-                        for p in context.irods_package_names(ctx.database_name())]
-        else:
-            packages = context.irods_package_names(ctx.database_name())
+        package_list = ' '.join([p for p in packages_list if not context.is_database_plugin(p) or context.is_irods_catalog_provider_container(container)])
 
-        rc = 0
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_containers = {
-                executor.submit(install_packages_, ctx, c, packages): c
-                for c in containers
-                if not context.is_catalog_database_container(c)
-            }
-            logging.debug(futures_to_containers)
+        cmd = ' '.join([self.install_official_packages_command(), package_list])
 
-            for f in concurrent.futures.as_completed(futures_to_containers):
-                container = futures_to_containers[f]
-                try:
-                    ec = f.result()
-                    if ec != 0:
-                        logging.error('error while installing packages on container [{}]'.format(container.name))
-                        rc = ec
+        logging.warning('executing cmd [{0}] on container [{1}]'.format(cmd, container.name))
 
-                    logging.info('packages installed successfully [{}]'.format(container.name))
+        ec = execute.execute_command(container, self.update_command())
+        if ec != 0:
+            logging.error('failed to update local repositories [{}]'.format(container.name))
+            return ec
 
-                except Exception as e:
-                    logging.error('exception raised while installing packages [{}]'.format(container.name))
-                    logging.error(e)
-                    rc = 1
+        ec = execute.execute_command(container, cmd)
+        if ec != 0:
+            logging.error(
+                'failed to install packages on container [ec=[{0}], container=[{1}]'.format(ec, container.name))
+
+            return ec
 
-        return rc
+        return 0
 
 
+    @tracing.phase('install packages')
     def install_irods_packages(self,
                                ctx,
                                externals_directory=None,
@@ -267,6 +244,51 @@ class installer(object):
                 raise RuntimeError('failed to install iRODS packages')
 
 
+    @tracing.traced('install', container_argument='container_name')
+    def install_irods_packages_on_container(self,
+                                            ctx,
+                                            container_name,
+                                            externals_directory=None,
+                                            package_directory=None,
+                                            package_version=None):
+        """Install iRODS packages and external dependencies on a single container.
+
+        This does for one container what `install_irods_packages` does for every iRODS container in
+        the project, so that installing on one container does not have to wait for the others.
+
+        Arguments:
+        ctx -- a context object which holds information about the Compose environment
+        container_name -- name of the container on which packages are being installed
+        externals_directory -- see `install_irods_packages`
+        package_directory -- see `install_irods_packages`
+        package_version -- see `install_irods_packages`
+        """
+        if package_directory and package_version:
+            raise ValueError('package_directory and package_version are incompatible')
+
+        # The archives are cached, so only the first container to get here builds each of them.
+        if externals_directory:
+            packages = self.get_list_of_package_paths(os.path.abspath(externals_directory),
+                                                      context.irods_externals_package_names())
+            ec = self.install_packages_on_container_from_tarfile(
+                ctx, container_name, packages, archive_cache.get_or_create_archive(packages))
+            if ec != 0:
+                raise RuntimeError('failed to install externals [{}]'.format(container_name))
+
+        if package_directory:
+            packages = self.get_list_of_package_paths(os.path.abspath(package_directory),
+                                                      context.irods_package_names(ctx.database_name()))
+            ec = self.install_packages_on_container_from_tarfile(
+                ctx, container_name, packages, archive_cache.get_or_create_archive(packages))
+
+        else:
+            ec = self.install_official_packages_on_container(
+                ctx, container_name, self.official_irods_package_list(ctx, package_version))
+
+        if ec != 0:
+            raise RuntimeError('failed to install iRODS packages [{}]'.format(container_name))
+
+
 def make_installer(platform_name):
     """
     Create and return an installer suited to the given platform_name.
@@ -0,0 +1,365 @@
+"""Count the Docker operations made by a job and check them against budgets.
+
+Setup which makes a few more execs per container than it needs to is easy to miss in review and in
+wall-clock times, and gets expensive once it is multiplied across every consumer of every job. With
+instrumentation enabled, each call to `execute.execute_command`, `archive.copy_archive_to_container`
+and `archive.copy_from_container`, and each container inspect made through an instrumented Docker
+client, is counted along with how long it took. The counts and latency histograms are kept per
+container and per calling function, and `summary` presents them as a table.
+
+Each operation is also counted against the phase it ran in (see `tracing.phase`), so budgets such as
+"setting up a consumer takes at most 40 execs per consumer" can be checked at the end of a job with
+`check_budgets`. Budgets are read from a JSON file holding a list of objects like this one:
+
+    {"operation": "exec", "maximum": 40, "phase": "set up consumer*", "service": "irods-catalog-consumer"}
+
+`phase` is a shell-style pattern matched against phase names (default: every phase). With `service`,
+`maximum` applies to each container of that service; without it, to the total over all containers.
+
+Instrumentation is disabled by default. Use `enable()` to turn it on.
+"""
+
+# grown-up modules
+import bisect
+import collections
+import contextvars
+import fnmatch
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+# local modules
+from . import tracing
+
+OPERATIONS_FILENAME = 'docker_operations.json'
+
+# Upper bounds in seconds of the buckets of the latency histograms. The last bucket has no bound.
+BUCKET_BOUNDS = (0.01, 0.03, 0.1, 0.3, 1, 3, 10, 30)
+
+# Modules whose frames are skipped when looking for the function which made an operation.
+_PLUMBING_MODULES = (__name__, tracing.__name__, 'irods_testing_environment.async_executor',
+                     'asyncio', 'concurrent.futures', 'contextlib', 'docker', 'functools', 'threading')
+
+_collector = None
+
+_handed_off_caller = contextvars.ContextVar('irods_testing_environment_instrumentation_caller', default=None)
+
+
+class latency_histogram(object):
+    """Number and latencies of the calls to one operation."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    def to_dict(self):
+        return {'count': self.count, 'total_seconds': self.total, 'max_seconds': self.max,
+                'buckets': dict(zip([str(b) for b in BUCKET_BOUNDS] + ['inf'], self.buckets))}
+
+
+class collector(object):
+    """Collects counts and latencies of operations in memory."""
+
+    def __init__(self):
+        self.by_container = collections.defaultdict(latency_histogram)
+        self.by_caller = collections.defaultdict(latency_histogram)
+        self.by_phase = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, operation, container_name, caller, phase, seconds):
+        """Record one call to `operation` which took `seconds`."""
+        with self.lock:
+            self.by_container[(operation, container_name)].add(seconds)
+            self.by_caller[(operation, caller)].add(seconds)
+            self.by_phase[(phase, operation, container_name)] += 1
+
+
+class budget(object):
+    """A limit on the number of times an operation is made during matching phases."""
+
+    def __init__(self, operation, maximum, phase='*', service=None):
+        """Construct a budget.
+
+        Arguments:
+        operation -- name of the operation (e.g. 'exec', 'inspect', 'copy_archive_to_container')
+        maximum -- largest number of calls allowed
+        phase -- shell-style pattern of the names of the phases in which calls are counted
+        service -- if given, `maximum` applies to each container of this Compose service rather than
+                   to the total over all containers
+        """
+        self.operation = operation
+        self.maximum = int(maximum)
+        self.phase = phase
+        self.service = service
+
+    def __str__(self):
+        per = ' per [{}] container'.format(self.service) if self.service else ''
+        return '[{}] at most [{}] times{} in phases [{}]'.format(self.operation, self.maximum, per, self.phase)
+
+
+def enable(*docker_clients):
+    """Count operations from now on, including the container inspects made through `docker_clients`.
+
+    Arguments:
+    docker_clients -- docker.DockerClient instances whose inspects are counted
+    """
+    global _collector
+
+    _collector = collector()
+
+    for c in docker_clients:
+        instrument_client(c)
+
+
+def enabled():
+    """Return True if operations are being counted."""
+    return _collector is not None
+
+
+def instrument_client(docker_client):
+    """Count each container inspect made through `docker_client`, including those of containers.get and list."""
+    api = docker_client.api
+    original = api.inspect_container
+
+    if getattr(original, '_instrumented', False):
+        return
+
+    def inspect_container(container, *args, **kwargs):
+        c = _collector
+
+        if c is None:
+            return original(container, *args, **kwargs)
+
+        caller = _caller_name(sys._getframe(1)) or _handed_off_caller.get() or '<unknown>'
+        start = time.perf_counter()
+
+        attrs = original(container, *args, **kwargs)
+
+        # containers.list inspects by ID, so the name is taken from the results.
+        name = attrs.get('Name', '').lstrip('/') or container
+        c.record('inspect', name, caller, tracing.current_phase(), time.perf_counter() - start)
+
+        return attrs
+
+    inspect_container._instrumented = True
+    api.inspect_container = inspect_container
+
+
+def _caller_name(frame):
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+
+        if not any(module == m or module.startswith(m + '.') for m in _PLUMBING_MODULES):
+            return '{}.{}'.format(module.replace('irods_testing_environment.', ''), frame.f_code.co_name)
+
+        frame = frame.f_back
+
+    return None
+
+
+def remember_caller():
+    """Remember the calling function so that operations handed off to another thread are attributed to it.
+
+    This is meant to be run in the copy of the context in which work is handed off to another thread
+    (see `async_executor.scheduler.run`).
+    """
+    if _collector is not None:
+        _handed_off_caller.set(_caller_name(sys._getframe(1)))
+
+
+def counted(operation, container_argument='container'):
+    """Decorate a function so that each call to it is counted as `operation`.
+
+    Arguments:
+    operation -- name under which the calls are counted (e.g. 'exec')
+    container_argument -- name of the argument of the function which holds the container (or
+                          container name) the call runs against
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            c = _collector
+
+            if c is None:
+                return fn(*args, **kwargs)
+
+            container = signature.bind_partial(*args, **kwargs).arguments.get(container_argument)
+            if not isinstance(container, str):
+                container = getattr(container, 'name', None)
+
+            caller = _caller_name(sys._getframe(1)) or _handed_off_caller.get() or '<unknown>'
+
+            start = time.perf_counter()
+
+            try:
+                return fn(*args, **kwargs)
+
+            finally:
+                c.record(operation, container, caller, tracing.current_phase(), time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def load_budgets(path_to_budgets_file):
+    """Return the budgets in the JSON file at `path_to_budgets_file`, or an empty list if the path is None.
+
+    Arguments:
+    path_to_budgets_file -- local path to a JSON file holding a list of budgets (see the module docstring)
+    """
+    if path_to_budgets_file is None:
+        return list()
+
+    with open(path_to_budgets_file) as f:
+        entries = json.load(f)
+
+    try:
+        return [budget(**e) for e in entries]
+
+    except TypeError as e:
+        raise RuntimeError('invalid budget in [{}]: {}'.format(path_to_budgets_file, e))
+
+
+def _container_is_of_service(container_name, service):
+    return re.fullmatch(r'.+-{}-\d+'.format(re.escape(service)), container_name or '') is not None
+
+
+def check_budgets(budgets):
+    """Return a description of each way in which the operations counted so far exceed `budgets`."""
+    if _collector is None:
+        return list()
+
+    with _collector.lock:
+        by_phase = dict(_collector.by_phase)
+
+    violations = list()
+
+    for b in budgets:
+        counts = collections.Counter()
+
+        for (phase, operation, container_name), count in by_phase.items():
+            if operation != b.operation or not fnmatch.fnmatchcase(phase or '', b.phase):
+                continue
+
+            if b.service is None:
+                counts['all containers'] += count
+            elif _container_is_of_service(container_name, b.service):
+                counts[container_name] += count
+
+        for container_name, count in sorted(counts.items()):
+            if count > b.maximum:
+                violations.append('{} made [{}] times on [{}], exceeding budget of {}'
+                                  .format(b.operation, count, container_name, b))
+
+    return violations
+
+
+def _histogram_string(h):
+    labels = ['<={}s'.format(b) for b in BUCKET_BOUNDS] + ['>{}s'.format(BUCKET_BOUNDS[-1])]
+    return ' '.join('{}:{}'.format(label, n) for label, n in zip(labels, h.buckets) if n)
+
+
+def summary(max_callers=10):
+    """Return the counts and latencies of the operations counted so far as a string.
+
+    Arguments:
+    max_callers -- number of calling functions listed for each operation, busiest first
+    """
+    if _collector is None:
+        return ''
+
+    with _collector.lock:
+        by_container = dict(_collector.by_container)
+        by_caller = dict(_collector.by_caller)
+
+    lines = list()
+    row = '  {:<60}{:>8}{:>10}{:>10}{:>10}  {}'
+
+    for operation in sorted({o for o, _ in by_container}):
+        total = latency_histogram()
+        for (o, _), h in by_container.items():
+            if o == operation:
+                total.count += h.count
+                total.total += h.total
+                total.max = max(total.max, h.max)
+                total.buckets = [a + b for a, b in zip(total.buckets, h.buckets)]
+
+        lines.append('[{}]: [{}] calls taking [{:.3f}] seconds'.format(operation, total.count, total.total))
+        lines.append(row.format('', 'count', 'total(s)', 'mean(s)', 'max(s)', 'latencies'))
+
+        for title, stats, limit in [('by container', by_container, None), ('by caller', by_caller, max_callers)]:
+            lines.append(' {}:'.format(title))
+
+            rows = sorted(((k, h) for (o, k), h in stats.items() if o == operation),
+                          key=lambda kh: kh[1].total, reverse=True)
+
+            for key, h in rows[:limit]:
+                lines.append(row.format(str(key), h.count, '{:.3f}'.format(h.total),
+                                        '{:.3f}'.format(h.total / h.count), '{:.3f}'.format(h.max),
+                                        _histogram_string(h)))
+
+    return '\n'.join(lines)
+
+
+def write(path):
+    """Write the operations counted so far to `path` as JSON."""
+    if _collector is None:
+        return
+
+    with _collector.lock:
+        operations = {
+            'by_container': [dict(operation=o, container=k, **h.to_dict())
+                             for (o, k), h in _collector.by_container.items()],
+            'by_caller': [dict(operation=o, caller=k, **h.to_dict())
+                          for (o, k), h in _collector.by_caller.items()],
+            'by_phase': [{'phase': p, 'operation': o, 'container': k, 'count': n}
+                         for (p, o, k), n in _collector.by_phase.items()]
+        }
+
+    with open(path, 'w') as f:
+        json.dump(operations, f, indent=4)
+
+
+def report(output_directory, budgets=None):
+    """Log the summary, save the counts to the job output directory, and check the budgets.
+
+    Arguments:
+    output_directory -- job output directory (see `test_utils.make_output_directory`)
+    budgets -- budgets to check (see `load_budgets`)
+
+    Returns:
+        True if the operations counted so far are within the budgets; otherwise, False.
+    """
+    if _collector is None:
+        return True
+
+    try:
+        logging.error('docker operations:\n{}'.format(summary()))
+        write(os.path.join(output_directory, OPERATIONS_FILENAME))
+
+    except Exception as e:
+        logging.error('failed to report docker operations: {}'.format(e))
+
+    violations = check_budgets(budgets or list())
+
+    for v in violations:
+        logging.critical(v)
+
+    return not violations
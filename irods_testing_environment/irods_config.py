@@ -6,9 +6,11 @@ import logging
 import os
 
 # local modules
+from . import async_executor
 from . import context
 from . import execute
 from . import json_utils
+from . import tracing
 
 # This dict maps container names to iRODS zone names so that the name of the zone of the iRODS
 # server being run by each container is cached for easy access at any time. This is only meant to
@@ -123,13 +125,13 @@ def configure_users_for_auth_tests(docker_client, compose_project):
     compose_project -- compose.Project in which the iRODS servers are running
     usernames_and_passwords -- a list of tuples of usernames/passwords (passwords can be empty)
     """
-    def create_test_users(docker_client, docker_compose_container, usernames_and_passwords):
-        container = docker_client.containers.get(docker_compose_container.name)
+    async def create_test_users(docker_client, docker_compose_container, usernames_and_passwords):
+        container = await async_executor.run_blocking(docker_client.containers.get, docker_compose_container.name)
 
         for username, password in usernames_and_passwords:
             create_user = f'useradd {username}'
 
-            if execute.execute_command(container, create_user) != 0:
+            if await async_executor.execute_command(container, create_user) != 0:
                 raise RuntimeError(f'[{container.name}] failed to create user [{username}]')
 
             if password is None or password == '':
@@ -137,46 +139,24 @@ def configure_users_for_auth_tests(docker_client, compose_project):
 
             set_password = f'bash -c "echo \'{username}:{password}\' | chpasswd"'
 
-            if execute.execute_command(container, set_password) != 0:
+            if await async_executor.execute_command(container, set_password) != 0:
                 raise RuntimeError(f'[{container.name}] failed to set password [{password}] for user [{username}]')
 
         return 0
 
-    import concurrent.futures
-
     containers = compose_project.containers(service_names=[
         context.irods_catalog_provider_service(),
         context.irods_catalog_consumer_service()])
 
-    rc = 0
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # TODO: get these names from the test file packaged with the server
-        usernames_and_passwords = [
-            ('irodsauthuser', ';=iamnotasecret')
-        ]
+    # TODO: get these names from the test file packaged with the server
+    usernames_and_passwords = [
+        ('irodsauthuser', ';=iamnotasecret')
+    ]
 
-        futures_to_containers = {
-            executor.submit(
-                create_test_users, docker_client, c, usernames_and_passwords
-            ): c for c in containers
-        }
-
-        logging.debug(futures_to_containers)
-
-        for f in concurrent.futures.as_completed(futures_to_containers):
-            container = futures_to_containers[f]
-            try:
-                ec = f.result()
-                if ec != 0:
-                    logging.error(f'[{container.name}] error while creating test user accounts')
-                    rc = ec
-                else:
-                    logging.info(f'[{container.name}] successfully created test user accounts')
-
-            except Exception as e:
-                logging.error(f'[{container.name}] exception raised while creating test users')
-                logging.error(e)
-                rc = 1
+    rc = async_executor.run(async_executor.run_for_containers(
+        lambda c: create_test_users(docker_client, c, usernames_and_passwords),
+        containers,
+        'creating test user accounts'))
 
     if rc != 0:
         raise RuntimeError('failed to create test user accounts on some service')
@@ -189,8 +169,8 @@ def configure_host_resolution(docker_client, compose_project):
     docker_client -- docker client for interacting with the docker-compose project
     compose_project -- compose.Project in which the iRODS servers are running
     """
-    def set_hostnames(docker_client, docker_compose_container):
-        container = docker_client.containers.get(docker_compose_container.name)
+    async def set_hostnames(docker_client, docker_compose_container):
+        container = await async_executor.run_blocking(docker_client.containers.get, docker_compose_container.name)
 
         if context.is_irods_catalog_provider_container(container):
             alias = 'icat.example.org'
@@ -209,10 +189,8 @@ def configure_host_resolution(docker_client, compose_project):
             }
         ]
 
-        for o in containers:
-            if o.name == container.name: continue
-
-            other = docker_client.containers.get(o.name)
+        for other in containers:
+            if other.name == container.name: continue
 
             if context.is_irods_catalog_provider_container(other):
                 remote_address = 'icat.example.org'
@@ -233,46 +211,22 @@ def configure_host_resolution(docker_client, compose_project):
 
         logging.info('json for host_resolution.host_entries [{}] [{}]'.format(json.dumps(host_entries), container.name))
 
-        update_host_resolution_config = '''bash -c "sed -i 's/\\"host_entries\\": \\[\\]/\\"host_entries\\": {}/g' /etc/irods/server_config.json"'''.format(
-            json.dumps(host_entries).replace('"', '\\"'))
-
-        if execute.execute_command(container, update_host_resolution_config) != 0:
-            raise RuntimeError('failed to update host_resolution configuration for [{}]'.format(container.name))
+        def update_host_resolution_config():
+            with json_utils.json_file_editor(container, context.server_config()) as config:
+                config.contents.setdefault('host_resolution', dict())['host_entries'] = host_entries
 
-        execute.execute_command(container, 'bash -c "cat /etc/irods/server_config.json"')
+        await async_executor.run_blocking(update_host_resolution_config)
 
         return 0
 
-    import concurrent.futures
-
     containers = compose_project.containers(service_names=[
         context.irods_catalog_provider_service(),
         context.irods_catalog_consumer_service()])
 
-    rc = 0
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures_to_containers = {
-            executor.submit(set_hostnames, docker_client, c): c for c in containers
-        }
-        logging.debug(futures_to_containers)
-
-        for f in concurrent.futures.as_completed(futures_to_containers):
-            container = futures_to_containers[f]
-            try:
-                ec = f.result()
-                if ec != 0:
-                    logging.error('error while configuring host resolution on container [{}]'
-                                  .format(container.name))
-                    rc = ec
-                else:
-                    logging.info('host resolution configured successfully [{}]'
-                                 .format(container.name))
-
-            except Exception as e:
-                logging.error('exception raised while installing packages [{}]'
-                              .format(container.name))
-                logging.error(e)
-                rc = 1
+    rc = async_executor.run(async_executor.run_for_containers(
+        lambda c: set_hostnames(docker_client, c),
+        containers,
+        'configuring host resolution'))
 
     if rc != 0:
         raise RuntimeError('failed to configure host resolution on some service')
@@ -285,22 +239,29 @@ def configure_hello_script(docker_client, compose_project):
     docker_client -- docker client for interacting with the docker-compose project
     compose_project -- compose.Project in which the iRODS servers are running
     """
-    def modify_script(docker_client, docker_compose_container, script):
+    async def modify_script(docker_client, docker_compose_container, script):
         chown_msiexec = 'chown irods:irods {}'.format(os.path.dirname(script))
         copy_from_template = 'cp {0}.template {0}'.format(script)
         make_script_executable = 'chmod 544 {}'.format(script)
 
-        on_container = docker_client.containers.get(docker_compose_container.name)
-        if execute.execute_command(on_container, chown_msiexec) != 0:
+        on_container = await async_executor.run_blocking(docker_client.containers.get, docker_compose_container.name)
+        if await async_executor.execute_command(on_container, chown_msiexec) != 0:
             raise RuntimeError('failed to change ownership to msiExecCmd_bin [{}]'
                                .format(on_container.name))
 
-        if execute.execute_command(on_container, copy_from_template, user="irods", workdir=context.irods_home()) != 0:
+        if (
+            await async_executor.execute_command(
+                on_container, copy_from_template, user="irods", workdir=context.irods_home()
+            )
+            != 0
+        ):
             raise RuntimeError('failed to copy hello.template template file [{}]'
                                .format(on_container.name))
 
         if (
-            execute.execute_command(on_container, make_script_executable, user="irods", workdir=context.irods_home())
+            await async_executor.execute_command(
+                on_container, make_script_executable, user="irods", workdir=context.irods_home()
+            )
             != 0
         ):
             raise RuntimeError('failed to change permissions on hello script [{}]'
@@ -308,8 +269,6 @@ def configure_hello_script(docker_client, compose_project):
 
         return 0
 
-    import concurrent.futures
-
     containers = compose_project.containers(service_names=[
         context.irods_catalog_provider_service(),
         context.irods_catalog_consumer_service()])
@@ -325,31 +284,10 @@ def configure_hello_script(docker_client, compose_project):
                      .format(containers[0].name))
         return
 
-    rc = 0
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures_to_containers = {
-            executor.submit(
-                modify_script, docker_client, c, hello_script
-            ): c for c in containers
-        }
-
-        logging.debug(futures_to_containers)
-
-        for f in concurrent.futures.as_completed(futures_to_containers):
-            container = futures_to_containers[f]
-            try:
-                ec = f.result()
-                if ec != 0:
-                    logging.error('error while configuring hello script on container [{}]'
-                                  .format(container.name))
-                    rc = ec
-                else:
-                    logging.info('hello script configured successfully [{}]'.format(container.name))
-
-            except Exception as e:
-                logging.error('exception raised while configuring hello script [{}]'.format(container.name))
-                logging.error(e)
-                rc = 1
+    rc = async_executor.run(async_executor.run_for_containers(
+        lambda c: modify_script(docker_client, c, hello_script),
+        containers,
+        'configuring hello script'))
 
     if rc != 0:
         raise RuntimeError('failed to configure hello script on some service')
@@ -362,23 +300,28 @@ def configure_univmss_script(docker_client, compose_project):
     docker_client -- docker client for interacting with the docker-compose project
     compose_project -- compose.Project in which the iRODS servers are running
     """
-    def modify_script(docker_client, docker_compose_container, script):
+    async def modify_script(docker_client, docker_compose_container, script):
         chown_msiexec = 'chown irods:irods {}'.format(os.path.dirname(script))
         copy_from_template = 'cp {0}.template {0}'.format(script)
         remove_template_from_commands = 'sed -i \"s/template-//g\" {}'.format(script)
         make_script_executable = 'chmod 544 {}'.format(script)
 
-        on_container = docker_client.containers.get(docker_compose_container.name)
-        if execute.execute_command(on_container, chown_msiexec) != 0:
+        on_container = await async_executor.run_blocking(docker_client.containers.get, docker_compose_container.name)
+        if await async_executor.execute_command(on_container, chown_msiexec) != 0:
             raise RuntimeError('failed to change ownership to msiExecCmd_bin [{}]'
                                .format(on_container.name))
 
-        if execute.execute_command(on_container, copy_from_template, user="irods", workdir=context.irods_home()) != 0:
+        if (
+            await async_executor.execute_command(
+                on_container, copy_from_template, user="irods", workdir=context.irods_home()
+            )
+            != 0
+        ):
             raise RuntimeError('failed to copy univMSSInterface.sh template file [{}]'
                                .format(on_container.name))
 
         if (
-            execute.execute_command(
+            await async_executor.execute_command(
                 on_container, remove_template_from_commands, user="irods", workdir=context.irods_home()
             )
             != 0
@@ -387,7 +330,9 @@ def configure_univmss_script(docker_client, compose_project):
                                .format(on_container.name))
 
         if (
-            execute.execute_command(on_container, make_script_executable, user="irods", workdir=context.irods_home())
+            await async_executor.execute_command(
+                on_container, make_script_executable, user="irods", workdir=context.irods_home()
+            )
             != 0
         ):
             raise RuntimeError('failed to change permissions on univMSSInterface.sh [{}]'
@@ -395,45 +340,23 @@ def configure_univmss_script(docker_client, compose_project):
 
         return 0
 
-    import concurrent.futures
-
     containers = compose_project.containers(service_names=[
         context.irods_catalog_provider_service(),
         context.irods_catalog_consumer_service()])
 
-    rc = 0
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        univmss_script = os.path.join(
-            context.irods_home(), 'msiExecCmd_bin', 'univMSSInterface.sh')
-
-        futures_to_containers = {
-            executor.submit(
-                modify_script, docker_client, c, univmss_script
-            ): c for c in containers
-        }
-
-        logging.debug(futures_to_containers)
-
-        for f in concurrent.futures.as_completed(futures_to_containers):
-            container = futures_to_containers[f]
-            try:
-                ec = f.result()
-                if ec != 0:
-                    logging.error('error while configuring univMSS script on container [{}]'
-                                  .format(container.name))
-                    rc = ec
-                else:
-                    logging.info('univMSS script configured successfully [{}]'.format(container.name))
-
-            except Exception as e:
-                logging.error('exception raised while configuring univMSS script [{}]'.format(container.name))
-                logging.error(e)
-                rc = 1
+    univmss_script = os.path.join(
+        context.irods_home(), 'msiExecCmd_bin', 'univMSSInterface.sh')
+
+    rc = async_executor.run(async_executor.run_for_containers(
+        lambda c: modify_script(docker_client, c, univmss_script),
+        containers,
+        'configuring univMSS script'))
 
     if rc != 0:
         raise RuntimeError('failed to configure univMSS script on some service')
 
 
+@tracing.phase('configure iRODS testing')
 def configure_irods_testing(docker_client, compose_project):
     """Run a series of prerequisite configuration steps for iRODS tests.
 
@@ -557,13 +480,12 @@ def configure_pam_for_auth_plugin(docker_client, compose_project):
     """
     from . import archive
 
-    import concurrent.futures
     import textwrap
 
-    def configure_pam(docker_client, docker_compose_container, path_to_config, contents):
-        container = docker_client.containers.get(docker_compose_container.name)
+    async def configure_pam(docker_client, docker_compose_container, path_to_config, contents):
+        container = await async_executor.run_blocking(docker_client.containers.get, docker_compose_container.name)
 
-        archive.put_string_to_file(container, path_to_config, contents)
+        await async_executor.run_blocking(archive.put_string_to_file, container, path_to_config, contents)
 
         # TODO #133: run /usr/sbin/irodsPamAuthCheck here to make sure it's okay
 
@@ -582,28 +504,10 @@ def configure_pam_for_auth_plugin(docker_client, compose_project):
         context.irods_catalog_provider_service(),
         context.irods_catalog_consumer_service()])
 
-    rc = 0
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures_to_containers = {
-            executor.submit(
-                configure_pam, docker_client, c, path_to_config, contents
-            ): c for c in containers
-        }
-
-        for f in concurrent.futures.as_completed(futures_to_containers):
-            container = futures_to_containers[f]
-            try:
-                ec = f.result()
-                if ec != 0:
-                    logging.error(f'[{container.name}] error configuring pam')
-                    rc = ec
-                else:
-                    logging.info(f'[{container.name}] successfully configured pam')
-
-            except Exception as e:
-                logging.error(f'[{container.name}] exception raised while configuring pam')
-                logging.error(e)
-                rc = 1
+    rc = async_executor.run(async_executor.run_for_containers(
+        lambda c: configure_pam(docker_client, c, path_to_config, contents),
+        containers,
+        'configuring pam'))
 
     if rc != 0:
         raise RuntimeError('failed to configure pam on some service')
@@ -11,6 +11,7 @@ from . import database_setup
 from . import odbc_setup
 from . import execute
 from . import irods_config
+from . import tracing
 
 class zone_info(object):
     """Class to hold information about an iRODS Zone and the containers running the servers."""
@@ -902,6 +903,7 @@ def restart_irods(container):
     return execute.execute_command(container, cmd, user='irods', workdir=context.irods_home())
 
 
+@tracing.traced('setup')
 def setup_irods_server(container, setup_input, **kwargs):
     """Set up iRODS server on the given container with the provided input.
 
@@ -1133,6 +1135,7 @@ def setup_irods_zone(ctx,
                      database_service_instance=1,
                      consumer_service_instances=None,
                      odbc_driver=None,
+                     wait_for_database=True,
                      **kwargs):
     """Set up an iRODS Zone with the specified settings on the specified service instances.
 
@@ -1147,9 +1150,11 @@ def setup_irods_zone(ctx,
                                   consumer service name in the Compose project will be
                                   targeted. If an empty list is provided, nothing happens.
     odbc_driver -- path to the local archive file containing the ODBC driver
+    wait_for_database -- if False, the database service is assumed to be accepting connections
     """
-    database_setup.wait_for_database_service(
-        ctx, database_service_instance=database_service_instance)
+    if wait_for_database:
+        database_setup.wait_for_database_service(
+            ctx, database_service_instance=database_service_instance)
 
     logging.info('setting up catalog database [{}]'.format(database_service_instance))
     database_setup.setup_catalog(ctx,
@@ -1171,18 +1176,24 @@ def setup_irods_zone(ctx,
                                   consumer_service_instances=consumer_service_instances,
                                   **kwargs)
 
+@tracing.phase('set up zones')
 def setup_irods_zones(ctx,
                       zone_info_list,
                       odbc_driver=None,
                       **kwargs):
     import concurrent.futures
 
+    # Wait for every catalog at once rather than once per zone in turn.
+    database_setup.wait_for_database_services(
+        ctx, [z.database_service_instance for z in zone_info_list])
+
     rc = 0
 
     with concurrent.futures.ThreadPoolExecutor() as executor:
         futures_to_containers = {
             executor.submit(setup_irods_zone,
                             ctx,
+                            wait_for_database=False,
                             provider_service_instance=z.provider_service_instance,
                             database_service_instance=z.database_service_instance,
                             consumer_service_instances=z.consumer_service_instances,
@@ -1209,6 +1220,91 @@ def setup_irods_zones(ctx,
         raise RuntimeError('failed to set up one or more iRODS Zones, ec=[{}]'.format(rc))
 
 
+def add_zone_setup_tasks(graph,
+                         ctx,
+                         zone,
+                         dependencies_by_container=None,
+                         force_recreate=False,
+                         odbc_driver=None,
+                         **kwargs):
+    """Add the tasks which set up an iRODS Zone to a task_graph.
+
+    Each server is set up as soon as what it needs is ready rather than once every server of the
+    previous kind is: the provider needs its catalog, and each consumer needs its provider.
+
+    Arguments:
+    graph -- task_graph.task_graph to which the tasks are added
+    ctx -- context object which holds the Docker client and Compose project information
+    zone -- zone_info describing the Zone to set up
+    dependencies_by_container -- map of container names to names of tasks in `graph` which must
+                                 be done before the server in that container is set up (e.g.
+                                 installing packages)
+    force_recreate -- if True, drop and re-create the catalog if it already exists
+    odbc_driver -- path to the local archive file containing the ODBC driver
+
+    Returns:
+        The names of the tasks which set up the servers in the Zone.
+    """
+    dependencies_by_container = dependencies_by_container or dict()
+
+    project_name = ctx.compose_project.name
+    database_instance = zone.database_service_instance
+    provider_instance = zone.provider_service_instance
+
+    zone_kwargs = dict(kwargs,
+                       zone_name=zone.zone_name,
+                       zone_key=zone.zone_key,
+                       negotiation_key=zone.negotiation_key)
+
+    wait = graph.add(
+        'wait for database [{}]'.format(
+            context.irods_catalog_database_container(project_name, database_instance)),
+        lambda: database_setup.wait_for_database_service(
+            ctx, database_service_instance=database_instance))
+
+    catalog = graph.add(
+        'set up catalog [{}]'.format(
+            context.irods_catalog_database_container(project_name, database_instance)),
+        lambda: database_setup.setup_catalog(
+            ctx, force_recreate=force_recreate, service_instance=database_instance),
+        [wait])
+
+    provider_container = context.irods_catalog_provider_container(project_name, provider_instance)
+
+    provider = graph.add(
+        'set up provider [{}]'.format(provider_container),
+        lambda: setup_irods_catalog_provider(ctx,
+                                             database_service_instance=database_instance,
+                                             provider_service_instance=provider_instance,
+                                             odbc_driver=odbc_driver,
+                                             **zone_kwargs),
+        [catalog] + dependencies_by_container.get(provider_container, []))
+
+    servers = [provider]
+
+    consumer_instances = zone.consumer_service_instances
+    if consumer_instances is None:
+        consumer_instances = [
+            context.service_instance(c.name)
+            for c in ctx.compose_project.containers(
+                service_names=[context.irods_catalog_consumer_service()])
+        ]
+
+    for consumer_instance in consumer_instances:
+        consumer_container = context.irods_catalog_consumer_container(project_name, consumer_instance)
+
+        servers.append(graph.add(
+            'set up consumer [{}]'.format(consumer_container),
+            lambda i=consumer_instance: setup_irods_catalog_consumer(
+                ctx,
+                provider_service_instance=provider_instance,
+                consumer_service_instance=i,
+                **zone_kwargs),
+            [provider] + dependencies_by_container.get(consumer_container, [])))
+
+    return servers
+
+
 def make_negotiation_key(prefix=''):
     """Generate a 32-byte negotiation key with an optional prefix.
 
@@ -1236,11 +1332,13 @@ def make_zone_key(zone_name):
 def get_info_for_zones(ctx, zone_names, consumer_service_instances_per_zone=0):
     zone_info_list = list()
 
+    containers = ctx.compose_project.containers()
+
     for i, zn in enumerate(zone_names):
         # Divide up the consumers evenly amongst the Zones
         consumer_service_instances = [
             context.service_instance(c.name)
-            for c in ctx.compose_project.containers()
+            for c in containers
             if context.is_irods_catalog_consumer_container(c)
             and context.service_instance(c.name) > i * consumer_service_instances_per_zone
             and context.service_instance(c.name) <= (i + 1) * consumer_service_instances_per_zone
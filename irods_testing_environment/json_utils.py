@@ -1,10 +1,12 @@
 # grown-up modules
 import json
-import os
+import logging
 
 # local modules
 from . import archive
+from . import tracing
 
+@tracing.traced('json')
 def get_json_from_file(container, target_file):
     """Return a JSON structure read out from a JSON file on the specified container.
 
@@ -12,19 +14,11 @@ def get_json_from_file(container, target_file):
     container -- docker.Container where the target_file is hosted
     target_file -- the path inside the container with the JSON contents to modify
     """
-    import shutil
-    from . import archive
-    json_file = os.path.join(archive.copy_from_container(container, target_file),
-                             os.path.basename(target_file))
-
-    try:
-        with open(json_file) as f:
-            return json.load(f)
-
-    finally:
-        shutil.rmtree(os.path.dirname(json_file), ignore_errors=True)
+    _, contents = archive.read_file_from_container(container, target_file)
+    return json.loads(contents)
 
 
+@tracing.traced('json')
 def put_json_to_file(container, target_file, json_contents):
     """Put the json_contents to the target_file in container.
 
@@ -35,3 +29,88 @@ def put_json_to_file(container, target_file, json_contents):
     """
     json_str = json.dumps(json_contents, sort_keys=True, indent=4).replace('"', '\\"')
     archive.put_string_to_file(container, target_file, json_str)
+
+
+class json_file_editor(object):
+    """Transactional read-modify-write of a JSON file in a container.
+
+    Edits are made to the contents read by a single get_archive. `commit` writes the result back in
+    a single put_archive which keeps the owner and mode of the file, and skips the write entirely if
+    nothing changed (or the file was never read). Several functions can therefore make their changes
+    to the same server_config.json for the cost of one round trip each way (see
+    `tls_setup.stage_tls_on_server`):
+
+        with json_utils.json_file_editor(container, context.server_config()) as config:
+            tls_setup.configure_tls_in_server_config(container, ..., server_config=config)
+            negotiation_key.configure_negotiation_key(container, key, server_config=config)
+    """
+
+    def __init__(self, container, target_file):
+        """Construct a json_file_editor. The file is not read until it is needed.
+
+        Arguments:
+        container -- docker.Container where the target_file is hosted
+        target_file -- the path inside the container of the JSON file to edit
+        """
+        self.container = container
+        self.target_file = target_file
+        self._contents = None
+        self._original = None
+        self._tarinfo = None
+
+    @property
+    def contents(self):
+        """The JSON structure being edited, read from the container on first access."""
+        if self._contents is None:
+            self._tarinfo, data = archive.read_file_from_container(self.container, self.target_file)
+            self._original = data.decode('utf-8')
+            self._contents = json.loads(self._original)
+
+        return self._contents
+
+    def __getitem__(self, key):
+        return self.contents[key]
+
+    def __setitem__(self, key, value):
+        self.contents[key] = value
+
+    def __delitem__(self, key):
+        del self.contents[key]
+
+    def __contains__(self, key):
+        return key in self.contents
+
+    def commit(self):
+        """Write the file back if it changed. Returns True if it was written."""
+        if self._contents is None:
+            return False
+
+        contents = self._contents
+
+        before = json.dumps(json.loads(self._original), sort_keys=True, indent=4)
+        after = json.dumps(contents, sort_keys=True, indent=4)
+
+        if before == after:
+            logging.debug(f'[{self.container.name}] no changes to [{self.target_file}]')
+            return False
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            import difflib
+            diff = difflib.unified_diff(before.splitlines(), after.splitlines(),
+                                        fromfile=self.target_file, tofile=self.target_file, lineterm='')
+            logging.debug(f'[{self.container.name}] changes to [{self.target_file}]:\n' + '\n'.join(diff))
+
+        archive.write_file_to_container(self.container, self.target_file, (after + '\n').encode('utf-8'),
+                                        tarinfo=self._tarinfo)
+
+        self._original = after
+
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Nothing is written if the edits were interrupted, so the file is never left half-configured.
+        if exc_type is None:
+            self.commit()
@@ -0,0 +1,214 @@
+"""Copy logs and test reports out of the containers continuously while tests run.
+
+Collecting everything in the `finally` block of a job means that a job which is killed saves
+nothing, and that all of the logs are copied at once at the end. A `log_shipper` instead polls the
+containers from a background thread. The log directories are shipped by byte offset: each poll
+lists the files in them with their inodes, sizes, and modification times, and only what has been
+appended since the last poll is copied and appended to the copy on the host. A file which has a new
+inode, shrank, or went back in time was rotated or replaced, so it is copied again from the start.
+Other paths, such as test reports, are copied whole whenever they change, because they are
+rewritten rather than appended to.
+
+Files land where `logs.collect_logs` would put them (`logs/<container name>/...` in the output
+directory), so once the shipper is stopped - which ships whatever is left - there is nothing more
+to collect.
+"""
+
+# grown-up modules
+import logging
+import os
+import threading
+
+# local modules
+from . import archive
+from . import async_executor
+from . import execute
+from . import logs
+
+DEFAULT_INTERVAL = 10
+
+
+class log_shipper(object):
+    """Ships files from containers to the host in the background until stopped."""
+
+    def __init__(self,
+                 docker_client,
+                 containers,
+                 output_directory,
+                 extra_paths=None,
+                 extra_paths_containers=None,
+                 interval=DEFAULT_INTERVAL):
+        """Construct a log_shipper.
+
+        The arguments mirror those of `logs.collect_logs`.
+
+        Arguments:
+        docker_client -- the Docker client which communicates with the daemon
+        containers -- list of containers from which logs are shipped
+        output_directory -- job output directory into which files are shipped
+        extra_paths -- other paths in the containers to ship (e.g. test reports)
+        extra_paths_containers -- containers from which `extra_paths` are shipped (default: `containers`)
+        interval -- number of seconds between polls of the containers
+        """
+        self.output_directory = output_directory
+        self.interval = interval
+
+        log_paths = logs.paths_to_logs(docker_client, containers)
+
+        # container name -> (container, [(path in container, True if shipped by appending)])
+        self.paths_by_container = {
+            c.name: (docker_client.containers.get(c.name), [(p, True) for p in log_paths]) for c in containers
+        }
+
+        for c in (containers if extra_paths_containers is None else extra_paths_containers):
+            if c.name not in self.paths_by_container:
+                self.paths_by_container[c.name] = (docker_client.containers.get(c.name), list())
+
+            self.paths_by_container[c.name][1].extend((p, False) for p in extra_paths or list())
+
+        # (container name, path in container) -> (inode, size, modification time) as of the last shipment
+        self.shipped = dict()
+
+        self.stopping = threading.Event()
+        self.thread = None
+
+
+    def destination(self, container_name, tracked_path, path):
+        """Return the path on the host to which `path` under `tracked_path` in the container is shipped."""
+        tracked_path = os.path.normpath(tracked_path)
+        relative_path = os.path.relpath(os.path.normpath(path), os.path.dirname(tracked_path))
+
+        return os.path.join(self.output_directory, 'logs', container_name, relative_path)
+
+
+    def list_files(self, container, tracked_paths):
+        """Return a list of (tracked path, path, inode, size, modification time) of the files under `tracked_paths`."""
+        # Paths which do not exist (yet) are skipped, and so are files which disappear mid-listing.
+        ec, output = execute.get_command_output(
+            container, ['find'] + tracked_paths + ['-type', 'f', '-printf', '%i %s %T@ %p\\n'])
+
+        files = list()
+
+        for line in output.decode('utf-8', errors='replace').splitlines():
+            try:
+                inode, size, mtime, path = line.split(' ', 3)
+
+                tracked = next(t for t in tracked_paths
+                               if path == t or path.startswith(t.rstrip('/') + '/'))
+
+                files.append((tracked, path, int(inode), int(size), float(mtime)))
+
+            except (ValueError, StopIteration):
+                logging.debug('[{}] ignoring line from find [{}]'.format(container.name, line))
+
+        return files
+
+
+    def ship_file(self, container, tracked_path, path, inode, size, mtime, append):
+        """Ship the changes to one file since it was last shipped."""
+        key = (container.name, path)
+        shipped_inode, shipped_size, shipped_mtime = self.shipped.get(key, (None, 0, None))
+
+        if (inode, size, mtime) == (shipped_inode, shipped_size, shipped_mtime):
+            return
+
+        # A log which was rotated or replaced may have grown past the size of the old one by the
+        # next poll, so the inode and modification time are checked as well as the size. Such a
+        # log - or one which was truncated - is shipped again from the start.
+        replaced = inode != shipped_inode or size < shipped_size or mtime < shipped_mtime
+
+        offset = shipped_size if append and not replaced else 0
+
+        ec, data = execute.get_command_output(container, ['tail', '-c', '+{}'.format(offset + 1), path])
+        if ec != 0:
+            raise RuntimeError('[{}] failed to read [{}] from offset [{}]'.format(container.name, path, offset))
+
+        destination = self.destination(container.name, tracked_path, path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+        with open(destination, 'ab' if offset else 'wb') as f:
+            f.write(data)
+
+        # The file may have grown between the listing and the read, so the offset is what was read.
+        self.shipped[key] = (inode, offset + len(data), mtime)
+
+
+    async def ship_container(self, container_name):
+        container, paths = self.paths_by_container[container_name]
+
+        append_by_path = dict(paths)
+
+        files = await async_executor.run_blocking(self.list_files, container, [p for p, _ in paths])
+
+        for tracked_path, path, inode, size, mtime in files:
+            await async_executor.run_blocking(self.ship_file, container, tracked_path, path, inode, size, mtime,
+                                              append_by_path[tracked_path])
+
+
+    def ship(self):
+        """Ship everything which has changed in the containers since the last shipment.
+
+        Returns:
+            0 if everything was shipped; otherwise, non-zero.
+        """
+        containers = [c for c, _ in self.paths_by_container.values()]
+
+        async def ship_container(c):
+            return await self.ship_container(c.name)
+
+        return async_executor.run(async_executor.run_for_containers(ship_container, containers, 'shipping logs'))
+
+
+    def _ship_until_stopped(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                if self.ship() != 0:
+                    logging.warning('failed to ship some logs - trying again in [{}] seconds'.format(self.interval))
+
+            except Exception as e:
+                logging.warning('failed to ship logs: {}'.format(e))
+
+
+    def start(self):
+        """Start shipping in the background."""
+        logging.info('shipping logs to [{}] every [{}] seconds'.format(self.output_directory, self.interval))
+
+        self.thread = threading.Thread(target=self._ship_until_stopped, name='log_shipper', daemon=True)
+        self.thread.start()
+
+        return self
+
+
+    def finish(self):
+        """Stop shipping in the background and ship whatever has not been shipped yet.
+
+        The shipped files can then be used in place (e.g. by `test_results.merge_junit_reports`)
+        before `stop` ships what has been written since and bundles them.
+
+        Returns:
+            0 if everything was shipped; otherwise, non-zero.
+        """
+        self.stopping.set()
+
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+        return self.ship()
+
+
+    def stop(self, bundle=False):
+        """Stop shipping in the background and ship whatever has not been shipped yet.
+
+        Arguments:
+        bundle -- if True, the shipped files are compressed into `logs.tar.gz` in the output
+                  directory afterwards (see `logs.collect_logs`)
+        """
+        try:
+            if self.finish() != 0:
+                raise RuntimeError('failed to ship some logs')
+
+        finally:
+            logs_directory = os.path.join(self.output_directory, 'logs')
+            if bundle and os.path.isdir(logs_directory):
+                archive.bundle_directory(logs_directory, os.path.join(self.output_directory, 'logs.tar.gz'))
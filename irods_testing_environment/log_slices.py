@@ -0,0 +1,205 @@
+"""Cut the server logs of the containers into one slice per test as the tests run.
+
+The collected `irods.log` of a container is one undifferentiated file covering every test run on
+it, and can grow to gigabytes over a core test run. A `log_indexer` records the size of each
+watched container's server log when a test starts, and when the test ends it reads back what was
+written since and saves that as the test's slice:
+
+    log_slices/<container name>/<sequence number>_<test name>.log
+
+Each slice is also recorded as a line of JSON appended to `log_slices/index.jsonl`, along with the
+test, the executor which ran it, its start and end times, whether it passed, and the byte offsets of
+the slice in the server log, so a failed test's part of the log can be found without grepping the
+whole file.
+
+Tests which run at the same time against the same server interleave in its log, so a slice holds
+everything the server logged while its test ran, not only what that test caused.
+"""
+
+# grown-up modules
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+
+# local modules
+from . import execute
+from . import logs
+
+INDEX_FILENAME = 'index.jsonl'
+
+
+def server_log_path(container):
+    """Return the path to the server log in `container`, or None if the iRODS version does not have one.
+
+    Before iRODS 4.3, the server log is rotated into a new file every few days, so there is no single
+    file to slice.
+
+    Arguments:
+    container -- container running iRODS
+    """
+    from . import irods_config
+
+    major, minor, patch = irods_config.get_irods_version(container)
+
+    if minor < 3:
+        return None
+
+    return os.path.join(logs.log_directory_for_version((major, minor, patch)), 'irods.log')
+
+
+class log_indexer(object):
+    """Records the offsets in the server logs at test boundaries and saves the log of each test."""
+
+    def __init__(self, docker_client, output_directory, containers_by_executor=None):
+        """Construct a log_indexer.
+
+        Arguments:
+        docker_client -- the Docker client which communicates with the daemon
+        output_directory -- job output directory under which `log_slices` is created
+        containers_by_executor -- dict of executing container names to the containers whose server
+                                  logs are sliced for the tests run on that executor (default: each
+                                  executor's own server log)
+        """
+        self.directory = os.path.join(output_directory, 'log_slices')
+        self.containers_by_executor = {
+            name: [docker_client.containers.get(c.name) for c in containers]
+            for name, containers in (containers_by_executor or dict()).items()
+        }
+
+        self.sequence_numbers = itertools.count(1)
+        self.lock = threading.Lock()
+
+        # container name -> path to the server log, or None if it cannot be sliced
+        self.log_paths = dict()
+
+
+    def watched_containers(self, executor):
+        """Return the containers whose server logs are sliced for tests run on `executor`."""
+        return self.containers_by_executor.get(executor.name, [executor])
+
+
+    def log_path(self, container):
+        """Return the path to the server log in `container`, or None if it cannot be sliced."""
+        if container.name not in self.log_paths:
+            path = server_log_path(container)
+
+            if path is None:
+                logging.info('[{}]: server log cannot be sliced for this version of iRODS'.format(container.name))
+
+            self.log_paths[container.name] = path
+
+        return self.log_paths[container.name]
+
+
+    def size_of_log(self, container):
+        """Return the size in bytes of the server log in `container` (0 if it does not exist yet)."""
+        ec, output = execute.get_command_output(container, ['stat', '-c', '%s', self.log_path(container)])
+
+        return int(output.decode('utf-8').strip()) if ec == 0 else 0
+
+
+    def mark(self, executor):
+        """Return the offsets in the watched server logs at the start of a test run on `executor`.
+
+        Returns:
+            A dict of container names to offsets, to be passed to `record` when the test ends.
+        """
+        offsets = dict()
+
+        for c in self.watched_containers(executor):
+            try:
+                if self.log_path(c):
+                    offsets[c.name] = self.size_of_log(c)
+
+            except Exception as e:
+                logging.warning('[{}]: failed to find the offset in the server log: {}'.format(c.name, e))
+
+        return offsets
+
+
+    def read_from(self, container, offset):
+        """Return the start and end offsets and the contents of the server log in `container` after `offset`.
+
+        If the log is now shorter than `offset`, it was truncated or replaced during the test, so it is
+        read from the start.
+        """
+        path = self.log_path(container)
+
+        # The size comes first, on a line of its own. A log which does not exist (yet) is empty.
+        script = '[ -e "$0" ] || {{ echo 0; exit 0; }}; stat -c %s "$0" && tail -c +{} "$0"'.format(offset + 1)
+
+        ec, output = execute.get_command_output(container, ['sh', '-c', script, path])
+        if ec != 0:
+            raise RuntimeError('[{}] failed to read [{}] from offset [{}]'.format(container.name, path, offset))
+
+        size, _, data = output.partition(b'\n')
+
+        if int(size) < offset:
+            return self.read_from(container, 0)
+
+        return offset, offset + len(data), data
+
+
+    def slice_filename(self, sequence_number, test):
+        """Return the name of the file holding the slice of the log for the `sequence_number`th test."""
+        return '{:04d}_{}.log'.format(sequence_number, re.sub(r'[^\w.-]', '_', test or 'all_tests'))
+
+
+    def record(self, executor, test, offsets, start_time, end_time, return_code):
+        """Save the slices of the watched server logs for a test which has ended and add them to the index.
+
+        Failures are logged rather than raised so that they do not affect the test run.
+
+        Arguments:
+        executor -- container on which the test ran
+        test -- name of the test (None means all tests)
+        offsets -- offsets returned by `mark` at the start of the test
+        start_time -- epoch time at which the test started
+        end_time -- epoch time at which the test ended
+        return_code -- return code of the test
+        """
+        with self.lock:
+            sequence_number = next(self.sequence_numbers)
+
+        for c in self.watched_containers(executor):
+            if c.name not in offsets:
+                continue
+
+            try:
+                start_offset, end_offset, data = self.read_from(c, offsets[c.name])
+
+                path = os.path.join(self.directory, c.name, self.slice_filename(sequence_number, test))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+                self.add_to_index({
+                    'test': test,
+                    'executor': executor.name,
+                    'container': c.name,
+                    'server_log': self.log_path(c),
+                    'start_time': start_time,
+                    'end_time': end_time,
+                    'passed': return_code == 0,
+                    'return_code': return_code,
+                    'start_offset': start_offset,
+                    'end_offset': end_offset,
+                    'slice': os.path.relpath(path, self.directory)
+                })
+
+            except Exception as e:
+                logging.warning('[{}]: failed to slice the server log for [{}]: {}'.format(c.name, test, e))
+
+
+    def add_to_index(self, entry):
+        """Append `entry` to `log_slices/index.jsonl` as a line of JSON."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        line = json.dumps(entry)
+
+        with self.lock, open(os.path.join(self.directory, INDEX_FILENAME), 'a') as f:
+            f.write(line + '\n')
@@ -46,24 +46,51 @@ def log_directory_for_version(version):
     raise NotImplementedError('the detected iRODS version does not exist yet')
 
 
-def collect_logs(docker_client, containers, output_directory):
-    """Collect logs from known locations for iRODS log files.
+def paths_to_logs(docker_client, containers):
+    """Return the paths to the iRODS log directories in `containers`, based on the version of iRODS in the first.
 
     Arguments:
     docker_client -- the Docker client which communicates with the daemon
-    containers -- list of containers from which logs will be collected
-    output_directory -- directory on host into which log files will be collected
+    containers -- list of containers running the same version of iRODS
     """
     from . import irods_config
 
-    archive.collect_files_from_containers(docker_client,
-                                          containers,
-                                          [os.path.join(context.irods_home(), 'log')],
-                                          output_directory)
+    paths = [os.path.join(context.irods_home(), 'log')]
 
     major, minor, patch = irods_config.get_irods_version(docker_client.containers.get(containers[0].name))
     if minor > 2:
-        archive.collect_files_from_containers(docker_client,
-                                              containers,
-                                              [log_directory_for_version((major,minor,patch))],
-                                              output_directory)
+        paths.append(log_directory_for_version((major,minor,patch)))
+
+    return paths
+
+
+def collect_logs(docker_client, containers, output_directory,
+                 extra_paths=None, extra_paths_containers=None, bundle=False):
+    """Collect logs from known locations for iRODS log files.
+
+    The log directories and `extra_paths` are copied from all of the containers at once into
+    `logs/<container name>` in `output_directory`.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    containers -- list of containers from which logs will be collected
+    output_directory -- directory on host into which log files will be collected
+    extra_paths -- other paths in the containers to collect along with the logs (e.g. test reports)
+    extra_paths_containers -- containers from which `extra_paths` are collected (default: `containers`)
+    bundle -- if True, the collected files are compressed into `logs.tar.gz` in `output_directory`
+              instead of being left in a `logs` directory
+    """
+    paths = paths_to_logs(docker_client, containers)
+
+    paths_by_container = {c.name: (c, list(paths)) for c in containers}
+
+    for c in (containers if extra_paths_containers is None else extra_paths_containers):
+        paths_by_container.setdefault(c.name, (c, list()))[1].extend(extra_paths or list())
+
+    try:
+        archive.collect_paths_from_containers(docker_client, dict(paths_by_container.values()), output_directory)
+
+    finally:
+        if bundle and os.path.isdir(os.path.join(output_directory, 'logs')):
+            archive.bundle_directory(os.path.join(output_directory, 'logs'),
+                                     os.path.join(output_directory, 'logs.tar.gz'))
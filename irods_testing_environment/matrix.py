@@ -0,0 +1,247 @@
+"""Run a test script against many Compose projects concurrently under a host resource budget.
+
+A full sweep covers every `projects/<platform>/<platform>-<database>` directory. Each project runs
+as its own invocation of a test script (e.g. `run_core_tests.py`) in a subprocess. A project is only
+started once its CPU and memory reservation fits in the global budget. When every project has
+finished, the results are written to a single report.
+"""
+
+# grown-up modules
+import concurrent.futures
+import fnmatch
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+COMPOSE_FILENAMES = ['docker-compose.yml', 'docker-compose.yaml', 'compose.yml', 'compose.yaml']
+
+REPORT_FILENAME = 'matrix_report.json'
+
+
+class matrix_project(object):
+    """A Compose project directory in the matrix and the platform and database it combines."""
+
+    def __init__(self, path, platform, database):
+        """Construct a matrix_project.
+
+        Arguments:
+        path -- absolute path to the Compose project directory
+        platform -- name of the platform directory containing the project (e.g. ubuntu-22.04)
+        database -- the rest of the project directory name (e.g. postgres-14)
+        """
+        self.path = path
+        self.platform = platform
+        self.database = database
+
+    @property
+    def name(self):
+        """Return the name of the project directory."""
+        return os.path.basename(self.path)
+
+
+def discover_projects(projects_directory, platforms=None, databases=None):
+    """Return the Compose projects under `projects_directory`, sorted by name.
+
+    Arguments:
+    projects_directory -- path to the directory holding one directory per platform
+    platforms -- glob patterns; only projects for matching platforms are returned (default: all)
+    databases -- glob patterns; only projects for matching databases are returned (default: all)
+    """
+    def matches(name, patterns):
+        return not patterns or any(fnmatch.fnmatch(name, p) for p in patterns)
+
+    projects = list()
+
+    for platform in sorted(os.listdir(projects_directory)):
+        platform_directory = os.path.join(projects_directory, platform)
+        if not os.path.isdir(platform_directory) or not matches(platform, platforms):
+            continue
+
+        for name in sorted(os.listdir(platform_directory)):
+            path = os.path.join(platform_directory, name)
+
+            if not any(os.path.exists(os.path.join(path, f)) for f in COMPOSE_FILENAMES):
+                continue
+
+            database = name[len(platform) + 1:] if name.startswith(platform + '-') else name
+            if not matches(database, databases):
+                continue
+
+            projects.append(matrix_project(os.path.abspath(path), platform, database))
+
+    return projects
+
+
+def host_memory_bytes():
+    """Return the total physical memory of the host in bytes."""
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+class resource_budget(object):
+    """Counting reservations of CPUs and memory which block until they fit within the budget."""
+
+    def __init__(self, cpus, memory_bytes):
+        """Construct a resource_budget.
+
+        Arguments:
+        cpus -- number of CPUs which may be reserved at once
+        memory_bytes -- number of bytes of memory which may be reserved at once
+        """
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self.cpus_in_use = 0
+        self.memory_bytes_in_use = 0
+        self.condition = threading.Condition()
+
+    def _clamp(self, cpus, memory_bytes):
+        # A job which needs more than the whole budget would never start, so let it run on its own instead.
+        return min(cpus, self.cpus), min(memory_bytes, self.memory_bytes)
+
+    def acquire(self, cpus, memory_bytes):
+        """Block until `cpus` and `memory_bytes` fit in the budget, then reserve them."""
+        cpus, memory_bytes = self._clamp(cpus, memory_bytes)
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.cpus_in_use + cpus <= self.cpus and
+                                            self.memory_bytes_in_use + memory_bytes <= self.memory_bytes)
+            self.cpus_in_use += cpus
+            self.memory_bytes_in_use += memory_bytes
+
+    def release(self, cpus, memory_bytes):
+        """Return a reservation made by `acquire` to the budget."""
+        cpus, memory_bytes = self._clamp(cpus, memory_bytes)
+
+        with self.condition:
+            self.cpus_in_use -= cpus
+            self.memory_bytes_in_use -= memory_bytes
+            self.condition.notify_all()
+
+
+def substitute(script_args, project):
+    """Return `script_args` with {platform}, {database}, and {project} replaced for `project`."""
+    return [a.replace('{platform}', project.platform)
+             .replace('{database}', project.database)
+             .replace('{project}', project.name)
+            for a in script_args]
+
+
+def run_project(project, script, script_args, output_directory, budget, cpus, memory_bytes):
+    """Run `script` against `project` once its reservation fits in `budget` and return its result.
+
+    Arguments:
+    project -- the matrix_project to run
+    script -- path to the test script to run (e.g. run_core_tests.py)
+    script_args -- arguments for the script; see `substitute`
+    output_directory -- directory under which the project's output directory is made
+    budget -- resource_budget shared by every project in the matrix
+    cpus -- number of CPUs to reserve for the project
+    memory_bytes -- bytes of memory to reserve for the project
+    """
+    project_output_directory = os.path.join(output_directory, project.name)
+    os.makedirs(project_output_directory, exist_ok=True)
+
+    cmd = [sys.executable, script,
+           '--project-directory', project.path,
+           '--output-directory', project_output_directory,
+           *substitute(script_args, project)]
+
+    budget.acquire(cpus, memory_bytes)
+
+    try:
+        logging.warning(f'starting [{project.name}]')
+        logging.debug(f'[{project.name}] {cmd}')
+
+        start = time.monotonic()
+
+        with open(os.path.join(project_output_directory, 'matrix_output.log'), 'w') as f:
+            rc = subprocess.run(cmd, stdout=f, stderr=subprocess.STDOUT,
+                                cwd=os.path.dirname(os.path.abspath(script))).returncode
+
+        duration = time.monotonic() - start
+
+    finally:
+        budget.release(cpus, memory_bytes)
+
+    logging.warning(f'finished [{project.name}] rc:[{rc}] duration:[{duration:.1f}s]')
+
+    return {
+        'project': project.name,
+        'platform': project.platform,
+        'database': project.database,
+        'return_code': rc,
+        'duration': duration,
+        'output_directory': project_output_directory,
+    }
+
+
+def run_matrix(projects, script, script_args, output_directory, budget, cpus_per_job, memory_bytes_per_job):
+    """Run `script` against every project concurrently within `budget` and write the combined report.
+
+    Returns 0 if the script succeeded for every project. Otherwise, returns 1.
+
+    Arguments:
+    projects -- the matrix_projects to run
+    script -- path to the test script to run (e.g. run_core_tests.py)
+    script_args -- arguments for the script; see `substitute`
+    output_directory -- directory under which each project's output directory and the report are made
+    budget -- resource_budget shared by every project in the matrix
+    cpus_per_job -- number of CPUs to reserve for each project
+    memory_bytes_per_job -- bytes of memory to reserve for each project
+    """
+    results = list()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(projects))) as executor:
+        futures_to_projects = {
+            executor.submit(run_project, p, script, script_args, output_directory,
+                            budget, cpus_per_job, memory_bytes_per_job): p
+            for p in projects
+        }
+
+        for f in concurrent.futures.as_completed(futures_to_projects):
+            project = futures_to_projects[f]
+
+            try:
+                results.append(f.result())
+
+            except Exception as e:
+                logging.error(f'exception raised while running [{project.name}]: {e}')
+
+                results.append({
+                    'project': project.name,
+                    'platform': project.platform,
+                    'database': project.database,
+                    'return_code': None,
+                    'duration': None,
+                    'output_directory': None,
+                    'error': str(e),
+                })
+
+    results.sort(key=lambda r: r['project'])
+
+    write_report(results, os.path.join(output_directory, REPORT_FILENAME))
+
+    return 0 if all(r['return_code'] == 0 for r in results) else 1
+
+
+def write_report(results, path):
+    """Write `results` from `run_matrix` to `path` as JSON and log a summary of them."""
+    with open(path, 'w') as f:
+        json.dump({'results': results}, f, indent=4)
+
+    width = max([len(r['project']) for r in results] + [len('project')])
+
+    logging.error(f'{"project":<{width}}  {"rc":>4}  {"duration":>10}')
+    for r in results:
+        duration = '-' if r['duration'] is None else f'{r["duration"]:.1f}s'
+        logging.error(f'{r["project"]:<{width}}  {str(r["return_code"]):>4}  {duration:>10}')
+
+    failed = [r['project'] for r in results if r['return_code'] != 0]
+    logging.error(f'[{len(results) - len(failed)}] of [{len(results)}] projects passed')
+    if failed:
+        logging.error(f'failed projects: {failed}')
+
+    logging.error(f'report written to [{path}]')
@@ -22,11 +22,26 @@ def restore_file(container, file_path):
 
 
 def configure_tls_in_client(container, client_tls_negotiation, irods_env=None):
-    env = irods_env or json_utils.get_json_from_file(container,
-                                                     context.service_account_irods_env())
+    """Set the irods_client_server_policy in the service account's irods_environment.json.
+
+    Arguments:
+    container -- the docker.Container running the iRODS server
+    client_tls_negotiation -- the policy (e.g. CS_NEG_REQUIRE)
+    irods_env -- json_utils.json_file_editor for irods_environment.json to which the change is
+                 added, to be committed by the caller, or the contents of the file as a dict, which
+                 are written back with the change right away (default: the file is read and written
+                 right away)
+    """
+    env = irods_env
+    if env is None:
+        env = json_utils.json_file_editor(container, context.service_account_irods_env())
 
     env['irods_client_server_policy'] = client_tls_negotiation
-    json_utils.put_json_to_file(container, context.service_account_irods_env(), env)
+
+    if irods_env is None:
+        env.commit()
+    elif not isinstance(irods_env, json_utils.json_file_editor):
+        json_utils.put_json_to_file(container, context.service_account_irods_env(), irods_env)
 
 
 def configure_tls_in_server(container, server_tls_negotiation):
@@ -59,7 +74,19 @@ def show_configurations(container, stream_output=False):
 
 
 def configure_negotiation_key(container, negotiation_key, server_config=None):
-    config = server_config or json_utils.get_json_from_file(container, context.server_config())
+    """Set (or remove, if `negotiation_key` is None) the negotiation_key in server_config.json.
+
+    Arguments:
+    container -- the docker.Container running the iRODS server
+    negotiation_key -- the negotiation key, or None to remove it
+    server_config -- json_utils.json_file_editor for server_config.json to which the change is
+                     added, to be committed by the caller, or the contents of the file as a dict,
+                     which are written back with the change right away (default: the file is read
+                     and written right away)
+    """
+    config = server_config
+    if config is None:
+        config = json_utils.json_file_editor(container, context.server_config())
 
     if negotiation_key is not None:
         logging.info('adding "negotiation_key" [{}] to config'.format(negotiation_key))
@@ -68,4 +95,7 @@ def configure_negotiation_key(container, negotiation_key, server_config=None):
         logging.info('deleting "negotiation_key" from config')
         del config['negotiation_key']
 
-    json_utils.put_json_to_file(container, context.server_config(), config)
+    if server_config is None:
+        config.commit()
+    elif not isinstance(server_config, json_utils.json_file_editor):
+        json_utils.put_json_to_file(container, context.server_config(), server_config)
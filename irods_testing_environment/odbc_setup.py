@@ -654,8 +654,7 @@ def configure_mariadb_odbc_driver_apt(csp_container, odbc_driver, package_url):
         odbc_driver = download_mysql_odbc_driver(package_url)
     odbc_driver = os.path.abspath(odbc_driver)
 
-    odbc_driver_archive = archive.create_archive([odbc_driver])
-    archive.copy_archive_to_container(csp_container, odbc_driver_archive)
+    archive.copy_members_to_container(csp_container, [odbc_driver])
 
     execute.execute_command(csp_container, 'apt-get update')
     execute.execute_command(csp_container, 'apt-get install {}'.format(odbc_driver))
@@ -678,8 +677,7 @@ def configure_mariadb_odbc_driver_dnf(csp_container, odbc_driver, package_url):
         odbc_driver = download_mysql_odbc_driver(package_url)
     odbc_driver = os.path.abspath(odbc_driver)
 
-    odbc_driver_archive = archive.create_archive([odbc_driver])
-    archive.copy_archive_to_container(csp_container, odbc_driver_archive)
+    archive.copy_members_to_container(csp_container, [odbc_driver])
 
     execute.execute_command(csp_container, 'dnf install -y {}'.format(odbc_driver))
 
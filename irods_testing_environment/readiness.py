@@ -0,0 +1,258 @@
+# grown-up modules
+import asyncio
+import errno
+import logging
+import random
+import socket
+import time
+
+# local modules
+from . import async_executor
+from . import execute
+
+class probe(object):
+    """'Base class' for readiness probes.
+
+    A probe answers one question - is the service ready yet? - as cheaply as it can. Probes do not
+    retry or sleep; `wait_until_ready` does that for them.
+
+    This class should not be instantiated directly.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def check(self):
+        """Return True if the service is ready.
+
+        This method must be overridden.
+        """
+        raise NotImplementedError('method not implemented for readiness probe')
+
+
+class tcp_probe(probe):
+    """Probe which connects to a TCP port from the host, without going through the Docker daemon."""
+    def __init__(self, address, port, connect_timeout=0.5, fallback=None):
+        """Construct a tcp_probe.
+
+        Arguments:
+        address -- IP address of the service (usually the container's address on the project network)
+        port -- TCP port on which the service listens
+        connect_timeout -- seconds to wait for a connection before giving up on this attempt
+        fallback -- probe used from then on if the host cannot route to `address` (e.g. when the
+                    Docker daemon runs in a VM and container addresses are not reachable from here)
+        """
+        super(tcp_probe, self).__init__('tcp [{}:{}]'.format(address, port))
+        self.address = address
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.fallback = fallback
+        self.unreachable = False
+
+    def check(self):
+        if self.unreachable:
+            return self.fallback.check()
+
+        try:
+            with socket.create_connection((self.address, self.port), timeout=self.connect_timeout):
+                return True
+
+        except ConnectionRefusedError:
+            # The address is reachable and nothing is listening on it yet.
+            return False
+
+        except OSError as e:
+            # A service which is still starting refuses connections; it does not time out. Timeouts
+            # and routing errors mean the address cannot be reached from the host at all.
+            if not isinstance(e, socket.timeout) and \
+               e.errno not in (errno.ENETUNREACH, errno.EHOSTUNREACH, errno.ETIMEDOUT):
+                return False
+
+            if self.fallback is None:
+                raise RuntimeError('[{}] cannot reach [{}:{}] from the host'
+                                   .format(self.name, self.address, self.port)) from e
+
+            logging.info('[{}] cannot reach [{}:{}] from the host, using [{}] instead'
+                         .format(self.name, self.address, self.port, self.fallback.name))
+
+            self.unreachable = True
+            return self.fallback.check()
+
+
+class container_tcp_probe(probe):
+    """Probe which connects to a TCP port from inside another container with docker exec."""
+    def __init__(self, container, address, port, python='python3'):
+        """Construct a container_tcp_probe.
+
+        Arguments:
+        container -- docker.Container from which the connection is attempted
+        address -- IP address of the service as seen from `container`
+        port -- TCP port on which the service listens
+        python -- python interpreter in `container`
+        """
+        super(container_tcp_probe, self).__init__('tcp [{}:{}] from [{}]'.format(address, port, container.name))
+        socket_cmd = str('import socket; '
+            's = socket.socket(socket.AF_INET, socket.SOCK_STREAM); '
+            f'ec = s.connect_ex((\'{address}\', {port})); '
+            's.close(); print(ec); exit(ec)'
+        )
+        self.container = container
+        self.command = ' '.join([python, '-c', f'"{socket_cmd}"'])
+
+    def check(self):
+        return execute.execute_command(self.container, self.command) == 0
+
+
+class healthcheck_probe(probe):
+    """Probe which reads the status of the HEALTHCHECK configured for a container.
+
+    Containers without a healthcheck are considered ready, leaving the question to the other probes.
+    """
+    def __init__(self, container):
+        """Construct a healthcheck_probe.
+
+        Arguments:
+        container -- docker.Container whose health status is read
+        """
+        super(healthcheck_probe, self).__init__('healthcheck [{}]'.format(container.name))
+        self.container = container
+
+    def check(self):
+        self.container.reload()
+
+        health = self.container.attrs.get('State', dict()).get('Health')
+        if health is None:
+            return True
+
+        return health.get('Status') == 'healthy'
+
+
+class command_probe(probe):
+    """Probe which runs a command in a container and checks that it succeeds (e.g. pg_isready)."""
+    def __init__(self, container, command, user=''):
+        """Construct a command_probe.
+
+        Arguments:
+        container -- docker.Container in which the command is run
+        command -- command which exits with 0 once the service is ready
+        user -- the user whose identity will be assumed when running the command (default: root)
+        """
+        super(command_probe, self).__init__('[{}] in [{}]'.format(command.split()[0], container.name))
+        self.container = container
+        self.command = command
+        self.user = user
+
+    def check(self):
+        return execute.execute_command(self.container, self.command, user=self.user) == 0
+
+
+def backoff_delays(initial_delay=0.05, max_delay=2.0, multiplier=2.0):
+    """Generate the seconds to sleep between attempts: exponential backoff with jitter.
+
+    Each delay is drawn from the upper half of the current backoff interval, so concurrent waiters
+    spread out instead of polling in lockstep, and no delay is ever shorter than half the interval.
+
+    Arguments:
+    initial_delay -- seconds in the first backoff interval
+    max_delay -- largest backoff interval in seconds
+    multiplier -- factor by which the backoff interval grows after each attempt
+    """
+    delay = initial_delay
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(max_delay, delay * multiplier)
+
+
+def check_all(probes):
+    """Return the first probe which is not ready, or None if every probe is ready.
+
+    Probes are checked in order and the rest are skipped once one is not ready, so cheap probes
+    should come first. A probe which raises an exception is not ready.
+
+    Arguments:
+    probes -- list of probes to check
+    """
+    for p in probes:
+        try:
+            if not p.check():
+                return p
+
+        except RuntimeError:
+            raise
+
+        except Exception as e:
+            logging.debug('[{}] probe raised an exception [{}]'.format(p.name, e))
+            return p
+
+    return None
+
+
+async def wait_until_ready_async(probes, timeout=60, description=None, **backoff_kwargs):
+    """Wait until every one of `probes` is ready. Asynchronous version of `wait_until_ready`.
+
+    The probes are run on the async_executor scheduler, and waiting between attempts does not hold
+    a thread, so many services can be waited on at once.
+
+    Arguments:
+    probes -- list of probes which must all be ready, cheapest first
+    timeout -- seconds to wait before giving up with a RuntimeError
+    description -- what is being waited on, for logging (default: the name of the first probe)
+    backoff_kwargs -- keyword arguments passed to `backoff_delays`
+    """
+    description = description or probes[0].name
+    deadline = time.monotonic() + timeout
+    attempts = 0
+
+    for delay in backoff_delays(**backoff_kwargs):
+        attempts = attempts + 1
+
+        not_ready = await async_executor.run_blocking(check_all, probes)
+        if not_ready is None:
+            logging.info('[{}] ready after [{}] attempts'.format(description, attempts))
+            return
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RuntimeError('[{}] not ready after [{}] seconds: [{}] did not pass'
+                               .format(description, timeout, not_ready.name))
+
+        logging.debug('[{}] not ready: [{}] did not pass, retrying in [{:.2f}] seconds'
+                      .format(description, not_ready.name, delay))
+
+        await asyncio.sleep(min(delay, remaining))
+
+
+def wait_until_ready(probes, timeout=60, description=None, **backoff_kwargs):
+    """Wait until every one of `probes` is ready, backing off exponentially between attempts.
+
+    Arguments:
+    probes -- list of probes which must all be ready, cheapest first
+    timeout -- seconds to wait before giving up with a RuntimeError
+    description -- what is being waited on, for logging (default: the name of the first probe)
+    backoff_kwargs -- keyword arguments passed to `backoff_delays`
+    """
+    async_executor.run(wait_until_ready_async(probes, timeout, description, **backoff_kwargs))
+
+
+async def wait_for_all_async(probes_by_description, timeout=60, **backoff_kwargs):
+    """Wait concurrently until the probes for every entry in `probes_by_description` are ready.
+
+    Raises a RuntimeError naming every service which did not become ready in time.
+
+    Arguments:
+    probes_by_description -- dict mapping a description of each service to its list of probes
+    timeout -- seconds to wait for each service before giving up
+    backoff_kwargs -- keyword arguments passed to `backoff_delays`
+    """
+    descriptions = list(probes_by_description)
+
+    results = await asyncio.gather(*[
+        wait_until_ready_async(probes_by_description[d], timeout, d, **backoff_kwargs)
+        for d in descriptions
+    ], return_exceptions=True)
+
+    errors = [(d, r) for d, r in zip(descriptions, results) if isinstance(r, BaseException)]
+    for d, e in errors:
+        logging.error(e)
+
+    if errors:
+        raise RuntimeError('services not ready [{}]'.format(', '.join(d for d, _ in errors)))
@@ -5,6 +5,7 @@ import os
 # local modules
 from . import context
 from . import irods_setup
+from . import task_graph
 from .install import install
 
 def create_topologies(ctx,
@@ -39,20 +40,42 @@ def create_topologies(ctx,
         context.irods_catalog_consumer_service(): consumer_count * zone_count
     })
 
+    # Each step runs as soon as the steps it needs are done, so a consumer whose packages are
+    # installed is set up as soon as its provider is rather than once every provider is.
+    graph = task_graph.task_graph()
+
+    dependencies_by_container = dict()
+
     if install_packages:
-        install.make_installer(ctx.platform_name()).install_irods_packages(
-                ctx,
-                externals_directory=externals_directory,
-                package_directory=package_directory,
-                package_version=package_version)
+        installer = install.make_installer(ctx.platform_name())
+
+        for c in ctx.compose_project.containers():
+            if context.is_catalog_database_container(c):
+                continue
+
+            dependencies_by_container[c.name] = [graph.add(
+                'install packages [{}]'.format(c.name),
+                lambda name=c.name: installer.install_irods_packages_on_container(
+                    ctx,
+                    name,
+                    externals_directory=externals_directory,
+                    package_directory=package_directory,
+                    package_version=package_version))]
 
     zone_names = [zone_name for i in range(zone_count)]
 
     # This should generate a list of identical zone infos
     zone_info_list = irods_setup.get_info_for_zones(ctx, zone_names, consumer_count)
 
-    irods_setup.setup_irods_zones(ctx, zone_info_list, odbc_driver=odbc_driver, **kwargs)
+    for z in zone_info_list:
+        irods_setup.add_zone_setup_tasks(graph,
+                                         ctx,
+                                         z,
+                                         dependencies_by_container=dependencies_by_container,
+                                         odbc_driver=odbc_driver,
+                                         **kwargs)
 
+    graph.run()
 
 def create_topology(ctx,
                     externals_directory=None,
@@ -114,8 +137,6 @@ def clone_repository_to_container(container,
 
     Repo.clone_from(url=url, to_path=repo_path, branch=branch)
 
-    archive.copy_archive_to_container(container,
-                                      archive.create_archive(
-                                            [os.path.abspath(repo_path)], repo_name))
+    archive.copy_members_to_container(container, [repo_path])
 
     return repo_path
@@ -0,0 +1,371 @@
+"""Snapshot and restore fully set-up Compose projects.
+
+Installing packages, running setup_irods.py, and configuring the servers for testing takes minutes
+per run. Once a project has been set up, `save_snapshot` commits every container in the project to an
+image and dumps the contents of the volumes they use to the host cache directory. A later run which
+would set up the project in the same way (same project, packages, and setup options - see
+`snapshot_key`) can call `restore_snapshot` to recreate the containers from those images instead.
+
+Restored containers keep the names, hostnames, IP addresses, network aliases, and Compose labels of
+the originals, so the iRODS configuration and catalog contents captured in the snapshot stay valid and
+`compose.project.Project` treats the containers as its own (e.g. `down` removes them as usual).
+"""
+
+# grown-up modules
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+# local modules
+from . import context
+from . import exec_session
+
+SNAPSHOT_IMAGE_REPOSITORY = 'irods_testing_environment_snapshot'
+
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def snapshot_key(project, package_directory=None, externals_directory=None, **setup_options):
+    """
+    Return a key identifying the state of a project after setting it up with the given inputs.
+
+    Arguments:
+        project: the compose.project.Project being set up
+        package_directory: path to the local directory containing the iRODS packages being installed
+        externals_directory: path to the local directory containing the iRODS externals packages being installed
+        **setup_options: any other inputs which affect the result of setup (e.g. zone and consumer counts)
+
+    Returns:
+        A hex string which changes whenever the project, its Dockerfiles, the packages, or the options change.
+    """
+    from . import archive_cache
+
+    project_dir = str(project.project_dir)
+
+    # The project's images are built from Dockerfiles in the parent directory of the Compose project.
+    dockerfiles = [
+        os.path.join(os.path.dirname(project_dir), f)
+        for f in ('Dockerfile', 'release.Dockerfile')
+        if os.path.exists(os.path.join(os.path.dirname(project_dir), f))
+    ]
+
+    h = hashlib.sha256()
+    h.update(project.name.encode('utf-8'))
+    h.update(archive_cache.archive_key([project_dir, *dockerfiles], use_digests=True).encode('utf-8'))
+
+    for d in (package_directory, externals_directory):
+        h.update(archive_cache.archive_key([d]).encode('utf-8') if d else b'-')
+
+    h.update(json.dumps(setup_options, sort_keys=True, default=str).encode('utf-8'))
+
+    return h.hexdigest()[:32]
+
+
+def snapshot_directory(key):
+    """Return the path to the directory on the host holding the manifest and volume dumps for `key`."""
+    return context.host_cache_directory('snapshots', key)
+
+
+def _image_tag(key, container_name):
+    return '-'.join([key, container_name.lower()])[:128]
+
+
+def _is_anonymous_volume(mount):
+    return mount.get('Type') == 'volume' and len(mount.get('Name', '')) == 64
+
+
+def _load_manifest(key):
+    path = os.path.join(snapshot_directory(key), MANIFEST_FILENAME)
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def snapshot_exists(docker_client, key):
+    """
+    Return True if a complete snapshot exists for `key`.
+
+    Arguments:
+        docker_client: the Docker client for communicating with the daemon
+        key: the snapshot key returned by `snapshot_key`
+
+    Returns:
+        True if the manifest, volume dumps, and images for `key` all exist. Otherwise, False.
+    """
+    import docker
+
+    manifest = _load_manifest(key)
+    if manifest is None:
+        return False
+
+    for c in manifest['containers']:
+        try:
+            docker_client.images.get(c['image'])
+
+        except docker.errors.ImageNotFound:
+            logging.info(f'snapshot image [{c["image"]}] is missing')
+            return False
+
+    return all(os.path.exists(os.path.join(snapshot_directory(key), v['archive']))
+               for v in manifest['volumes'])
+
+
+def save_snapshot(ctx, key):
+    """
+    Commit every container in the project and dump their volumes under the snapshot `key`.
+
+    The containers are paused while the snapshot is taken so that the catalog and the iRODS servers are
+    captured at the same point in time, and are unpaused afterwards.
+
+    Arguments:
+        ctx: context object which holds the Docker client and Compose project information
+        key: the snapshot key returned by `snapshot_key`
+    """
+    docker_client = ctx.docker_client
+    project_name = ctx.compose_project.name
+    network_name = project_name + '_default'
+
+    directory = snapshot_directory(key)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    containers = [docker_client.containers.get(c.name) for c in ctx.compose_project.containers()]
+
+    network = docker_client.networks.get(network_name).attrs
+
+    manifest = {
+        'project_name': project_name,
+        'network': {
+            'name': network_name,
+            'labels': network.get('Labels') or {},
+            'ipam': (network.get('IPAM') or {}).get('Config') or [],
+        },
+        'containers': [],
+        'volumes': [],
+    }
+
+    dumped_volumes = set()
+
+    logging.warning(f'saving snapshot [{key}] of project [{project_name}]')
+
+    for c in containers:
+        c.pause()
+
+    try:
+        for c in containers:
+            attrs = c.attrs
+
+            for m in attrs['Mounts']:
+                if m.get('Type') != 'volume' or m['Name'] in dumped_volumes:
+                    continue
+
+                archive_name = f'{c.name}{m["Destination"].replace("/", "_")}.tar'
+
+                logging.info(f'[{c.name}] dumping volume [{m["Name"]}] mounted at [{m["Destination"]}]')
+
+                bits, _ = c.get_archive(m['Destination'])
+                with open(os.path.join(directory, archive_name), 'wb') as f:
+                    for chunk in bits:
+                        f.write(chunk)
+
+                dumped_volumes.add(m['Name'])
+
+                volume = {
+                    'container': c.name,
+                    'destination': m['Destination'],
+                    'archive': archive_name,
+                    'anonymous': _is_anonymous_volume(m),
+                    'name': m['Name'],
+                    'labels': {},
+                }
+
+                if not volume['anonymous']:
+                    volume['labels'] = docker_client.volumes.get(m['Name']).attrs.get('Labels') or {}
+
+                manifest['volumes'].append(volume)
+
+            tag = _image_tag(key, c.name)
+
+            logging.info(f'[{c.name}] committing container to [{SNAPSHOT_IMAGE_REPOSITORY}:{tag}]')
+
+            c.commit(repository=SNAPSHOT_IMAGE_REPOSITORY, tag=tag, pause=False)
+
+            endpoint = attrs['NetworkSettings']['Networks'][network_name]
+
+            manifest['containers'].append({
+                'name': c.name,
+                'image': f'{SNAPSHOT_IMAGE_REPOSITORY}:{tag}',
+                'hostname': attrs['Config']['Hostname'],
+                'labels': attrs['Config']['Labels'],
+                'shm_size': attrs['HostConfig'].get('ShmSize'),
+                'ip_address': endpoint['IPAddress'],
+                'aliases': sorted(set((endpoint.get('Aliases') or []) + [attrs['Config']['Hostname']])),
+                'named_volumes': [
+                    {'name': m['Name'], 'destination': m['Destination']}
+                    for m in attrs['Mounts'] if m.get('Type') == 'volume' and not _is_anonymous_volume(m)
+                ],
+            })
+
+    finally:
+        for c in containers:
+            c.unpause()
+
+    # The manifest is written last, so a snapshot which failed part way through is never considered complete.
+    with open(os.path.join(directory, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, sort_keys=True, indent=4)
+
+    logging.warning(f'saved snapshot [{key}] of project [{project_name}]')
+
+
+def _create_network(docker_client, manifest):
+    import docker
+
+    network = manifest['network']
+
+    try:
+        docker_client.networks.get(network['name']).remove()
+    except docker.errors.NotFound:
+        pass
+
+    ipam = docker.types.IPAMConfig(pool_configs=[
+        docker.types.IPAMPool(subnet=p.get('Subnet'), gateway=p.get('Gateway'))
+        for p in network['ipam']
+    ])
+
+    docker_client.networks.create(network['name'], driver='bridge', ipam=ipam, labels=network['labels'])
+
+
+def _create_named_volumes(docker_client, manifest):
+    import docker
+
+    for v in manifest['volumes']:
+        if v['anonymous']:
+            continue
+
+        try:
+            docker_client.volumes.get(v['name']).remove(force=True)
+        except docker.errors.NotFound:
+            pass
+
+        docker_client.volumes.create(name=v['name'], labels=v['labels'])
+
+
+def _create_container(docker_client, manifest, c):
+    import docker
+
+    api = docker_client.api
+    network_name = manifest['network']['name']
+
+    host_config = api.create_host_config(
+        shm_size=c['shm_size'],
+        mounts=[docker.types.Mount(target=v['destination'], source=v['name'], type='volume')
+                for v in c['named_volumes']],
+    )
+
+    networking_config = api.create_networking_config({
+        network_name: api.create_endpoint_config(aliases=c['aliases'], ipv4_address=c['ip_address'])
+    })
+
+    api.create_container(image=c['image'],
+                         name=c['name'],
+                         hostname=c['hostname'],
+                         labels=c['labels'],
+                         host_config=host_config,
+                         networking_config=networking_config)
+
+    return docker_client.containers.get(c['name'])
+
+
+def restore_snapshot(ctx, key):
+    """
+    Recreate the containers of the project from the snapshot `key` and restart the iRODS servers in them.
+
+    Nothing is restored (and False is returned) if the snapshot does not exist or the project still has
+    containers, in which case the project should be set up normally.
+
+    Arguments:
+        ctx: context object which holds the Docker client and Compose project information
+        key: the snapshot key returned by `snapshot_key`
+
+    Returns:
+        True if the project was restored from the snapshot. Otherwise, False.
+    """
+    from . import irods_setup
+
+    docker_client = ctx.docker_client
+
+    if not snapshot_exists(docker_client, key):
+        logging.info(f'no snapshot found for key [{key}]')
+        return False
+
+    if ctx.compose_project.containers():
+        logging.warning(f'project [{ctx.compose_project.name}] has containers - not restoring snapshot [{key}]')
+        return False
+
+    manifest = _load_manifest(key)
+    directory = snapshot_directory(key)
+
+    logging.warning(f'restoring project [{ctx.compose_project.name}] from snapshot [{key}]')
+
+    # Sessions left over from the containers of the same names which were snapshotted (or removed
+    # since) run in containers which no longer exist.
+    for c in manifest['containers']:
+        exec_session.close_sessions_for_container(c['name'])
+
+    _create_network(docker_client, manifest)
+    _create_named_volumes(docker_client, manifest)
+
+    containers = {c['name']: _create_container(docker_client, manifest, c) for c in manifest['containers']}
+
+    # Volume contents must be in place before the containers start (e.g. so that the database server
+    # does not initialize a fresh data directory).
+    for v in manifest['volumes']:
+        logging.info(f'[{v["container"]}] restoring volume mounted at [{v["destination"]}]')
+
+        with open(os.path.join(directory, v['archive']), 'rb') as f:
+            if not containers[v['container']].put_archive(os.path.dirname(v['destination']), f):
+                raise RuntimeError(f'[{v["container"]}] failed to restore volume [{v["destination"]}]')
+
+    for c in containers.values():
+        c.start()
+
+    context.invalidate_inspection_index(ctx.compose_project.name)
+
+    # Processes do not survive a commit, so rsyslog and the iRODS servers need to be started again.
+    for c in ctx.irods_containers():
+        container = docker_client.containers.get(c.name)
+
+        irods_setup.configure_rsyslog(container)
+
+        if irods_setup.restart_irods(container) != 0:
+            raise RuntimeError(f'[{container.name}] failed to start iRODS server after restoring snapshot')
+
+    logging.warning(f'restored project [{ctx.compose_project.name}] from snapshot [{key}]')
+
+    return True
+
+
+def remove_snapshot(docker_client, key):
+    """
+    Remove the images and volume dumps making up the snapshot `key`.
+
+    Arguments:
+        docker_client: the Docker client for communicating with the daemon
+        key: the snapshot key returned by `snapshot_key`
+    """
+    import docker
+
+    manifest = _load_manifest(key)
+
+    for c in (manifest or {}).get('containers', []):
+        try:
+            docker_client.images.remove(c['image'])
+        except docker.errors.ImageNotFound:
+            pass
+
+    shutil.rmtree(snapshot_directory(key), ignore_errors=True)
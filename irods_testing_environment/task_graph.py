@@ -0,0 +1,158 @@
+"""A graph of setup tasks which runs each task as soon as the tasks it depends on are done.
+
+Setting up a project used to go phase by phase - install packages everywhere, then set up every
+catalog, then every provider, then every consumer - with each phase waiting for its slowest
+container. A task_graph instead takes the individual steps for each container along with what each
+step actually needs, and runs every step whose dependencies are done. The time to set up a project
+becomes the time of its longest chain of dependent steps rather than the sum of the slowest step in
+each phase.
+
+Tasks run on a thread pool of their own (not the async_executor scheduler), so a task may itself
+fan work out with async_executor.
+"""
+
+# grown-up modules
+import concurrent.futures
+import logging
+import time
+
+# local modules
+from . import tracing
+
+class task(object):
+    """A named step in a task_graph."""
+    def __init__(self, name, fn, dependencies):
+        self.name = name
+        self.fn = fn
+        self.dependencies = list(dependencies)
+        self.start_time = None
+        self.end_time = None
+
+
+class task_graph(object):
+    """A set of tasks and the dependencies between them."""
+    def __init__(self):
+        self.tasks = dict()
+
+    def add(self, name, fn, dependencies=None):
+        """Add a task and return its name.
+
+        Arguments:
+        name -- unique name of the task (e.g. 'install [project_irods-catalog-provider_1]')
+        fn -- callable run with no arguments to do the task; it fails by raising an exception
+        dependencies -- names of tasks which must succeed before this task starts
+        """
+        if name in self.tasks:
+            raise ValueError('task [{}] already in graph'.format(name))
+
+        self.tasks[name] = task(name, fn, dependencies or [])
+
+        return name
+
+    def _validate(self):
+        for t in self.tasks.values():
+            for d in t.dependencies:
+                if d not in self.tasks:
+                    raise ValueError('task [{}] depends on unknown task [{}]'.format(t.name, d))
+
+        # Repeatedly remove tasks whose dependencies have all been removed. Anything left over is
+        # part of a cycle.
+        remaining = {name: set(t.dependencies) for name, t in self.tasks.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError('dependency cycle among tasks [{}]'.format(', '.join(sorted(remaining))))
+
+            for name in ready:
+                del remaining[name]
+
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def critical_path(self):
+        """Return the chain of dependent tasks which took the longest, as a list of tasks, after `run`."""
+        finished = {name: t for name, t in self.tasks.items() if t.end_time is not None}
+
+        longest = dict()
+
+        def chain(t):
+            if t.name not in longest:
+                deps = [chain(finished[d]) for d in t.dependencies if d in finished]
+                longest[t.name] = max(deps, key=lambda c: c[-1].end_time, default=[]) + [t]
+            return longest[t.name]
+
+        return max((chain(t) for t in finished.values()), key=lambda c: c[-1].end_time, default=[])
+
+    def run(self, max_workers=None, fail_fast=False):
+        """Run every task once its dependencies have succeeded.
+
+        Tasks which depend (directly or not) on a failed task are skipped. With `fail_fast`, tasks
+        which have not started yet are skipped as soon as any task fails.
+
+        Arguments:
+        max_workers -- maximum number of tasks running at once (default: as many as are ready)
+        fail_fast -- if True, do not start any more tasks once one has failed
+
+        Raises:
+        RuntimeError -- if any task failed or was skipped
+        """
+        self._validate()
+
+        succeeded = set()
+        failed = set()
+        skipped = set()
+        waiting = dict(self.tasks)
+
+        start = time.monotonic()
+
+        def run_task(t):
+            t.start_time = time.monotonic()
+            try:
+                logging.info('starting task [{}]'.format(t.name))
+                with tracing.phase(t.name):
+                    return t.fn()
+            finally:
+                t.end_time = time.monotonic()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or max(1, len(self.tasks)),
+                                                   thread_name_prefix='task_graph') as executor:
+            futures_to_tasks = dict()
+
+            while waiting or futures_to_tasks:
+                for name, t in list(waiting.items()):
+                    if any(d in failed or d in skipped for d in t.dependencies) or (fail_fast and failed):
+                        logging.warning('skipping task [{}]'.format(name))
+                        skipped.add(name)
+                        del waiting[name]
+
+                    elif all(d in succeeded for d in t.dependencies):
+                        futures_to_tasks[executor.submit(run_task, t)] = t
+                        del waiting[name]
+
+                if not futures_to_tasks:
+                    # Skipping a task can make others skippable, so go around again.
+                    continue
+
+                done, _ = concurrent.futures.wait(futures_to_tasks,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for f in done:
+                    t = futures_to_tasks.pop(f)
+
+                    try:
+                        f.result()
+                        logging.info('task [{}] done in [{:.1f}] seconds'
+                                     .format(t.name, t.end_time - t.start_time))
+                        succeeded.add(t.name)
+
+                    except Exception as e:
+                        logging.error('task [{}] failed: {}'.format(t.name, e))
+                        failed.add(t.name)
+
+        path = self.critical_path()
+        logging.info('ran [{}] tasks in [{:.1f}] seconds, critical path [{}]'.format(
+            len(succeeded), time.monotonic() - start, ' -> '.join(t.name for t in path)))
+
+        if failed or skipped:
+            raise RuntimeError('failed tasks [{}], skipped tasks [{}]'
+                               .format(', '.join(sorted(failed)), ', '.join(sorted(skipped))))
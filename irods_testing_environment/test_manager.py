@@ -9,7 +9,8 @@ from . import test_runner
 class test_manager:
     """A class that manages a list of tests and `test_runners` for executing tests."""
 
-    def __init__(self, containers, tests, test_type='irods_python_suite'):
+    def __init__(self, containers, tests, test_type='irods_python_suite', timings=None, log_indexer=None,
+                 result_sink=None, retry_policy=None):
         """Constructor for `test_manager`.
 
         A note about passing `None` to `tests`:
@@ -24,12 +25,28 @@ class test_manager:
         containers -- list of containers which will be used to construct `test_runner`s
         tests -- list of tests which will run on the `test_runners`
         test_type -- a string representing the name of the class implementing the test_runner
+        timings -- a `test_timings.test_timings` store which records the duration of each test
+                   run and which may be used to order the tests (if None, nothing is recorded)
+        log_indexer -- a `log_slices.log_indexer` which saves the part of the server logs written
+                       during each test (if None, the logs are not sliced)
+        result_sink -- a `test_results.result_sink` in which each test event and the overall
+                       results are recorded as they happen (if None, nothing is recorded)
+        retry_policy -- a `test_retries.retry_policy` deciding whether and where failed tests are
+                        retried (if None, tests are not retried)
         """
         tr_name = '_'.join(['test_runner', test_type])
         tr = eval('.'.join(['test_runner', tr_name]))
 
         self.test_runners = [tr(c) for c in containers]
+
+        for r in self.test_runners:
+            r.log_indexer = log_indexer
+            r.result_sink = result_sink
+            r.retry_policy = retry_policy
+
+        self.result_sink = result_sink
         self.test_list = tests
+        self.timings = timings
         self.duration = -1
 
         logging.debug(f'tr:[{tr}], tests:[{tests}], runners:[{self.test_runners}]')
@@ -45,6 +62,11 @@ class test_manager:
         return [t for tr in self.test_runners for t in tr.failed_tests()]
 
 
+    def flaky_tests(self):
+        """Return a list of tests across the managed `test_runners` which passed only after being retried."""
+        return [t for tr in self.test_runners for t in tr.flaky_tests()]
+
+
     def return_code(self):
         """Return int representing the 'overall' return code from a test run.
 
@@ -56,39 +78,108 @@ class test_manager:
 
     def result_string(self):
         """Return string showing tests that passed and failed from each `test_runner.`"""
-        r = '==== begin test run results ====\n'
+        r = ['==== begin test run results ====\n']
         tests_were_skipped = False
         for tr in self.test_runners:
-            r = r + tr.result_string()
+            r.append(tr.result_string())
             tests_were_skipped = tests_were_skipped if tests_were_skipped else len(tr.skipped_tests()) > 0
 
         if self.return_code() != 0:
-            r = r + 'List of failed tests:\n\t{}\n'.format(' '.join([t or 'all tests' for t,_ in self.failed_tests()]))
-            r = r + 'Return code:[{}]\n'.format(self.return_code())
+            r.append('List of failed tests:\n\t{}\n'.format(
+                ' '.join([t or 'all tests' for t,_ in self.failed_tests()])))
+            r.append('Return code:[{}]\n'.format(self.return_code()))
 
         elif tests_were_skipped:
-            r = r + 'Some tests were skipped or did not complete...\n'
+            r.append('Some tests were skipped or did not complete...\n')
 
         else:
-            r = r + 'All tests passed! :)\n'
+            r.append('All tests passed! :)\n')
+
+        if self.flaky_tests():
+            r.append('List of flaky tests (passed on retry):\n\t{}\n'.format(
+                ' '.join([t or 'all tests' for t,_ in self.flaky_tests()])))
 
         if self.duration > 0:
             hours = int(self.duration / 60 / 60)
             minutes = self.duration / 60 - hours * 60
-            r = r + 'time elapsed: [{:>9.4f}]seconds ([{:>4d}]hours [{:>7.4f}]minutes)\n'.format(
-                    self.duration, hours, minutes)
+            r.append('time elapsed: [{:>9.4f}]seconds ([{:>4d}]hours [{:>7.4f}]minutes)\n'.format(
+                    self.duration, hours, minutes))
+
+        r.append('==== end of test run results ====\n')
+
+        return ''.join(r)
+
+
+    def ordered_test_list(self, order_by_duration=False):
+        """Return the list of tests in the order in which they should be queued.
+
+        If `order_by_duration` is True and historical timings are available, the tests are
+        ordered longest-processing-time-first so that the longest tests start early and the
+        short tests fill in the gaps on the other executors at the end of the run. Otherwise,
+        the tests are returned in the order in which they were provided.
+
+        Arguments:
+        order_by_duration -- if True, order the tests by their historical durations
+        """
+        if self.test_list is None:
+            return [None]
+
+        if not order_by_duration:
+            return list(self.test_list)
+
+        if not self.timings:
+            logging.warning('no test timings available - tests will run in the order provided')
+            return list(self.test_list)
+
+        return self.timings.sort_longest_first(self.test_list)
+
 
-        r = r + '==== end of test run results ====\n'
+    def fail_abandoned_retries(self, test_queue):
+        """Record as failed the tests which were still waiting in `test_queue` to be retried when the run ended.
 
-        return r
+        This happens when the executor for which a retry was left stops taking tests because of an error.
+        """
+        while True:
+            try:
+                t = test_queue.get(block=False)
+
+            except queue.Empty:
+                return
+
+            for tr in self.test_runners:
+                attempts = [a for a in tr.retried_tests() if a[0] == t]
+
+                if attempts:
+                    logging.error(f'[{tr.name()}]: test was not retried before the run ended [{t or "all tests"}]')
+
+                    tr.failed_tests().append(attempts[-1])
+                    tr.rc = tr.rc or 1
+
+                    break
+
+
+    def record_timings(self):
+        """Record and save the durations of the tests run by the managed `test_runners`."""
+        if self.timings is None:
+            return
+
+        for tr in self.test_runners:
+            self.timings.record_test_runner(tr)
+
+        try:
+            self.timings.save()
+
+        except OSError as e:
+            logging.warning(f'failed to save test timings [{self.timings.path}]: {e}')
 
 
-    def run(self, fail_fast=True, options=None, **kwargs):
+    def run(self, fail_fast=True, options=None, order_by_duration=False, **kwargs):
         """Run managed `test_runners` in parallel.
 
         Arguments:
-        fail_fast -- if True, the first test to fail ends the run
+        fail_fast -- if True, the first test to fail (on its last attempt) ends the run
         options -- A list of lists of strings representing options to pass to the scripts running tests
+        order_by_duration -- if True, queue the tests longest-first based on historical timings
         **kwargs -- keyword arguments to be passed to the `test_runner`'s specific `run` method
         """
         import concurrent.futures
@@ -103,44 +194,54 @@ class test_manager:
 
         test_queue = queue.Queue()
 
-        if self.test_list is None:
-            test_queue.put(None)
-        else:
-            for t in self.test_list:
-                test_queue.put(t)
+        for t in self.ordered_test_list(order_by_duration):
+            test_queue.put(t)
 
         start_time = time.time()
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_test_runners = {
-                executor.submit(
-                    tr.run,
-                    test_queue,
-                    fail_fast,
-                    options=options[i],
-                    **kwargs
-                ): tr for i, tr in enumerate(self.test_runners)
-            }
+        try:
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                futures_to_test_runners = {
+                    executor.submit(
+                        tr.run,
+                        test_queue,
+                        fail_fast,
+                        options=options[i],
+                        **kwargs
+                    ): tr for i, tr in enumerate(self.test_runners)
+                }
+
+                for f in concurrent.futures.as_completed(futures_to_test_runners):
+                    tr = futures_to_test_runners[f]
+
+                    try:
+                        f.result()
+
+                        if tr.rc is 0 and len(tr.failed_tests()) is 0:
+                            logging.error(f'[{tr.name()}]: tests completed successfully')
+                        else:
+                            logging.error(f'[{tr.name()}]: some tests failed')
+
+                    except Exception as e:
+                        logging.error(f'[{tr.name()}]: exception raised while running test')
+                        logging.error(e)
 
-            for f in concurrent.futures.as_completed(futures_to_test_runners):
-                tr = futures_to_test_runners[f]
+                        tr.rc = 1
 
-                try:
-                    f.result()
+                        if fail_fast: raise
 
-                    if tr.rc is 0 and len(tr.failed_tests()) is 0:
-                        logging.error(f'[{tr.name()}]: tests completed successfully')
-                    else:
-                        logging.error(f'[{tr.name()}]: some tests failed')
+                    finally:
+                        if self.result_sink:
+                            self.result_sink.executor_finished(tr)
 
-                except Exception as e:
-                    logging.error(f'[{tr.name()}]: exception raised while running test')
-                    logging.error(e)
+        finally:
+            end_time = time.time()
 
-                    tr.rc = 1
+            self.duration = end_time - start_time
 
-                    if fail_fast: raise
+            self.fail_abandoned_retries(test_queue)
 
-        end_time = time.time()
+            self.record_timings()
 
-        self.duration = end_time - start_time
+            if self.result_sink:
+                self.result_sink.summary(self)
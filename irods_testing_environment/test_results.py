@@ -0,0 +1,190 @@
+"""Record the results of a test run as JSON Lines while it runs, and merge the JUnit reports of the executors.
+
+`test_manager.result_string` is meant for people and is only logged once the run is over. A
+`result_sink` appends one JSON object per line to a file as things happen, so that dashboards can
+follow a run without parsing text:
+
+    {"event": "start", "time": 1700000000.0, "executor": "...", "test": "test_resource_types"}
+    {"event": "pass", "time": ..., "executor": "...", "test": "...", "duration": 12.3, "return_code": 0}
+    {"event": "fail", "time": ..., "executor": "...", "test": "...", "duration": 4.5, "return_code": 1}
+    {"event": "retry", "time": ..., "executor": "...", "test": "...", "duration": 4.5, "return_code": 1, "attempt": 1}
+    {"event": "executor_finished", "time": ..., "executor": "...", "return_code": 1, "duration": ..., ...}
+    {"event": "summary", "time": ..., "return_code": 1, "duration": ..., "passed": [...], "failed": [...], ...}
+
+A test of None means that the whole suite was run as one test. When tests are retried (see
+`test_retries`), each record of a test carries the number of the attempt, a failed attempt which is
+going to be retried is recorded as "retry" rather than "fail", and a test which passed on a later
+attempt is listed as "flaky" in the summary.
+
+Each executor writes its own JUnit reports (e.g. with `--xml_output`); `merge_junit_reports` copies
+them out of the containers (or takes the copies a `log_shipper` has shipped) and combines them into a
+single report for the job.
+"""
+
+# grown-up modules
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+# local modules
+from . import archive
+
+RESULTS_FILENAME = 'test_results.jsonl'
+JUNIT_REPORT_FILENAME = 'junit_report.xml'
+
+
+class result_sink(object):
+    """Appends a JSON record for each test event to a file."""
+
+    def __init__(self, path):
+        """Construct a result_sink which appends to the file at `path`.
+
+        Arguments:
+        path -- local path to the JSON Lines file (e.g. `test_results.jsonl` in the job output directory)
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+
+    def record(self, event, **fields):
+        """Append a record of `event` with the current time and `fields`.
+
+        Failures to write are logged rather than raised so that they do not affect the test run.
+        """
+        line = json.dumps(dict(event=event, time=time.time(), **fields))
+
+        try:
+            with self.lock, open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+        except OSError as e:
+            logging.warning(f'failed to record [{event}] in [{self.path}]: {e}')
+
+
+    def test_started(self, tr, test, attempt=1):
+        """Record that the `test_runner` `tr` started running `test`."""
+        self.record('start', executor=tr.name(), test=test, attempt=attempt)
+
+
+    def test_finished(self, tr, test, duration, return_code, attempt=1, retry=False):
+        """Record that an attempt at `test` passed or failed on the `test_runner` `tr`.
+
+        Arguments:
+        tr -- `test_runner` which ran the test
+        test -- name of the test
+        duration -- number of seconds the attempt took
+        return_code -- return code of the attempt
+        attempt -- number of the attempt (1 for the first)
+        retry -- True if the attempt failed and the test is going to be retried
+        """
+        event = 'retry' if retry else 'pass' if return_code == 0 else 'fail'
+
+        self.record(event,
+                    executor=tr.name(), test=test, duration=duration, return_code=return_code, attempt=attempt)
+
+
+    def executor_finished(self, tr):
+        """Record the results of the `test_runner` `tr` once it has stopped running tests."""
+        self.record('executor_finished',
+                    executor=tr.name(),
+                    return_code=tr.rc,
+                    duration=tr.duration,
+                    passed=len(tr.passed_tests()),
+                    failed=len(tr.failed_tests()),
+                    retried=len(tr.retried_tests()),
+                    flaky=len(tr.flaky_tests()),
+                    skipped=len(tr.skipped_tests()))
+
+
+    def summary(self, tm):
+        """Record the overall results of the `test_manager` `tm`."""
+        self.record('summary',
+                    return_code=tm.return_code(),
+                    duration=tm.duration,
+                    passed=[t for tr in tm.test_runners for t, _ in tr.passed_tests()],
+                    failed=[t for t, _ in tm.failed_tests()],
+                    flaky=[t for t, _ in tm.flaky_tests()],
+                    skipped=[t for tr in tm.test_runners for t in tr.skipped_tests()])
+
+
+def _merge_collected_junit_reports(directory, containers, report_directory, path_to_merged_report):
+    """Merge the JUnit reports of `containers` collected under `directory` (see `logs.collect_logs`)."""
+    merged = ET.Element('testsuites')
+    totals = dict.fromkeys(['tests', 'failures', 'errors', 'skipped'], 0)
+    total_time = 0.0
+    report_count = 0
+
+    for c in containers:
+        pattern = os.path.join(directory, 'logs', c.name, os.path.basename(os.path.normpath(report_directory)),
+                               '**', '*.xml')
+
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            try:
+                root = ET.parse(path).getroot()
+
+            except ET.ParseError as e:
+                logging.warning(f'[{c.name}]: ignoring unreadable JUnit report [{os.path.basename(path)}]: {e}')
+                continue
+
+            report_count += 1
+
+            # Only the top-level suites are taken, because the counts of a suite include those of the
+            # suites nested in it.
+            for suite in ([root] if root.tag == 'testsuite' else root.findall('testsuite')):
+                suite.set('hostname', c.name)
+
+                for key in totals:
+                    totals[key] += int(suite.get(key, 0))
+                total_time += float(suite.get('time', 0))
+
+                merged.append(suite)
+
+    for key, value in totals.items():
+        merged.set(key, str(value))
+    merged.set('time', '{:.3f}'.format(total_time))
+
+    ET.ElementTree(merged).write(path_to_merged_report, encoding='utf-8', xml_declaration=True)
+
+    logging.info(f'merged [{report_count}] JUnit reports into [{path_to_merged_report}]')
+
+    return report_count
+
+
+def merge_junit_reports(docker_client, containers, report_directory, path_to_merged_report, shipped_directory=None):
+    """Copy the JUnit reports out of `containers` and merge them into one report on the host.
+
+    The top-level `testsuite` elements of every report are gathered under one `testsuites` element
+    whose counts are the totals. Each suite's `hostname` is set to the name of the container which
+    ran it.
+
+    Arguments:
+    docker_client -- the Docker client which communicates with the daemon
+    containers -- containers which ran tests
+    report_directory -- directory in the containers holding the JUnit reports (`*.xml`)
+    path_to_merged_report -- local path to which the merged report is written
+    shipped_directory -- job output directory into which a `log_shipper` has already shipped
+                         `report_directory` from the containers, in which case the reports are
+                         merged from there instead of being copied out again (default: copy them)
+
+    Returns:
+        The number of reports which were merged.
+    """
+    if shipped_directory is not None:
+        return _merge_collected_junit_reports(shipped_directory, containers, report_directory, path_to_merged_report)
+
+    with tempfile.TemporaryDirectory() as d:
+        try:
+            archive.collect_paths_from_containers(docker_client, {c: [report_directory] for c in containers}, d)
+
+        except RuntimeError as e:
+            # Whatever was copied is still merged.
+            logging.warning(f'failed to copy some JUnit reports: {e}')
+
+        return _merge_collected_junit_reports(d, containers, report_directory, path_to_merged_report)
@@ -0,0 +1,129 @@
+"""Retry tests which fail, so that one intermittent failure does not fail (or end) a whole run.
+
+A `retry_policy` is shared by the `test_runner`s of a `test_manager`. A test which fails is put
+back on the test queue until it has been attempted `max_attempts` times, and it is only recorded as
+failed - and only ends the run under `fail_fast` - once its last attempt has failed. A test which
+fails and then passes on a later attempt is recorded as passed and reported as flaky.
+
+With `fresh_executor`, a test is not retried on an executor on which it has already failed as long
+as another executor which is still taking tests could run it instead, so that a failure caused by
+the state a test left behind in one server is not simply repeated.
+"""
+
+# grown-up modules
+import collections
+import logging
+import queue
+import threading
+
+
+class retry_policy(object):
+    """Tracks the attempts made at each test and decides which executor gets each test from the queue."""
+
+    def __init__(self, max_attempts=1, fresh_executor=False):
+        """Construct a retry_policy.
+
+        Arguments:
+        max_attempts -- number of times a test is run before it is recorded as failed (1 means no retries)
+        fresh_executor -- if True, retry tests on executors on which they have not failed yet when possible
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be at least 1')
+
+        self.max_attempts = max_attempts
+        self.fresh_executor = fresh_executor
+
+        # test -> list of (executor name, return code), one for each attempt which has finished
+        self.attempts = collections.defaultdict(list)
+
+        # names of the executors which are still taking tests from the queue
+        self.active_executors = set()
+
+        self.lock = threading.Lock()
+
+
+    def start(self, tr):
+        """Register the `test_runner` `tr` as taking tests from the queue."""
+        with self.lock:
+            self.active_executors.add(tr.name())
+
+
+    def stop(self, tr):
+        """Register the `test_runner` `tr` as no longer taking tests from the queue."""
+        with self.lock:
+            self.active_executors.discard(tr.name())
+
+
+    def attempt_number(self, test):
+        """Return the number of the next attempt at `test` (1 for the first)."""
+        with self.lock:
+            return len(self.attempts[test]) + 1
+
+
+    def failed_executors(self, test):
+        """Return the names of the executors on which `test` has failed."""
+        return {e for e, ec in self.attempts[test] if ec != 0}
+
+
+    def is_for_another_executor(self, tr, test):
+        """Return True if `test` should be left for an executor other than that of `tr`."""
+        if not self.fresh_executor:
+            return False
+
+        failed = self.failed_executors(test)
+
+        if tr.name() not in failed:
+            return False
+
+        return any(e not in failed for e in self.active_executors if e != tr.name())
+
+
+    def next_test(self, tr, test_queue):
+        """Return the next test from `test_queue` to run on the `test_runner` `tr`.
+
+        Tests which are to be retried on another executor are left in the queue.
+
+        Raises:
+            queue.Empty when there is nothing left in the queue for `tr`, after which `tr` is no
+            longer considered to be taking tests.
+        """
+        with self.lock:
+            left_for_others = list()
+
+            try:
+                while True:
+                    t = test_queue.get(block=False)
+
+                    if not self.is_for_another_executor(tr, t):
+                        return t
+
+                    left_for_others.append(t)
+
+            except queue.Empty:
+                self.active_executors.discard(tr.name())
+                raise
+
+            finally:
+                for t in left_for_others:
+                    test_queue.put(t)
+                    test_queue.task_done()
+
+
+    def record_attempt(self, tr, test, return_code):
+        """Record an attempt at `test` on the `test_runner` `tr` and return True if the test will be retried.
+
+        A test which will be retried is put back on the test queue by the caller.
+        """
+        with self.lock:
+            self.attempts[test].append((tr.name(), return_code))
+
+            attempt_count = len(self.attempts[test])
+
+        retry = return_code != 0 and attempt_count < self.max_attempts
+
+        if retry:
+            logging.warning(f'[{tr.name()}]: attempt [{attempt_count}] of [{self.max_attempts}] '
+                            f'at [{test or "all tests"}] failed - it will be retried')
+
+        return retry
+
@@ -29,9 +29,23 @@ class test_runner:
         self.passed = list()
         self.failed = list()
 
+        # Failed attempts at tests which were put back on the queue to be retried, and tests which
+        # passed only after being retried (these are also in the passed list).
+        self.retried = list()
+        self.flaky = list()
+
         # Start the duration time at -1 to indicate that no tests have run
         self.duration = -1
 
+        # A `log_slices.log_indexer` which saves the server log of each test (if None, nothing is saved)
+        self.log_indexer = None
+
+        # A `test_results.result_sink` in which each test event is recorded (if None, nothing is recorded)
+        self.result_sink = None
+
+        # A `test_retries.retry_policy` shared with the other `test_runner`s (if None, tests are not retried)
+        self.retry_policy = None
+
 
     def __str__(self):
         """Return a string representation of a map representing the data members."""
@@ -73,42 +87,57 @@ class test_runner:
         return self.failed
 
 
+    def retried_tests(self):
+        """Return the list of failed attempts at tests which were then retried."""
+        return self.retried
+
+
+    def flaky_tests(self):
+        """Return the list of tests which passed only after being retried."""
+        return self.flaky
+
+
     def skipped_tests(self):
         """Return the list of tests which have not been executed."""
-        executed_tests = [t for t,_ in self.passed_tests()] + [t for t,_ in self.failed_tests()]
+        executed_tests = {t for t,_ in self.passed_tests()} | {t for t,_ in self.failed_tests()} | \
+                         {t for t,_ in self.retried_tests()}
         return list(filter(lambda t: t not in executed_tests, self.test_list()))
 
 
     def result_string(self):
         """Return a string representing the results of running the test list."""
-        r = '-----\nresults for [{}]\n'.format(self.name())
+        r = ['-----\nresults for [{}]\n'.format(self.name())]
 
-        r = r + '\tpassed tests:\n'
+        r.append('\tpassed tests:\n')
         for test, duration in self.passed_tests():
             # TODO: a test list of type None may not indicate that all tests ran
-            r = r + '\t\t[[{:>9.4f}]s]\t[{}]\n'.format(duration, test or 'all tests')
+            r.append('\t\t[[{:>9.4f}]s]\t[{}]\n'.format(duration, test or 'all tests'))
+
+        r.append('\tflaky tests (passed on retry):\n')
+        for test, duration in self.flaky_tests():
+            r.append('\t\t[[{:>9.4f}]s]\t[{}]\n'.format(duration, test or 'all tests'))
 
-        r = r + '\tskipped tests:\n'
+        r.append('\tskipped tests:\n')
         for t in self.skipped_tests():
             # TODO: a test list of type None may not indicate that all tests ran
-            r = r + '\t\t[{}]\n'.format(t or 'all tests')
+            r.append('\t\t[{}]\n'.format(t or 'all tests'))
 
-        r = r + '\tfailed tests:\n'
+        r.append('\tfailed tests:\n')
         for test, duration in self.failed_tests():
             # TODO: a test list of type None may not indicate that all tests ran
-            r = r + '\t\t[[{:>9.4f}]s]\t[{}]\n'.format(duration, test or 'all tests')
+            r.append('\t\t[[{:>9.4f}]s]\t[{}]\n'.format(duration, test or 'all tests'))
 
-        r = r + '\treturn code:[{}]\n'.format(self.rc)
+        r.append('\treturn code:[{}]\n'.format(self.rc))
 
         if self.duration > 0:
             hours = int(self.duration / 60 / 60)
             minutes = self.duration / 60 - hours * 60
-            r = r + '\ttime elapsed: [{:9.4}]seconds ([{:4}]hours [{:9.4}]minutes)\n'.format(
-                self.duration, hours, minutes)
+            r.append('\ttime elapsed: [{:9.4}]seconds ([{:4}]hours [{:9.4}]minutes)\n'.format(
+                self.duration, hours, minutes))
 
-        r = r + '-----\n'
+        r.append('-----\n')
 
-        return r
+        return ''.join(r)
 
 
     def run(self, test_queue, fail_fast=True, **kwargs):
@@ -116,20 +145,34 @@ class test_runner:
 
         Arguments:
         test_queue -- the `Queue` tracking the tests being run by the `test_runner`s
-        fail_fast -- if True, the first test to fail ends the run
+        fail_fast -- if True, the first test to fail (on its last attempt) ends the run
         **kwargs -- keyword arguments for the specific `test_runner` implementation
         """
         run_start = time.time()
 
+        if self.retry_policy:
+            self.retry_policy.start(self)
+
         try:
             # TODO: python >=3.8 - Use while t := test_queue.get(block=False):
             while True:
                 # TODO: Consider block=True/Queue.join(). May butt heads with current design.
                 # Queue.get will raise queue.Empty when there is nothing in the queue.
-                t = test_queue.get(block=False)
+                if self.retry_policy:
+                    t = self.retry_policy.next_test(self, test_queue)
+                    attempt = self.retry_policy.attempt_number(t)
+                else:
+                    t = test_queue.get(block=False)
+                    attempt = 1
+
                 self.add_test(t)
 
-                logging.warning(f'[{self.name()}]: running test [{t}]')
+                logging.warning(f'[{self.name()}]: running test [{t}] (attempt [{attempt}])')
+
+                offsets = self.log_indexer.mark(self.executor) if self.log_indexer else None
+
+                if self.result_sink:
+                    self.result_sink.test_started(self, t, attempt=attempt)
 
                 start = time.time()
 
@@ -137,16 +180,35 @@ class test_runner:
 
                 end = time.time()
 
+                if self.log_indexer:
+                    self.log_indexer.record(self.executor, t, offsets, start, end, ec)
+
                 test_queue.task_done()
 
                 duration = end - start
 
                 logging.info(f'[{self.name()}]: cmd [{ec}] [{cmd}]')
 
-                if ec is 0:
+                retry = self.retry_policy.record_attempt(self, t, ec) if self.retry_policy else False
+
+                if self.result_sink:
+                    self.result_sink.test_finished(self, t, duration, ec, attempt=attempt, retry=retry)
+
+                if retry:
+                    self.retried_tests().append((t, duration))
+                    logging.error(f'[{self.name()}]: test failed [[{duration:>9.4f}]s] [{t or "all tests"}] - retrying')
+
+                    test_queue.put(t)
+
+                elif ec is 0:
                     self.passed_tests().append((t, duration))
                     logging.error(f'[{self.name()}]: test passed [[{duration:>9.4f}]s] [{t or "all tests"}]')
 
+                    if attempt > 1:
+                        self.flaky_tests().append((t, duration))
+                        logging.error(f'[{self.name()}]: test is flaky - passed on attempt [{attempt}] '
+                                      f'[{t or "all tests"}]')
+
                 else:
                     self.rc = ec
                     self.failed_tests().append((t, duration))
@@ -158,6 +220,10 @@ class test_runner:
         except queue.Empty:
             logging.info(f'[{self.name()}]: Queue is empty!')
 
+        finally:
+            if self.retry_policy:
+                self.retry_policy.stop(self)
+
         run_end = time.time()
 
         self.duration = run_end - run_start
@@ -268,7 +334,7 @@ class test_runner_irods_plugin_tests(test_runner):
 
         f = os.path.abspath(path_to_test_hook_on_host)
 
-        archive.copy_archive_to_container(self.executor, archive.create_archive([f]))
+        archive.copy_members_to_container(self.executor, [f])
 
         return f
 
@@ -310,7 +376,7 @@ class test_runner_irods_plugin_tests(test_runner):
 
         # Install irods_python_ci_utilities for the first test to run on this executor. This
         # will be true even if None is the test being run.
-        if len(self.passed_tests()) == 0 and len(self.failed_tests()) == 0:
+        if len(self.passed_tests()) == 0 and len(self.failed_tests()) == 0 and len(self.retried_tests()) == 0:
             from .install import install
 
             install.install_pip_package_from_repo(self.executor,
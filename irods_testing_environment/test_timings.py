@@ -0,0 +1,129 @@
+"""Persistent store of historical test durations used to schedule test runs."""
+
+# grown-up modules
+import json
+import logging
+import os
+import tempfile
+
+# local modules
+from . import context
+
+
+def default_directory():
+    """
+    Return the default directory in which test timing files are stored.
+
+    Returns:
+        Path to a directory under the user's cache directory (respects XDG_CACHE_HOME).
+    """
+    return context.host_cache_directory('test_timings')
+
+
+def path_to_timings_file(project_name, platform, directory=None, suite=None):
+    """
+    Return the path to the timings file for the given Compose project and platform.
+
+    Arguments:
+        project_name: name of the Compose project in which the tests run
+        platform: platform image tag of the containers running the tests (e.g. "ubuntu:22.04")
+        directory: directory in which the timings file lives (default: `default_directory()`)
+        suite: optional name distinguishing test suites run in the same project (e.g. "topology_consumer")
+
+    Returns:
+        Path to the JSON file holding the timings for this project and platform.
+    """
+    parts = [context.sanitize(project_name), context.sanitize(platform)]
+    if suite:
+        parts.append(context.sanitize(suite))
+    filename = '_'.join(parts) + '.json'
+    return os.path.join(directory or default_directory(), filename)
+
+
+class test_timings:
+    """A map of test names to the duration of their most recent run, backed by a JSON file."""
+
+    def __init__(self, path):
+        """Construct a `test_timings` object and load any timings already saved at `path`.
+
+        Arguments:
+        path -- path to the JSON file in which timings are persisted
+        """
+        self.path = path
+        self.timings = dict()
+
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as f:
+                self.timings = {str(t): float(d) for t, d in json.load(f).items()}
+
+        except (OSError, ValueError, AttributeError) as e:
+            # A corrupt or unreadable timings file only costs us the scheduling hint.
+            logging.warning(f'ignoring unreadable test timings file [{self.path}]: {e}')
+            self.timings = dict()
+
+
+    def __len__(self):
+        """Return the number of tests with a recorded duration."""
+        return len(self.timings)
+
+
+    def duration(self, test, default=None):
+        """Return the recorded duration in seconds for `test`, or `default` if there is none."""
+        return self.timings.get(test, default)
+
+
+    def record(self, test, duration):
+        """Record `duration` seconds as the most recent duration of `test`.
+
+        `None` (i.e. "all tests") is not a schedulable test and is not recorded.
+        """
+        if test is None:
+            return
+
+        self.timings[test] = float(duration)
+
+
+    def record_test_runner(self, tr):
+        """Record the duration of every passed and failed test run by the `test_runner` `tr`."""
+        for test, duration in tr.passed_tests() + tr.failed_tests():
+            self.record(test, duration)
+
+
+    def sort_longest_first(self, tests):
+        """Return `tests` ordered by recorded duration, longest first (LPT scheduling).
+
+        Tests without a recorded duration are placed at the front of the list in their original
+        order. Nothing is known about how long they will take, so the conservative choice is to
+        start them as early as possible rather than risk one of them becoming the long tail.
+
+        Arguments:
+        tests -- list of test names to order
+        """
+        unknown = [t for t in tests if self.duration(t) is None]
+        known = [t for t in tests if self.duration(t) is not None]
+
+        return unknown + sorted(known, key=lambda t: self.duration(t), reverse=True)
+
+
+    def save(self):
+        """Write the timings to `self.path`, replacing the existing file atomically."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.timings, f, sort_keys=True, indent=4)
+
+            os.replace(tmp_path, self.path)
+
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        logging.info(f'saved [{len(self.timings)}] test timings to [{self.path}]')
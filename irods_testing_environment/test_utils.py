@@ -50,7 +50,7 @@ def make_output_directory(dirname, basename):
 
     return directory
 
-def run_unit_tests(containers, test_list=None, fail_fast=True):
+def run_unit_tests(containers, test_list=None, fail_fast=True, log_indexer=None, result_sink=None, retry_policy=None):
     """Run a set of tests from the python test suite for iRODS.
 
     Arguments:
@@ -58,10 +58,14 @@ def run_unit_tests(containers, test_list=None, fail_fast=True):
     test_list -- a list of strings of the tests to be run
     options -- list of strings representing script options to pass to the run_tests.py script
     fail_fast -- if True, stop running after first failure; else, runs all tests
+    log_indexer -- `log_slices.log_indexer` which saves the server log of each test
+    result_sink -- `test_results.result_sink` in which the results are recorded as they happen
+    retry_policy -- `test_retries.retry_policy` deciding whether and where failed tests are retried
     """
     tests = test_list or get_unit_test_list(containers[0])
 
-    tm = test_manager.test_manager(containers, tests, test_type='irods_unit_tests')
+    tm = test_manager.test_manager(containers, tests, test_type='irods_unit_tests',
+                                   log_indexer=log_indexer, result_sink=result_sink, retry_policy=retry_policy)
 
     try:
         tm.run(fail_fast)
@@ -77,7 +81,10 @@ def run_plugin_tests(containers,
                      path_to_test_hook_on_host=None,
                      test_list=None,
                      options=None,
-                     fail_fast=True):
+                     fail_fast=True,
+                     log_indexer=None,
+                     result_sink=None,
+                     retry_policy=None):
     """Run a set of tests from the test hook for the specified iRODS plugin.
 
     Arguments:
@@ -87,8 +94,12 @@ def run_plugin_tests(containers,
     test_list -- a list of strings of the tests to be run
     options -- list of strings representing script options to pass to the run_tests.py script
     fail_fast -- if True, stop running after first failure; else, runs all tests
+    log_indexer -- `log_slices.log_indexer` which saves the server log of each test
+    result_sink -- `test_results.result_sink` in which the results are recorded as they happen
+    retry_policy -- `test_retries.retry_policy` deciding whether and where failed tests are retried
     """
-    tm = test_manager.test_manager(containers, test_list, test_type='irods_plugin_tests')
+    tm = test_manager.test_manager(containers, test_list, test_type='irods_plugin_tests',
+                                   log_indexer=log_indexer, result_sink=result_sink, retry_policy=retry_policy)
 
     try:
         tm.run(fail_fast,
@@ -103,7 +114,15 @@ def run_plugin_tests(containers,
     return tm.return_code()
 
 
-def run_specific_tests(containers, test_list=None, options=None, fail_fast=True):
+def run_specific_tests(containers,
+                       test_list=None,
+                       options=None,
+                       fail_fast=True,
+                       timings=None,
+                       order_by_duration=False,
+                       log_indexer=None,
+                       result_sink=None,
+                       retry_policy=None):
     """Run a set of tests from the python test suite for iRODS.
 
     Arguments:
@@ -111,13 +130,19 @@ def run_specific_tests(containers, test_list=None, options=None, fail_fast=True)
     test_list -- a list of strings of the tests to be run
     options -- A list of lists of strings representing options to pass to the scripts running tests
     fail_fast -- if True, stop running after first failure; else, runs all tests
+    timings -- `test_timings.test_timings` store in which test durations are recorded
+    order_by_duration -- if True, run the tests longest-first based on `timings`
+    log_indexer -- `log_slices.log_indexer` which saves the server log of each test
+    result_sink -- `test_results.result_sink` in which the results are recorded as they happen
+    retry_policy -- `test_retries.retry_policy` deciding whether and where failed tests are retried
     """
     tests = test_list or get_test_list(containers[0])
 
-    tm = test_manager.test_manager(containers, tests)
+    tm = test_manager.test_manager(containers, tests, timings=timings,
+                                   log_indexer=log_indexer, result_sink=result_sink, retry_policy=retry_policy)
 
     try:
-        tm.run(fail_fast, options=options)
+        tm.run(fail_fast, options=options, order_by_duration=order_by_duration)
 
     finally:
         logging.error(tm.result_string())
@@ -0,0 +1,221 @@
+"""Store of TLS material (private key, self-signed certificate, and DH parameters) shared across jobs.
+
+Generating DH parameters can take tens of seconds on a busy host, and the testing environment only
+needs some valid self-signed material - not new material for every run. The store keeps one set of
+material under the host cache directory and reuses it until the certificate nears expiry. Material
+is generated once by whichever job needs it first (others wait for it rather than generating their
+own), can be generated in the background with `prefetch` while the containers are being set up, and
+is renewed in the background when it is getting old but is still valid.
+
+Jobs never use the files in the store directly. `private_copy` hands each job its own copy in a
+fresh temporary directory, so concurrent jobs do not collide and renewing the material cannot pull
+files out from under a job which is using them.
+"""
+
+# grown-up modules
+import contextlib
+import datetime
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from cryptography import x509
+
+# local modules
+from . import context
+
+KEY_FILENAME = 'server.key'
+CERT_FILENAME = 'server.crt'
+DHPARAMS_FILENAME = 'dhparams.pem'
+
+# Material whose certificate expires within this time is renewed in the background.
+DEFAULT_RENEW_BEFORE = datetime.timedelta(days=30)
+
+_prefetch_threads = dict()
+_prefetch_threads_lock = threading.Lock()
+
+
+def default_directory():
+    """
+    Return the default directory in which the TLS material is stored.
+
+    Returns:
+        Path to a directory under the user's cache directory (respects XDG_CACHE_HOME).
+    """
+    return context.host_cache_directory('tls_material')
+
+
+@contextlib.contextmanager
+def _lock(directory, name, exclusive):
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, name), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+        try:
+            yield
+
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _current(directory):
+    return os.path.join(directory, 'current')
+
+
+def _expiry(path_to_cert_file):
+    with open(path_to_cert_file, 'rb') as f:
+        cert = x509.load_pem_x509_certificate(f.read())
+
+    # not_valid_after_utc is only available in newer versions of cryptography.
+    expiry = getattr(cert, 'not_valid_after_utc', None)
+    if expiry is None:
+        expiry = cert.not_valid_after.replace(tzinfo=datetime.timezone.utc)
+
+    return expiry
+
+
+def _state(directory, renew_before):
+    """Return 'fresh', 'expiring', or 'unusable' for the current material in `directory`."""
+    with _lock(directory, '.lock', exclusive=False):
+        current = _current(directory)
+
+        if not all(os.path.exists(os.path.join(current, f))
+                   for f in (KEY_FILENAME, CERT_FILENAME, DHPARAMS_FILENAME)):
+            return 'unusable'
+
+        try:
+            remaining = _expiry(os.path.join(current, CERT_FILENAME)) - datetime.datetime.now(datetime.timezone.utc)
+
+        except ValueError as e:
+            logging.warning(f'failed to read certificate in [{current}]: {e}')
+            return 'unusable'
+
+    # Leave at least a day so that a job which has just taken a copy can finish with it.
+    if remaining < datetime.timedelta(days=1):
+        return 'unusable'
+
+    return 'fresh' if remaining > renew_before else 'expiring'
+
+
+def _generate(directory):
+    from . import tls_setup
+
+    staging = tempfile.mkdtemp(prefix='.generating-', dir=directory)
+
+    try:
+        key, _ = tls_setup.generate_tls_certificate_key(staging)
+        tls_setup.generate_tls_self_signed_certificate(key, staging)
+        tls_setup.generate_tls_dh_params(directory=staging)
+
+        # Swap the new material in while no job is copying the old material.
+        with _lock(directory, '.lock', exclusive=True):
+            current = _current(directory)
+            old = current + '.old'
+
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(current):
+                os.rename(current, old)
+
+            os.rename(staging, current)
+
+            shutil.rmtree(old, ignore_errors=True)
+
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    logging.info(f'generated TLS material in [{directory}]')
+
+
+def ensure_fresh(directory=None, renew_before=DEFAULT_RENEW_BEFORE):
+    """
+    Generate new TLS material in the store unless the current material is fresh.
+
+    Only one job generates material at a time. Jobs which need material while another job is
+    generating it wait for that job and use its material.
+
+    Arguments:
+        directory: directory holding the store (default: `default_directory()`)
+        renew_before: material whose certificate expires within this time is replaced
+    """
+    directory = directory or default_directory()
+
+    if _state(directory, renew_before) == 'fresh':
+        return
+
+    with _lock(directory, '.generate.lock', exclusive=True):
+        # Someone else may have generated the material while this job waited for the lock.
+        if _state(directory, renew_before) == 'fresh':
+            return
+
+        _generate(directory)
+
+
+def prefetch(directory=None, renew_before=DEFAULT_RENEW_BEFORE):
+    """
+    Make sure the store has fresh TLS material in a background thread.
+
+    Call this as early as possible in a job which will configure TLS so that generating the
+    material overlaps with bringing up and setting up the containers.
+
+    Arguments:
+        directory: directory holding the store (default: `default_directory()`)
+        renew_before: material whose certificate expires within this time is replaced
+    """
+    directory = directory or default_directory()
+
+    def run():
+        try:
+            ensure_fresh(directory, renew_before)
+
+        except Exception as e:
+            logging.error(f'failed to generate TLS material in [{directory}]: {e}')
+
+    with _prefetch_threads_lock:
+        t = _prefetch_threads.get(directory)
+        if t and t.is_alive():
+            return
+
+        t = threading.Thread(target=run, name='tls_material_prefetch', daemon=True)
+        _prefetch_threads[directory] = t
+        t.start()
+
+
+@contextlib.contextmanager
+def private_copy(directory=None, renew_before=DEFAULT_RENEW_BEFORE):
+    """
+    Yield paths to a private copy of the TLS material, removing the copy afterwards.
+
+    Usable material which is close to expiry is still handed out, and renewed in the background
+    for later jobs. If there is no usable material, this waits until there is.
+
+    Arguments:
+        directory: directory holding the store (default: `default_directory()`)
+        renew_before: material whose certificate expires within this time is renewed
+
+    Yields:
+        A tuple of paths to the private key, the self-signed certificate, and the DH parameters.
+    """
+    directory = directory or default_directory()
+
+    state = _state(directory, renew_before)
+    if state == 'unusable':
+        ensure_fresh(directory, renew_before)
+    elif state == 'expiring':
+        prefetch(directory, renew_before)
+
+    destination = tempfile.mkdtemp(prefix='irods_testing_environment_tls_')
+
+    try:
+        with _lock(directory, '.lock', exclusive=False):
+            paths = tuple(shutil.copy2(os.path.join(_current(directory), f), destination)
+                          for f in (KEY_FILENAME, CERT_FILENAME, DHPARAMS_FILENAME))
+
+        yield paths
+
+    finally:
+        shutil.rmtree(destination, ignore_errors=True)
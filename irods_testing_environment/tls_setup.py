@@ -1,5 +1,5 @@
 # grown-up modules
-import json
+import asyncio
 import logging
 import os
 
@@ -9,10 +9,12 @@ from cryptography.hazmat.primitives.asymmetric import dh, rsa
 from cryptography.x509.oid import NameOID
 
 # local modules
+from . import async_executor
 from . import context
 from . import execute
 from . import irods_config
 from . import json_utils
+from . import tracing
 
 def generate_tls_certificate_key(directory=None):
     logging.info('generating private key for signing certificate')
@@ -85,32 +87,33 @@ def generate_tls_dh_params(generator=2, key_size=1024, directory=None):
     return dhfile
 
 
-def configure_tls_for_service_account(container, cert_file):
+@tracing.traced('tls')
+def configure_tls_for_service_account(container, cert_file, irods_env=None):
     """Configure TLS for the iRODS service account client environment.
 
     Arguments:
     container -- the docker.Container on which TLS will be configured
     cert_file -- path to the file in the container containing the self-signed cert
+    irods_env -- json_utils.json_file_editor for irods_environment.json to which the changes are
+                 added, to be committed by the caller (default: changes are written right away)
     """
     logging.warning(f'[{container.name}]: configuring TLS')
 
+    env = irods_env
+    if env is None:
+        env = json_utils.json_file_editor(container, context.service_account_irods_env())
+
     # add certificate chain file, certificate key file, and dh parameters file to iRODS
     # service account environment file
-    service_account_irods_env = os.path.join(context.irods_home(), '.irods', 'irods_environment.json')
-    irods_env = json_utils.get_json_from_file(container, service_account_irods_env)
-
-    logging.debug(f'[{container.name}: env before [{json.dumps(irods_env)}]')
-
-    irods_env['irods_client_server_policy'] = 'CS_NEG_REQUIRE'
-    irods_env['irods_ssl_ca_certificate_file'] = cert_file
-    irods_env['irods_ssl_verify_server'] = 'cert'
-
-    logging.debug(f'[{container.name}: env after [{json.dumps(irods_env)}]')
+    env['irods_client_server_policy'] = 'CS_NEG_REQUIRE'
+    env['irods_ssl_ca_certificate_file'] = cert_file
+    env['irods_ssl_verify_server'] = 'cert'
 
-    json_utils.put_json_to_file(container, service_account_irods_env, irods_env)
+    if irods_env is None:
+        env.commit()
 
 
-def configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file):
+def configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file, server_config=None):
     """Configure TLS in server_config on the iRODS server.
 
     Arguments:
@@ -118,12 +121,14 @@ def configure_tls_in_server_config(container, key_file, chain_file, dhparams_fil
     key_file -- path to the file in the container containing the private key for the cert
     chain_file -- path to the file in the container containing the self-signed cert
     dhparams_file -- path to the file in the container containing the dhparams PEM file
+    server_config -- json_utils.json_file_editor for server_config.json to which the changes are
+                     added, to be committed by the caller (default: changes are written right away)
     """
     from . import negotiation_key
 
-    config = json_utils.get_json_from_file(container, context.server_config())
-
-    logging.debug(f'[{container.name}: config before [{json.dumps(config)}]')
+    config = server_config
+    if config is None:
+        config = json_utils.json_file_editor(container, context.server_config())
 
     config["client_server_policy"] = "CS_NEG_REQUIRE"
     config["tls_server"] = {
@@ -136,36 +141,53 @@ def configure_tls_in_server_config(container, key_file, chain_file, dhparams_fil
         "verify_server": "cert"
     }
 
-    json_utils.put_json_to_file(container, context.server_config(), config)
-
-    logging.debug(f'[{container.name}: config after [{json.dumps(config)}]')
+    if server_config is None:
+        config.commit()
 
     negotiation_key.backup_file(container, context.core_re())
     negotiation_key.configure_tls_in_server(container, 'CS_NEG_REQUIRE')
 
 
-def configure_tls_on_irods4_server(container,
-                                   path_to_key_file_on_host,
-                                   path_to_cert_file_on_host,
-                                   path_to_dhparams_file_on_host):
-    """Copy TLS files to the container and configure TLS on the iRODS 4 server.
+def _run_irods_controller(container, action):
+    controller_cmd = f"python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().{action}()'"
+    return execute.execute_command(container, controller_cmd, user='irods', workdir=context.irods_home())
+
+
+def _tls_file_paths():
+    return (os.path.join(context.irods_config(), 'server.key'),
+            os.path.join(context.irods_config(), 'chain.pem'),
+            os.path.join(context.irods_config(), 'server.crt'),
+            os.path.join(context.irods_config(), 'dhparams.pem'))
+
+
+@tracing.traced('tls')
+def stage_tls_on_server(container,
+                        path_to_key_file_on_host,
+                        path_to_cert_file_on_host,
+                        path_to_dhparams_file_on_host,
+                        server_config=None):
+    """Stop the iRODS server and put the TLS files and configuration in place for its next start.
+
+    Use `start_server_after_tls` to start the server again. server_config.json and the service
+    account's irods_environment.json are each read and written (at most) once.
 
     Arguments:
     container -- the docker.Container on which TLS will be configured
     path_to_key_file_on_host -- path to file on host containing the private key for the cert
     path_to_cert_file_on_host -- path to file on host containing the self-signed cert
     path_to_dhparams_file_on_host -- path to file on host containing the dhparams PEM file
+    server_config -- json_utils.json_file_editor for server_config.json which the caller has
+                     already read from, committed here along with the TLS configuration
+                     (default: a new editor)
     """
     from . import archive
     from . import negotiation_key
 
-    key_file = os.path.join(context.irods_config(), 'server.key')
-    dhparams_file = os.path.join(context.irods_config(), 'dhparams.pem')
-    chain_file = os.path.join(context.irods_config(), 'chain.pem')
-    cert_file = os.path.join(context.irods_config(), 'server.crt')
+    key_file, chain_file, cert_file, dhparams_file = _tls_file_paths()
 
-    stop_cmd = "python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().stop()'"
-    if execute.execute_command(container, stop_cmd, user='irods', workdir=context.irods_home()) != 0:
+    version = irods_config.get_irods_version(container)
+
+    if _run_irods_controller(container, 'stop') != 0:
         raise RuntimeError(f"[{container.name}] failed to stop iRODS server before TLS configuration")
 
     logging.warning(f"[{container.name}] configuring TLS")
@@ -176,32 +198,44 @@ def configure_tls_on_irods4_server(container,
                                      (path_to_cert_file_on_host, cert_file),
                                      (path_to_dhparams_file_on_host, dhparams_file)])
 
-    # add certificate chain file, certificate key file, and dh parameters file to iRODS
-    # service account environment file
-    service_account_irods_env = os.path.join(context.irods_home(),
-                                             '.irods', 'irods_environment.json')
-    irods_env = json_utils.get_json_from_file(container, service_account_irods_env)
+    # iRODS 5 servers are configured in server_config.json. Older servers take the files from the
+    # service account environment and the TLS policy from core.re.
+    if server_config is None:
+        server_config = json_utils.json_file_editor(container, context.server_config())
 
-    logging.debug('env [{}] [{}]'.format(json.dumps(irods_env), container.name))
+    irods_env = json_utils.json_file_editor(container, context.service_account_irods_env())
 
-    irods_env['irods_client_server_policy'] = 'CS_NEG_REQUIRE'
-    irods_env['irods_ssl_ca_certificate_file'] = cert_file
-    irods_env['irods_ssl_certificate_chain_file'] = chain_file
-    irods_env['irods_ssl_certificate_key_file'] = key_file
-    irods_env['irods_ssl_dh_params_file'] = dhparams_file
-    irods_env['irods_ssl_verify_server'] = 'cert'
+    if int(version[0]) >= 5 or int(version[1]) >= 90:
+        configure_tls_for_service_account(container, cert_file, irods_env=irods_env)
+        configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file,
+                                       server_config=server_config)
 
-    logging.debug('env [{}] [{}]'.format(json.dumps(irods_env), container.name))
+    else:
+        # add certificate chain file, certificate key file, and dh parameters file to iRODS
+        # service account environment file
+        irods_env['irods_client_server_policy'] = 'CS_NEG_REQUIRE'
+        irods_env['irods_ssl_ca_certificate_file'] = cert_file
+        irods_env['irods_ssl_certificate_chain_file'] = chain_file
+        irods_env['irods_ssl_certificate_key_file'] = key_file
+        irods_env['irods_ssl_dh_params_file'] = dhparams_file
+        irods_env['irods_ssl_verify_server'] = 'cert'
 
-    json_utils.put_json_to_file(container, service_account_irods_env, irods_env)
+        # TODO: consider using a generator to restore the file here...
+        negotiation_key.backup_file(container, context.core_re())
+        negotiation_key.configure_tls_in_server(container, 'CS_NEG_REQUIRE')
+
+    irods_env.commit()
+    server_config.commit()
 
-    # TODO: consider using a generator to restore the file here...
-    negotiation_key.backup_file(container, context.core_re())
-    negotiation_key.configure_tls_in_server(container, 'CS_NEG_REQUIRE')
 
-    # start the server again
-    start_cmd = "python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().start()'"
-    if execute.execute_command(container, start_cmd, user='irods', workdir=context.irods_home()) != 0:
+@tracing.traced('tls')
+def start_server_after_tls(container):
+    """Start the iRODS server stopped by `stage_tls_on_server`.
+
+    Arguments:
+    container -- the docker.Container on which TLS was configured
+    """
+    if _run_irods_controller(container, 'start') != 0:
         raise RuntimeError(f"[{container.name}] failed to start iRODS server after TLS configuration")
 
     logging.warning(f"[{container.name}] TLS configured successfully")
@@ -219,114 +253,101 @@ def configure_tls_on_server(container,
     path_to_cert_file_on_host -- path to file on host containing the self-signed cert
     path_to_dhparams_file_on_host -- path to file on host containing the dhparams PEM file
     """
-    # If this is not an iRODS 5 server, use the old way of configuring TLS.
-    version = irods_config.get_irods_version(container)
-    if int(version[0]) < 5 and int(version[1]) < 90:
-        return configure_tls_on_irods4_server(
-            container, path_to_key_file_on_host, path_to_cert_file_on_host, path_to_dhparams_file_on_host)
+    stage_tls_on_server(container,
+                        path_to_key_file_on_host,
+                        path_to_cert_file_on_host,
+                        path_to_dhparams_file_on_host)
 
-    from . import archive
-    from . import negotiation_key
+    start_server_after_tls(container)
 
-    key_file = os.path.join(context.irods_config(), 'server.key')
-    dhparams_file = os.path.join(context.irods_config(), 'dhparams.pem')
-    chain_file = os.path.join(context.irods_config(), 'chain.pem')
-    cert_file = os.path.join(context.irods_config(), 'server.crt')
 
-    stop_cmd = "python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().stop()'"
-    if execute.execute_command(container, stop_cmd, user='irods', workdir=context.irods_home()) != 0:
-        raise RuntimeError(f"[{container.name}] failed to stop iRODS server before TLS configuration")
+def _providers_of_consumer(server_config, providers):
+    """Return the providers among `providers` named in the catalog_provider_hosts of a consumer.
 
-    logging.warning(f"[{container.name}] configuring TLS")
+    All of `providers` are returned if none of them can be matched, so that nothing is missed.
 
-    archive.copy_files_in_container(container,
-                                    [(path_to_key_file_on_host, key_file),
-                                     (path_to_cert_file_on_host, chain_file),
-                                     (path_to_cert_file_on_host, cert_file),
-                                     (path_to_dhparams_file_on_host, dhparams_file)])
+    Arguments:
+    server_config -- json_utils.json_file_editor for the server_config.json of the consumer
+    providers -- containers of the catalog service providers
+    """
+    hosts = server_config.contents.get('catalog_provider_hosts', [])
 
-    configure_tls_for_service_account(container, cert_file)
+    matched = [p for p in providers if context.container_hostname(p) in hosts]
 
-    configure_tls_in_server_config(container, key_file, chain_file, dhparams_file, cert_file)
+    return matched or list(providers)
 
-    # start the server again
-    start_cmd = "python3 -c 'from scripts.irods.controller import IrodsController; IrodsController().start()'"
-    if execute.execute_command(container, start_cmd, user='irods', workdir=context.irods_home()) != 0:
-        raise RuntimeError(f"[{container.name}] failed to start iRODS server after TLS configuration")
 
-    logging.warning(f"[{container.name}] TLS configured successfully")
+@tracing.phase('configure TLS')
+def configure_tls_in_zone(docker_client, compose_project):
+    """Configure TLS on every iRODS server in the Compose project.
 
+    A catalog service consumer cannot start with TLS until its catalog service provider is
+    running with TLS, but everything before that does not depend on the provider. So, each consumer
+    stops and stages its files and configuration while the providers are being configured, and
+    then starts as soon as the provider(s) it uses are running again - without waiting for the
+    providers of any other Zone.
 
-def configure_tls_in_zone(docker_client, compose_project):
-    import concurrent.futures
-    import tempfile
+    Arguments:
+    docker_client -- docker client for interacting with the docker-compose project
+    compose_project -- compose.Project in which the iRODS servers are running
+    """
+    from . import tls_material
 
     # Each irods_environment.json file is describing the cert this client will use and why
     # they think it is good. The testing environment is using a self-signed certificate, so
-    # the certificate, key, and dhparams should be generated ONCE and copied to each server.
-    #tls_files_dir = tempfile.mkdtemp()
-    key, key_file = generate_tls_certificate_key()
-    cert_file = generate_tls_self_signed_certificate(key)
-    dhparams_file = generate_tls_dh_params()
-
-    try:
-        rc = 0
-
-        # Configure TLS on the catalog service providers first because communication with the
-        # catalog service consumers depends on being able to communicate with the catalog
-        # service provider. If TLS is not configured first on the catalog service provider
-        # the catalog service consumers will not be able to communicate with it.
+    # the same certificate, key, and dhparams are copied to each server. These come from the
+    # host's store of TLS material rather than being generated anew for every Zone.
+    with tls_material.private_copy() as (key_file, cert_file, dhparams_file):
         csps = compose_project.containers(service_names=[
             context.irods_catalog_provider_service()])
+        cscs = compose_project.containers(service_names=[
+            context.irods_catalog_consumer_service()])
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_containers = {
-                executor.submit(configure_tls_on_server,
-                                docker_client.containers.get(c.name),
-                                key_file,
-                                cert_file,
-                                dhparams_file): c for c in csps
-            }
-
-            for f in concurrent.futures.as_completed(futures_to_containers):
-                container = futures_to_containers[f]
+        provider_containers = [docker_client.containers.get(c.name) for c in csps]
+
+        async def configure_all():
+            providers_started = {c.name: asyncio.get_running_loop().create_future() for c in csps}
+
+            async def configure_provider(container):
                 try:
-                    f.result()
+                    await async_executor.run_blocking(
+                        configure_tls_on_server, container, key_file, cert_file, dhparams_file)
 
-                except Exception as e:
-                    logging.error(f"[{container.name}] exception raised while configuring TLS")
-                    logging.error(e)
-                    rc = 1
+                    providers_started[container.name].set_result(True)
 
-        if rc != 0:
-            raise RuntimeError('failed to configure TLS on some service')
+                except BaseException:
+                    providers_started[container.name].set_result(False)
+                    raise
 
-        cscs = compose_project.containers(service_names=[
-            context.irods_catalog_consumer_service()])
+            async def configure_consumer(container):
+                # The server_config.json read to find the providers is the one the TLS
+                # configuration is written to, so it is only read once.
+                server_config = json_utils.json_file_editor(container, context.server_config())
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures_to_containers = {
-                executor.submit(configure_tls_on_server,
-                                docker_client.containers.get(c.name),
-                                key_file,
-                                cert_file,
-                                dhparams_file): c for c in cscs
-            }
-
-            for f in concurrent.futures.as_completed(futures_to_containers):
-                container = futures_to_containers[f]
-                try:
-                    f.result()
+                providers = await async_executor.run_blocking(
+                    _providers_of_consumer, server_config, provider_containers)
 
-                except Exception as e:
-                    logging.error(f"[{container.name}] exception raised while configuring TLS")
-                    logging.error(e)
-                    rc = 1
+                await async_executor.run_blocking(
+                    stage_tls_on_server, container, key_file, cert_file, dhparams_file,
+                    server_config=server_config)
 
-        if rc != 0:
-            raise RuntimeError('failed to configure TLS on some service')
+                for p in providers:
+                    if not await providers_started[p.name]:
+                        raise RuntimeError(f'[{container.name}] not starting because TLS configuration '
+                                           f'failed on catalog service provider [{p.name}]')
 
-    finally:
-        os.unlink(key_file)
-        os.unlink(cert_file)
-        os.unlink(dhparams_file)
+                await async_executor.run_blocking(start_server_after_tls, container)
+
+            async def configure(docker_compose_container):
+                container = await async_executor.run_blocking(
+                    docker_client.containers.get, docker_compose_container.name)
+
+                if docker_compose_container.name in providers_started:
+                    return await configure_provider(container)
+
+                return await configure_consumer(container)
+
+            return await async_executor.run_for_containers(configure, csps + cscs, 'configuring TLS')
+
+        if async_executor.run(configure_all()) != 0:
+            raise RuntimeError('failed to configure TLS on some service')
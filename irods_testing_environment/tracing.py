@@ -0,0 +1,250 @@
+"""Record how long the steps of a job take and write them out as a Chrome trace.
+
+Log timestamps do not say where the time goes when dozens of containers are being set up at once.
+With tracing enabled, the Docker operations (execs, archive copies, JSON file edits) and the larger
+steps built from them (installing packages, setting up servers, configuring TLS, federating) are
+recorded as spans. Each span carries the container it ran against, the phase it ran in (the
+innermost enclosing `phase`), and attributes such as the command that was run.
+
+`write` saves the spans in the Chrome trace event format, which can be opened in chrome://tracing or
+https://ui.perfetto.dev. Each container is shown as a process of its own, so the time spent on each
+container can be read off directly; spans which are not tied to a container are shown under the job.
+
+Tracing is disabled by default. Use `enable()` to turn it on. While disabled, spans cost a function
+call and nothing is recorded.
+"""
+
+# grown-up modules
+import atexit
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+
+TRACE_FILENAME = 'setup_trace.json'
+
+# pid under which spans without a container are shown.
+JOB_PID = 0
+
+_tracer = None
+
+_current_phase = contextvars.ContextVar('irods_testing_environment_tracing_phase', default=None)
+
+
+class tracer(object):
+    """Collects trace events in memory until they are written out."""
+
+    def __init__(self, path_to_trace_file):
+        """Construct a tracer.
+
+        Arguments:
+        path_to_trace_file -- local path to which the trace is written by `write`
+        """
+        self.path = path_to_trace_file
+        self.events = list()
+        self.pids = dict()
+        self.tids = dict()
+        self.named_threads = set()
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    def _now(self):
+        return (time.perf_counter() - self.start) * 1e6
+
+    def _pid(self, container_name):
+        if container_name is None:
+            return JOB_PID
+
+        pid = self.pids.get(container_name)
+        if pid is None:
+            pid = self.pids[container_name] = len(self.pids) + 1
+            self.events.append({'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': 0,
+                                'args': {'name': container_name}})
+
+        return pid
+
+    def _tid(self, pid):
+        ident = threading.get_ident()
+
+        tid = self.tids.get(ident)
+        if tid is None:
+            tid = self.tids[ident] = len(self.tids) + 1
+
+        # Thread names are per process in a trace, so each thread is named in each process it shows up in.
+        if (pid, tid) not in self.named_threads:
+            self.named_threads.add((pid, tid))
+            self.events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid,
+                                'args': {'name': threading.current_thread().name}})
+
+        return tid
+
+    def record(self, name, category, start, end, container_name, attributes):
+        """Record a complete span which took from `start` to `end` (in microseconds since the tracer started)."""
+        with self.lock:
+            pid = self._pid(container_name)
+            self.events.append({
+                'ph': 'X',
+                'name': name,
+                'cat': category,
+                'ts': start,
+                'dur': end - start,
+                'pid': pid,
+                'tid': self._tid(pid),
+                'args': attributes
+            })
+
+    def write(self):
+        """Write the trace recorded so far to the trace file."""
+        with self.lock:
+            trace = {
+                'traceEvents': [{'ph': 'M', 'name': 'process_name', 'pid': JOB_PID, 'tid': 0,
+                                 'args': {'name': 'job'}}] + self.events,
+                'displayTimeUnit': 'ms'
+            }
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        with open(self.path, 'w') as f:
+            json.dump(trace, f)
+
+        logging.info('wrote trace of [{}] events to [{}]'.format(len(trace['traceEvents']), self.path))
+
+
+def enable(output_directory, filename=TRACE_FILENAME):
+    """Record spans from now on and write them to `filename` in `output_directory` at exit.
+
+    Arguments:
+    output_directory -- job output directory (see `test_utils.make_output_directory`)
+    filename -- name of the trace file in the output directory
+    """
+    global _tracer
+
+    if _tracer is not None:
+        _tracer.write()
+
+    _tracer = tracer(os.path.join(output_directory, filename))
+
+
+def enabled():
+    """Return True if spans are being recorded."""
+    return _tracer is not None
+
+
+def write():
+    """Write the spans recorded so far to the trace file, if tracing is enabled."""
+    if _tracer is not None:
+        _tracer.write()
+
+
+@atexit.register
+def _write_at_exit():
+    try:
+        write()
+
+    except Exception as e:
+        logging.error('failed to write trace: {}'.format(e))
+
+
+def current_phase():
+    """Return the name of the innermost enclosing `phase`, or None if there is none."""
+    return _current_phase.get()
+
+
+def _container_name(container):
+    if container is None or isinstance(container, str):
+        return container
+
+    return getattr(container, 'name', None)
+
+
+@contextlib.contextmanager
+def span(name, category, container=None, **attributes):
+    """Record the time spent in the `with` block as a span.
+
+    Arguments:
+    name -- name of the span (e.g. the name of the operation)
+    category -- kind of operation (e.g. 'exec', 'archive', 'setup')
+    container -- container (or container name) the operation runs against, if any
+    attributes -- additional attributes to record with the span (e.g. command='ls')
+    """
+    t = _tracer
+
+    if t is None:
+        yield
+        return
+
+    attributes = {k: str(v) for k, v in attributes.items() if v is not None}
+
+    phase = _current_phase.get()
+    if phase is not None:
+        attributes['phase'] = phase
+
+    start = t._now()
+
+    try:
+        yield
+
+    except BaseException as e:
+        attributes['error'] = repr(e)
+        raise
+
+    finally:
+        t.record(name, category, start, t._now(), _container_name(container), attributes)
+
+
+@contextlib.contextmanager
+def phase(name, container=None, **attributes):
+    """Record the `with` block as a span and mark the spans inside it as belonging to phase `name`.
+
+    The phase follows work into the shared scheduler of async_executor, but not into other threads.
+
+    Arguments:
+    name -- name of the phase (e.g. 'configure TLS')
+    container -- container (or container name) the phase works on, if any
+    attributes -- additional attributes to record with the span
+    """
+    token = _current_phase.set(name)
+
+    try:
+        with span(name, 'phase', container=container, **attributes):
+            yield
+
+    finally:
+        _current_phase.reset(token)
+
+
+def traced(category, name=None, container_argument='container', attributes=None):
+    """Decorate a function so that each call to it is recorded as a span.
+
+    Arguments:
+    category -- kind of operation (e.g. 'archive')
+    name -- name of the span (default: the name of the function)
+    container_argument -- name of the argument of the function which holds the container (or
+                          container name) the call runs against, if it has one
+    attributes -- names of arguments of the function whose values are recorded with the span
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+        signature = inspect.signature(fn)
+        argument_names = list(attributes or [])
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+
+            with span(span_name, category,
+                      container=arguments.get(container_argument),
+                      **{a: arguments.get(a) for a in argument_names}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
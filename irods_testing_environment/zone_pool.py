@@ -0,0 +1,314 @@
+"""A pool of set-up Compose projects which test jobs lease instead of setting up their own.
+
+Setting up Zones takes far longer than many test jobs take to run. A pool keeps up to N Compose
+projects for a project directory (named `<project>-pool<N>`) set up between jobs. A job leases a
+free project from the pool, sets it up only if it has never been set up with the same inputs, runs
+its tests, and then releases it. Releasing a project resets it to the baseline which was saved right
+after setup - the iRODS configuration, service account environment, and Vault in each iRODS server
+container, and the catalog in each database container (see `catalog_template`) - instead of tearing
+it down.
+
+Leases are taken with `flock` on files in the host cache directory, so concurrent jobs on the same
+host never lease the same project. A project is marked dirty in its state file while it is leased,
+so one whose job was killed before releasing it (or while resetting it) is reset - or set up again -
+by the next job to lease it rather than reused as it was left.
+"""
+
+# grown-up modules
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+
+# local modules
+from . import catalog_template
+from . import context
+from . import exec_session
+from . import execute
+from . import irods_setup
+
+BASELINE_SUFFIX = '.pool_baseline'
+
+
+def baseline_paths():
+    """Return paths in iRODS server containers which are saved in the baseline and restored on reset."""
+    return [
+        context.irods_config(),
+        os.path.dirname(context.service_account_irods_env()),
+        os.path.join(context.irods_home(), 'Vault'),
+    ]
+
+
+def _stop_irods_servers(ctx):
+    irods_containers = [ctx.docker_client.containers.get(c.name) for c in ctx.irods_containers()]
+
+    # Consumers are stopped before and started after the providers whose catalogs they use.
+    irods_containers.sort(key=context.is_irods_catalog_provider_container)
+
+    for container in irods_containers:
+        if irods_setup.stop_irods(container) != 0:
+            raise RuntimeError(f'[{container.name}] failed to stop iRODS server')
+
+    return irods_containers
+
+
+def _start_irods_servers(irods_containers):
+    for container in reversed(irods_containers):
+        if irods_setup.restart_irods(container) != 0:
+            raise RuntimeError(f'[{container.name}] failed to restart iRODS server')
+
+
+def save_baseline(ctx, setup_key=None):
+    """Save the current state of the Zones in the project as the baseline to which they are reset.
+
+    Arguments:
+        ctx: context object which holds the Docker client and Compose project information
+        setup_key: string identifying the inputs used to set up the project, under which catalog
+                   templates kept in files are cached on the host
+    """
+    irods_containers = _stop_irods_servers(ctx)
+
+    for container in irods_containers:
+        for path in baseline_paths():
+            backup = path + BASELINE_SUFFIX
+            if execute.execute_command(container, f'bash -c \'rm -rf {backup} && cp -a {path} {backup}\'') != 0:
+                raise RuntimeError(f'[{container.name}] failed to save baseline of [{path}]')
+
+    catalog_template.save_templates(ctx, key=setup_key)
+
+    _start_irods_servers(irods_containers)
+
+    logging.info(f'saved baseline for project [{ctx.compose_project.name}]')
+
+
+def reset_to_baseline(ctx, setup_key=None):
+    """Reset the Zones in the project to the baseline saved by `save_baseline` and restart iRODS.
+
+    Arguments:
+        ctx: context object which holds the Docker client and Compose project information
+        setup_key: string identifying the inputs used to set up the project
+    """
+    irods_containers = _stop_irods_servers(ctx)
+
+    if not catalog_template.clone_templates(ctx, key=setup_key):
+        raise RuntimeError(f'no catalog templates to reset project [{ctx.compose_project.name}]')
+
+    for container in irods_containers:
+        # The directories being replaced may be the working directory of a session's shell, and the
+        # next job should not see any shell state left behind by this one.
+        exec_session.close_sessions_for_container(container.name)
+
+        for path in baseline_paths():
+            backup = path + BASELINE_SUFFIX
+            if execute.execute_command(container, f'bash -c \'rm -rf {path} && cp -a {backup} {path}\'') != 0:
+                raise RuntimeError(f'[{container.name}] failed to restore baseline of [{path}]')
+
+        # Test reports and logs from the previous job must not be collected by the next one.
+        execute.execute_command(container, f'rm -rf {os.path.join(context.irods_home(), "test-reports")}')
+        execute.execute_command(container, 'find /var/log/irods -type f -exec truncate -s 0 {} +')
+
+    _start_irods_servers(irods_containers)
+
+    logging.info(f'reset project [{ctx.compose_project.name}] to baseline')
+
+
+class lease(object):
+    """A Compose project leased from a `zone_pool`, held until `release` is called."""
+
+    def __init__(self, pool, slot, lock_file):
+        """Construct a lease. Use `zone_pool.lease` rather than constructing this directly.
+
+        Arguments:
+        pool -- the zone_pool from which the project is leased
+        slot -- index of the leased project in the pool
+        lock_file -- open file on which the lock for `slot` is held
+        """
+        import compose.cli.command
+
+        self.pool = pool
+        self.slot = slot
+        self.lock_file = lock_file
+        self.ctx = context.context(pool.docker_client,
+                                   compose.cli.command.get_project(
+                                       project_dir=pool.project_directory,
+                                       project_name=pool.project_name(slot)))
+
+    def _state_path(self):
+        return os.path.join(self.pool.directory, f'{self.slot}.json')
+
+    def _read_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        with open(self._state_path(), 'w') as f:
+            json.dump(state, f)
+
+    def is_ready(self, setup_key):
+        """Return True if the project was set up with inputs identified by `setup_key` and is still up.
+
+        Arguments:
+        setup_key -- a string identifying the inputs used to set up the project
+        """
+        if self._read_state().get('setup_key') != setup_key:
+            return False
+
+        containers = [self.ctx.docker_client.containers.get(c.name)
+                      for c in self.ctx.compose_project.containers()]
+        return bool(containers) and all(c.status == 'running' for c in containers)
+
+    def mark_ready(self, setup_key):
+        """Save the baseline of the freshly set-up project and record that it is ready for reuse.
+
+        Arguments:
+        setup_key -- a string identifying the inputs used to set up the project
+        """
+        save_baseline(self.ctx, setup_key)
+        self._write_state({'setup_key': setup_key})
+
+    def _mark_dirty(self, setup_key):
+        # Cleared by `release` once the project has been reset to its baseline.
+        self._write_state({'setup_key': setup_key, 'dirty': True})
+
+    def prepare(self, setup_key, set_up):
+        """Make the project ready for use, setting it up with `set_up` only if it is not ready already.
+
+        A ready project which was left dirty by a job which did not release it is reset to its
+        baseline first, and is set up again if that fails.
+
+        Arguments:
+        setup_key -- a string identifying the inputs used to set up the project
+        set_up -- callable which sets up the project from scratch given a context
+        """
+        if self.is_ready(setup_key):
+            if not self._read_state().get('dirty'):
+                logging.warning(f'using ready project [{self.ctx.compose_project.name}] from pool')
+                self._mark_dirty(setup_key)
+                return
+
+            logging.warning(f'project [{self.ctx.compose_project.name}] was not released by the last job '
+                            'to lease it - resetting it')
+
+            try:
+                reset_to_baseline(self.ctx, setup_key)
+
+                logging.warning(f'using reset project [{self.ctx.compose_project.name}] from pool')
+                return
+
+            except Exception as e:
+                logging.error(f'failed to reset project [{self.ctx.compose_project.name}]: {e}')
+
+        self._write_state({})
+
+        logging.warning(f'setting up project [{self.ctx.compose_project.name}] for pool')
+
+        self.ctx.compose_project.down(include_volumes=True, remove_image_type=False)
+
+        set_up(self.ctx)
+
+        self.mark_ready(setup_key)
+        self._mark_dirty(setup_key)
+
+    def release(self, reset=True):
+        """Reset the project to its baseline and return it to the pool.
+
+        If the reset fails, the project is torn down and will be set up again by the next job to lease it.
+
+        Arguments:
+        reset -- if False, the project is torn down instead of being reset
+        """
+        if self.lock_file is None:
+            return
+
+        try:
+            state = self._read_state()
+
+            if reset and state.get('setup_key'):
+                try:
+                    reset_to_baseline(self.ctx, state['setup_key'])
+                    self._write_state({'setup_key': state['setup_key']})
+                    return
+
+                except Exception as e:
+                    logging.error(f'failed to reset project [{self.ctx.compose_project.name}]: {e}')
+
+            self._write_state({})
+            self.ctx.compose_project.down(include_volumes=True, remove_image_type=False)
+
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+
+class zone_pool(object):
+    """A pool of up to `size` set-up Compose projects for one project directory."""
+
+    def __init__(self, project_directory, size, docker_client=None, directory=None):
+        """Construct a zone_pool.
+
+        Arguments:
+        project_directory -- path to the Compose project directory from which the projects are made
+        size -- maximum number of projects in the pool
+        docker_client -- Docker client used to manage the projects
+        directory -- directory on the host holding the pool's locks and state (default: under the cache directory)
+        """
+        if size < 1:
+            raise ValueError('pool size must be a positive integer')
+
+        self.project_directory = os.path.abspath(project_directory)
+        self.size = size
+        self.docker_client = docker_client or context.docker_client()
+
+        digest = hashlib.sha256(self.project_directory.encode('utf-8')).hexdigest()[:12]
+        self.directory = directory or context.host_cache_directory('zone_pool', digest)
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def project_name(self, slot):
+        """Return the Compose project name used by the project in `slot`."""
+        return context.sanitize(f'{os.path.basename(self.project_directory)}-pool{slot}')
+
+    def try_lease(self):
+        """Return a lease on a free project in the pool, or None if every project is leased."""
+        for slot in range(self.size):
+            lock_file = open(os.path.join(self.directory, f'{slot}.lock'), 'w')
+
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            except BlockingIOError:
+                lock_file.close()
+                continue
+
+            logging.info(f'leased slot [{slot}] of pool [{self.directory}]')
+
+            return lease(self, slot, lock_file)
+
+        return None
+
+    def lease(self, timeout=None, poll_interval=5):
+        """Return a lease on a free project in the pool, waiting for one to be released if necessary.
+
+        Arguments:
+        timeout -- seconds to wait for a free project before raising RuntimeError (default: wait forever)
+        poll_interval -- seconds to wait between attempts to lease a project
+        """
+        start = time.monotonic()
+
+        while True:
+            leased = self.try_lease()
+            if leased:
+                return leased
+
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise RuntimeError(f'no project in pool [{self.directory}] became free within [{timeout}] seconds')
+
+            logging.info(f'all [{self.size}] projects in pool [{self.directory}] are leased - waiting')
+            time.sleep(poll_interval)
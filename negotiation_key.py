@@ -124,6 +124,8 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity)
 
+    cli.apply_common_args(args)
+
     try:
         if True:
             exit(
@@ -0,0 +1,159 @@
+# grown-up modules
+import json
+import logging
+import os
+import shutil
+
+# local modules
+from irods_testing_environment import benchmark
+from irods_testing_environment import context
+from irods_testing_environment import fake_docker
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import textwrap
+
+    import cli
+    from irods_testing_environment import logs
+
+    parser = argparse.ArgumentParser(
+        description='Time bringing up test environments against an in-process stand-in for Docker.',
+        epilog=textwrap.dedent('''\
+            No Docker daemon is needed. Commands are not actually run: each Docker operation takes \
+            a simulated amount of time, and the operations made by each benchmark are counted.'''))
+
+    cli.add_common_args(parser)
+
+    parser.add_argument('--benchmarks',
+                        metavar='BENCHMARK_NAME',
+                        dest='benchmarks', nargs='+', choices=list(benchmark.BENCHMARKS),
+                        default=list(benchmark.BENCHMARKS),
+                        help='Benchmarks to run (default: all).')
+
+    parser.add_argument('--repetitions',
+                        metavar='NUMBER_OF_REPETITIONS',
+                        dest='repetitions', type=int, default=3,
+                        help='Number of times each benchmark is run.')
+
+    parser.add_argument('--zone-count',
+                        metavar='NUMBER_OF_ZONES',
+                        dest='zone_count', type=int, default=2,
+                        help='Number of Zones in each project.')
+
+    parser.add_argument('--consumers-per-zone',
+                        metavar='NUMBER_OF_CONSUMERS',
+                        dest='consumers_per_zone', type=int, default=2,
+                        help='Number of iRODS Catalog Service Consumers in each Zone.')
+
+    parser.add_argument('--database-image',
+                        metavar='DATABASE_IMAGE',
+                        dest='database_image', default='postgres:14',
+                        help='Image of the catalog database service (e.g. mysql:8.0).')
+
+    parser.add_argument('--platform-image-tag',
+                        metavar='PLATFORM_IMAGE_TAG',
+                        dest='platform_image_tag', default='ubuntu:22.04',
+                        help='Platform reported by the iRODS containers.')
+
+    parser.add_argument('--exec-latency',
+                        metavar='SECONDS',
+                        dest='exec_latency', type=float, default=0.02,
+                        help='Time taken by running a command in a container.')
+
+    parser.add_argument('--inspect-latency',
+                        metavar='SECONDS',
+                        dest='inspect_latency', type=float, default=0.005,
+                        help='Time taken by inspecting a container.')
+
+    parser.add_argument('--api-latency',
+                        metavar='SECONDS',
+                        dest='api_latency', type=float, default=0.002,
+                        help='Time taken by any other call to the Docker API.')
+
+    parser.add_argument('--archive-latency',
+                        metavar='SECONDS',
+                        dest='archive_latency', type=float, default=0.01,
+                        help='Time taken by an archive transfer, besides the transfer itself.')
+
+    parser.add_argument('--archive-bandwidth',
+                        metavar='MEBIBYTES_PER_SECOND',
+                        dest='archive_bandwidth', type=float, default=200,
+                        help='Rate at which archives are transferred to and from containers.')
+
+    parser.add_argument('--package-size',
+                        metavar='MEBIBYTES',
+                        dest='package_size', type=float, default=1,
+                        help='Size of each of the fake iRODS packages which are installed.')
+
+    parser.add_argument('--output-file',
+                        metavar='PATH_TO_OUTPUT_FILE',
+                        dest='output_file',
+                        help='Path to which the results are saved as JSON.')
+
+    parser.add_argument('--baseline',
+                        metavar='PATH_TO_BASELINE_FILE',
+                        dest='baseline',
+                        help=textwrap.dedent('''\
+                            Path to results saved by an earlier run with --output-file. The run \
+                            fails if a benchmark made any kind of Docker operation more often than \
+                            in the baseline, or had noticeably fewer execs in flight at once.'''))
+
+    args = parser.parse_args()
+
+    logs.configure(args.verbosity)
+
+    if args.use_exec_sessions:
+        logging.critical('--use-exec-sessions is not supported by the fake Docker backend')
+        exit(1)
+
+    cli.apply_common_args(args)
+
+    # Keep the archive cache of the benchmarks away from the real one.
+    cache_directory = tempfile.mkdtemp(prefix='irods_testing_environment_benchmark_cache_')
+    os.environ['XDG_CACHE_HOME'] = cache_directory
+
+    client = fake_docker.fake_client(
+        fake_docker.latency_model(exec_latency=args.exec_latency,
+                                  api_latency=args.api_latency,
+                                  inspect_latency=args.inspect_latency,
+                                  archive_latency=args.archive_latency,
+                                  archive_bandwidth=args.archive_bandwidth * 2**20),
+        platform_image_tag=args.platform_image_tag)
+
+    context.set_docker_client(client)
+
+    results = dict()
+
+    try:
+        with benchmark.environment(client,
+                                   zone_count=args.zone_count,
+                                   consumers_per_zone=args.consumers_per_zone,
+                                   database_image=args.database_image,
+                                   package_size=int(args.package_size * 2**20)) as env:
+            for name in args.benchmarks:
+                logging.warning(f'running benchmark [{name}]')
+                results[name] = benchmark.run_benchmark(env, name, args.repetitions)
+
+    finally:
+        client.close()
+        shutil.rmtree(cache_directory, ignore_errors=True)
+
+    print(benchmark.summary(results))
+
+    if args.output_file:
+        with open(args.output_file, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    rc = 0
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = benchmark.compare(results, json.load(f))
+
+        for r in regressions:
+            logging.critical(f'regression: {r}')
+
+        rc = 1 if regressions else 0
+
+    exit(rc)
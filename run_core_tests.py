@@ -5,12 +5,21 @@ import logging
 import os
 
 # local modules
-from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import instrumentation
 from irods_testing_environment import irods_config
+from irods_testing_environment import log_shipper
+from irods_testing_environment import log_slices
+from irods_testing_environment import tls_material
 from irods_testing_environment import tls_setup
 from irods_testing_environment import services
+from irods_testing_environment import snapshot
+from irods_testing_environment import test_results
+from irods_testing_environment import test_retries
 from irods_testing_environment import test_utils
+from irods_testing_environment import test_timings
+from irods_testing_environment import tracing
+from irods_testing_environment import zone_pool
 
 if __name__ == "__main__":
     import argparse
@@ -33,6 +42,17 @@ if __name__ == "__main__":
                             Indicates that TLS should be configured and enabled in the test \
                             Zone.'''))
 
+    parser.add_argument('--zone-pool-size',
+                        metavar='MAXIMUM_NUMBER_OF_POOLED_PROJECTS',
+                        dest='zone_pool_size', type=int, default=0,
+                        help=textwrap.dedent('''\
+                            If greater than 0, run on a project leased from a pool of at most this \
+                            many set-up projects for the project directory. The project is only \
+                            set up if it has not already been set up with the same packages and \
+                            options, and it is reset to its freshly set-up state and kept for the \
+                            next job afterwards instead of being torn down. --project-name is \
+                            ignored.'''))
+
     args = parser.parse_args()
 
     if not args.package_version and not args.install_packages:
@@ -50,10 +70,19 @@ if __name__ == "__main__":
         if args.package_version:
             os.environ['irods_package_version'] = args.package_version
 
-    ctx = context.context(docker.from_env(use_ssh_client=True),
-                          compose.cli.command.get_project(
-                              project_dir=project_directory,
-                              project_name=args.project_name))
+    lease = None
+
+    if args.zone_pool_size:
+        # Blocks until one of the projects in the pool is free.
+        lease = zone_pool.zone_pool(project_directory,
+                                    args.zone_pool_size,
+                                    docker.from_env(use_ssh_client=True)).lease()
+        ctx = lease.ctx
+    else:
+        ctx = context.context(docker.from_env(use_ssh_client=True),
+                              compose.cli.command.get_project(
+                                  project_dir=project_directory,
+                                  project_name=args.project_name))
 
     job_name = test_utils.job_name(ctx.compose_project.name, args.job_name)
 
@@ -66,29 +95,67 @@ if __name__ == "__main__":
     output_directory = test_utils.make_output_directory(dirname, job_name)
 
     logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+    tracing.enable(output_directory)
+    instrumentation.enable(ctx.docker_client, context.docker_client())
+
+    budgets = instrumentation.load_budgets(args.operation_budgets)
+
+    cli.apply_common_args(args)
+    cli.apply_database_config_args(args, ctx.compose_project)
+
+    if args.use_tls:
+        # Generating TLS material can be slow, so it is done while the Zones are being set up.
+        tls_material.prefetch()
 
     rc = 0
+    shipper = None
 
     containers = None
 
     try:
         if args.do_setup:
-            # Bring up the services
-            logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
             consumer_count = 0
-            services.create_topologies(ctx,
-                                       zone_count=args.executor_count,
-                                       externals_directory=args.irods_externals_package_directory,
-                                       package_directory=args.package_directory,
-                                       package_version=args.package_version,
-                                       odbc_driver=args.odbc_driver,
-                                       consumer_count=consumer_count,
-                                       install_packages=args.install_packages,
-                                       do_unattended_install=args.do_unattended_install)
-
-            # Configure the containers for running iRODS automated tests
-            logging.info('configuring iRODS containers for testing')
-            irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+
+            key = None
+            if args.use_zone_snapshots or lease:
+                key = snapshot.snapshot_key(ctx.compose_project,
+                                            package_directory=args.package_directory,
+                                            externals_directory=args.irods_externals_package_directory,
+                                            zone_count=args.executor_count,
+                                            package_version=args.package_version,
+                                            odbc_driver=args.odbc_driver,
+                                            consumer_count=consumer_count,
+                                            install_packages=args.install_packages,
+                                            do_unattended_install=args.do_unattended_install,
+                                            fast_catalog=args.fast_catalog)
+
+            def set_up(ctx):
+                if args.use_zone_snapshots and snapshot.restore_snapshot(ctx, key):
+                    return
+
+                # Bring up the services
+                logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
+                services.create_topologies(ctx,
+                                           zone_count=args.executor_count,
+                                           externals_directory=args.irods_externals_package_directory,
+                                           package_directory=args.package_directory,
+                                           package_version=args.package_version,
+                                           odbc_driver=args.odbc_driver,
+                                           consumer_count=consumer_count,
+                                           install_packages=args.install_packages,
+                                           do_unattended_install=args.do_unattended_install)
+
+                # Configure the containers for running iRODS automated tests
+                logging.info('configuring iRODS containers for testing')
+                irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+
+                if args.use_zone_snapshots:
+                    snapshot.save_snapshot(ctx, key)
+
+            if lease:
+                lease.prepare(key, set_up)
+            else:
+                set_up(ctx)
 
         # Get the container on which the command is to be executed
         containers = [
@@ -108,7 +175,34 @@ if __name__ == "__main__":
             if args.do_setup:
                 tls_setup.configure_tls_in_zone(ctx.docker_client, ctx.compose_project)
 
-        rc = test_utils.run_specific_tests(containers, args.tests, [options] * args.executor_count, args.fail_fast)
+        timings = test_timings.test_timings(
+            test_timings.path_to_timings_file(ctx.compose_project.name,
+                                              ctx.platform(),
+                                              args.test_timings_directory))
+
+        if args.save_logs and args.log_shipping_interval > 0:
+            # Ship the logs and test reports while the tests run rather than all at the end.
+            shipper = log_shipper.log_shipper(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                              extra_paths=[os.path.join(context.irods_home(), 'test-reports')],
+                                              extra_paths_containers=containers,
+                                              interval=args.log_shipping_interval).start()
+
+        log_indexer = None
+        if args.save_logs and args.slice_logs:
+            log_indexer = log_slices.log_indexer(ctx.docker_client, output_directory)
+
+        result_sink = test_results.result_sink(os.path.join(output_directory, test_results.RESULTS_FILENAME))
+
+        rc = test_utils.run_specific_tests(containers,
+                                           args.tests,
+                                           [options] * args.executor_count,
+                                           args.fail_fast,
+                                           timings=timings,
+                                           order_by_duration=args.order_tests_by_duration,
+                                           log_indexer=log_indexer,
+                                           result_sink=result_sink,
+                                           retry_policy=test_retries.retry_policy(args.max_test_attempts,
+                                                                                  args.retry_on_fresh_executor))
 
     except Exception as e:
         logging.critical(e)
@@ -120,6 +214,25 @@ if __name__ == "__main__":
             # Just grab the version and sha from the first container since they are all running the same thing.
             cli.log_irods_version_and_commit_id(containers[0])
 
+        if containers:
+            try:
+                shipped_directory = None
+
+                if shipper:
+                    # The test reports are shipped with the logs, so they are merged from the shipped copies.
+                    if shipper.finish() != 0:
+                        logging.warning('failed to ship some logs and test reports')
+
+                    shipped_directory = output_directory
+
+                test_results.merge_junit_reports(ctx.docker_client, containers,
+                                                 os.path.join(context.irods_home(), 'test-reports'),
+                                                 os.path.join(output_directory, test_results.JUNIT_REPORT_FILENAME),
+                                                 shipped_directory=shipped_directory)
+
+            except Exception as e:
+                logging.error(f'failed to merge the JUnit reports: {e}')
+
         # TODO(#286): Replace use of root logger
         logging.error("message:[%s]", args.job_message)  # noqa: LOG015
 
@@ -127,14 +240,14 @@ if __name__ == "__main__":
             try:
                 logging.error('collecting logs [{}]'.format(output_directory))
 
-                # collect the usual logs
-                logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
-
-                # and then the test reports
-                archive.collect_files_from_containers(ctx.docker_client,
-                                                      ctx.irods_containers(),
-                                                      [os.path.join(context.irods_home(), 'test-reports')],
-                                                      output_directory)
+                if shipper:
+                    # Only what was written since the last poll is left to copy.
+                    shipper.stop(bundle=args.bundle_logs)
+                else:
+                    # collect the usual logs along with the test reports
+                    logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                      extra_paths=[os.path.join(context.irods_home(), 'test-reports')],
+                                      bundle=args.bundle_logs)
 
             except Exception as e:
                 logging.error(e)
@@ -144,7 +257,13 @@ if __name__ == "__main__":
                     rc = 1
 
 
-        if args.cleanup_containers:
+        if not instrumentation.report(output_directory, budgets) and rc == 0:
+            rc = 1
+
+        if lease:
+            # The project is reset and kept for the next job rather than torn down.
+            lease.release()
+        elif args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
     exit(rc)
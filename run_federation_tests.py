@@ -5,15 +5,22 @@ import logging
 import os
 
 # local modules
-from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import database_setup
 from irods_testing_environment import execute
 from irods_testing_environment import federate
 from irods_testing_environment.install import install
+from irods_testing_environment import instrumentation
 from irods_testing_environment import irods_config
 from irods_testing_environment import irods_setup
+from irods_testing_environment import log_shipper
+from irods_testing_environment import log_slices
+from irods_testing_environment import tls_material
 from irods_testing_environment import tls_setup
+from irods_testing_environment import test_results
+from irods_testing_environment import test_retries
 from irods_testing_environment import test_utils
+from irods_testing_environment import tracing
 
 if __name__ == "__main__":
     import argparse
@@ -69,8 +76,20 @@ if __name__ == "__main__":
     output_directory = test_utils.make_output_directory(dirname, job_name)
 
     logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+    tracing.enable(output_directory)
+    instrumentation.enable(ctx.docker_client, context.docker_client())
+
+    budgets = instrumentation.load_budgets(args.operation_budgets)
+
+    cli.apply_common_args(args)
+    cli.apply_database_config_args(args, ctx.compose_project)
+
+    if args.use_tls:
+        # Generating TLS material can be slow, so it is done while the Zones are being set up.
+        tls_material.prefetch()
 
     rc = 0
+    shipper = None
     container = None
 
     try:
@@ -95,8 +114,12 @@ if __name__ == "__main__":
                     package_directory=args.package_directory,
                     package_version=args.package_version)
 
+            database_setup.wait_for_database_services(
+                ctx, [z.database_service_instance for z in zone_info_list])
+
             for z in zone_info_list:
                 irods_setup.setup_irods_zone(ctx,
+                                             wait_for_database=False,
                                              provider_service_instance=z.provider_service_instance,
                                              database_service_instance=z.database_service_instance,
                                              consumer_service_instances=z.consumer_service_instances,
@@ -143,10 +166,29 @@ if __name__ == "__main__":
         execute.execute_command(container, 'iadmin lu', user='irods')
         execute.execute_command(container, 'iadmin lz', user='irods')
 
+        if args.save_logs and args.log_shipping_interval > 0:
+            # Ship the logs and test reports while the tests run rather than all at the end.
+            shipper = log_shipper.log_shipper(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                              extra_paths=[os.path.join(context.irods_home(), 'test-reports')],
+                                              extra_paths_containers=[container],
+                                              interval=args.log_shipping_interval).start()
+
+        log_indexer = None
+        if args.save_logs and args.slice_logs:
+            # The tests reach into the other Zones, so the server logs of all of them are sliced.
+            log_indexer = log_slices.log_indexer(ctx.docker_client, output_directory,
+                                                 containers_by_executor={container.name: ctx.irods_containers()})
+
+        result_sink = test_results.result_sink(os.path.join(output_directory, test_results.RESULTS_FILENAME))
+
         rc = test_utils.run_specific_tests([container],
                                            args.tests or ['test_federation'],
                                            [options] * args.executor_count,
-                                           args.fail_fast)
+                                           args.fail_fast,
+                                           log_indexer=log_indexer,
+                                           result_sink=result_sink,
+                                           retry_policy=test_retries.retry_policy(args.max_test_attempts,
+                                                                                  args.retry_on_fresh_executor))
 
     except Exception as e:
         logging.critical(e)
@@ -158,6 +200,25 @@ if __name__ == "__main__":
             # Just grab the version and sha from the test container since it is what is being tested.
             cli.log_irods_version_and_commit_id(container)
 
+        if container:
+            try:
+                shipped_directory = None
+
+                if shipper:
+                    # The test reports are shipped with the logs, so they are merged from the shipped copies.
+                    if shipper.finish() != 0:
+                        logging.warning('failed to ship some logs and test reports')
+
+                    shipped_directory = output_directory
+
+                test_results.merge_junit_reports(ctx.docker_client, [container],
+                                                 os.path.join(context.irods_home(), 'test-reports'),
+                                                 os.path.join(output_directory, test_results.JUNIT_REPORT_FILENAME),
+                                                 shipped_directory=shipped_directory)
+
+            except Exception as e:
+                logging.error(f'failed to merge the JUnit reports: {e}')
+
         # TODO(#286): Replace use of root logger
         logging.error("message:[%s]", args.job_message)  # noqa: LOG015
 
@@ -165,14 +226,15 @@ if __name__ == "__main__":
             try:
                 logging.error('collecting logs [{}]'.format(output_directory))
 
-                # collect the usual logs
-                logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
-
-                # and then the test reports
-                archive.collect_files_from_containers(ctx.docker_client,
-                                                      [container],
-                                                      [os.path.join(context.irods_home(), 'test-reports')],
-                                                      output_directory)
+                if shipper:
+                    # Only what was written since the last poll is left to copy.
+                    shipper.stop(bundle=args.bundle_logs)
+                else:
+                    # collect the usual logs along with the test reports
+                    logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                      extra_paths=[os.path.join(context.irods_home(), 'test-reports')],
+                                      extra_paths_containers=[container],
+                                      bundle=args.bundle_logs)
 
             except Exception as e:
                 logging.error(e)
@@ -181,6 +243,9 @@ if __name__ == "__main__":
                 if rc == 0:
                     rc = 1
 
+        if not instrumentation.report(output_directory, budgets) and rc == 0:
+            rc = 1
+
         if args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
@@ -0,0 +1,104 @@
+# grown-up modules
+import logging
+import os
+
+# local modules
+from irods_testing_environment import matrix
+from irods_testing_environment import test_utils
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import textwrap
+
+    import cli
+    from irods_testing_environment import logs
+
+    parser = argparse.ArgumentParser(
+        description='Run a test script against every Compose project under projects/ concurrently.',
+        epilog=textwrap.dedent('''\
+            Any other arguments are passed to the test script for every project. The strings \
+            {platform}, {database}, and {project} in those arguments are replaced for each \
+            project (e.g. --irods-package-directory /path/to/packages/{platform}).'''))
+
+    cli.add_common_args(parser)
+
+    parser.add_argument('--test-script',
+                        metavar='PATH_TO_TEST_SCRIPT',
+                        dest='test_script', default='run_core_tests.py',
+                        help='Test script to run for each project.')
+
+    parser.add_argument('--projects-directory',
+                        metavar='PATH_TO_PROJECTS_DIRECTORY',
+                        dest='projects_directory',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'projects'),
+                        help='Path to the directory holding one directory of Compose projects per platform.')
+
+    parser.add_argument('--platforms',
+                        metavar='PLATFORM_PATTERN',
+                        dest='platforms', nargs='+',
+                        help='Only run projects for platforms matching these glob patterns (e.g. "ubuntu-*").')
+
+    parser.add_argument('--databases',
+                        metavar='DATABASE_PATTERN',
+                        dest='databases', nargs='+',
+                        help='Only run projects for databases matching these glob patterns (e.g. "postgres-*").')
+
+    parser.add_argument('--cpu-budget',
+                        metavar='NUMBER_OF_CPUS',
+                        dest='cpu_budget', type=int, default=os.cpu_count(),
+                        help='Number of CPUs which may be reserved by running projects at once.')
+
+    parser.add_argument('--memory-budget',
+                        metavar='GIBIBYTES',
+                        dest='memory_budget', type=float,
+                        default=matrix.host_memory_bytes() / 2**30,
+                        help='Memory in GiB which may be reserved by running projects at once.')
+
+    parser.add_argument('--cpus-per-project',
+                        metavar='NUMBER_OF_CPUS',
+                        dest='cpus_per_project', type=int, default=2,
+                        help='Number of CPUs reserved for each running project.')
+
+    parser.add_argument('--memory-per-project',
+                        metavar='GIBIBYTES',
+                        dest='memory_per_project', type=float, default=4,
+                        help='Memory in GiB reserved for each running project.')
+
+    parser.add_argument('--output-directory', '-o',
+                        metavar='FULLPATH_TO_DIRECTORY_FOR_OUTPUT',
+                        dest='output_directory',
+                        help='Directory under which the output of each project and the combined report are saved.')
+
+    args, script_args = parser.parse_known_args()
+
+    job_name = test_utils.job_name('matrix')
+
+    output_directory = test_utils.make_output_directory(
+        args.output_directory or tempfile.mkdtemp(prefix=job_name), job_name)
+
+    logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+
+    cli.apply_common_args(args)
+
+    projects = matrix.discover_projects(args.projects_directory, args.platforms, args.databases)
+    if not projects:
+        logging.critical(f'no projects found in [{args.projects_directory}]')
+        exit(1)
+
+    logging.warning(f'running [{args.test_script}] against [{len(projects)}] projects')
+
+    # The common options are parsed here as well, so they have to be passed on explicitly.
+    script_args = cli.common_args_to_argv(args) + script_args
+
+    # Packages are shared between projects through the host archive cache, so a platform's
+    # packages are only packed into a tarball by whichever project gets to them first.
+    rc = matrix.run_matrix(projects,
+                           os.path.abspath(args.test_script),
+                           script_args,
+                           output_directory,
+                           matrix.resource_budget(args.cpu_budget, int(args.memory_budget * 2**30)),
+                           args.cpus_per_project,
+                           int(args.memory_per_project * 2**30))
+
+    exit(rc)
@@ -9,10 +9,16 @@ import textwrap
 # local modules
 from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import instrumentation
 from irods_testing_environment import irods_config
+from irods_testing_environment import log_shipper
+from irods_testing_environment import log_slices
 from irods_testing_environment import logs
 from irods_testing_environment import services
+from irods_testing_environment import test_results
+from irods_testing_environment import test_retries
 from irods_testing_environment import test_utils
+from irods_testing_environment import tracing
 
 import cli
 
@@ -67,8 +73,22 @@ else:
 output_directory = test_utils.make_output_directory(dirname, job_name)
 
 logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+tracing.enable(output_directory)
+instrumentation.enable(ctx.docker_client, context.docker_client())
+
+budgets = instrumentation.load_budgets(args.operation_budgets)
+
+cli.apply_common_args(args)
+cli.apply_database_config_args(args, ctx.compose_project)
 
 rc = 0
+shipper = None
+containers = None
+
+# The test reports and any extra logs are collected along with the usual logs.
+extra_paths = [os.path.join(context.irods_home(), 'test-reports')]
+if args.extra_logs_path:
+    extra_paths.append(args.extra_logs_path)
 
 try:
     if args.do_setup:
@@ -102,19 +122,32 @@ try:
     plugin_package_directory = os.path.abspath(args.plugin_package_directory)
 
     for c in containers:
-        archive.copy_archive_to_container(c,
-                                          archive.create_archive(
-                                          [plugin_package_directory],
-                                          args.plugin_name))
+        archive.copy_members_to_container(c, [plugin_package_directory])
 
     options = ['--built_packages_root_directory', plugin_package_directory]
 
+    if args.save_logs and args.log_shipping_interval > 0:
+        # Ship the logs and test reports while the tests run rather than all at the end.
+        shipper = log_shipper.log_shipper(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                          extra_paths=extra_paths,
+                                          interval=args.log_shipping_interval).start()
+
+    log_indexer = None
+    if args.save_logs and args.slice_logs:
+        log_indexer = log_slices.log_indexer(ctx.docker_client, output_directory)
+
+    result_sink = test_results.result_sink(os.path.join(output_directory, test_results.RESULTS_FILENAME))
+
     rc = test_utils.run_plugin_tests(containers,
                                      args.plugin_name,
                                      args.test_hook,
                                      args.tests,
                                      [options] * args.executor_count,
-                                     args.fail_fast)
+                                     args.fail_fast,
+                                     log_indexer=log_indexer,
+                                     result_sink=result_sink,
+                                     retry_policy=test_retries.retry_policy(args.max_test_attempts,
+                                                                            args.retry_on_fresh_executor))
 
 except Exception as e:
     logging.critical(e)
@@ -122,6 +155,25 @@ except Exception as e:
     raise
 
 finally:
+    if containers:
+        try:
+            shipped_directory = None
+
+            if shipper:
+                # The test reports are shipped with the logs, so they are merged from the shipped copies.
+                if shipper.finish() != 0:
+                    logging.warning('failed to ship some logs and test reports')
+
+                shipped_directory = output_directory
+
+            test_results.merge_junit_reports(ctx.docker_client, containers,
+                                             os.path.join(context.irods_home(), 'test-reports'),
+                                             os.path.join(output_directory, test_results.JUNIT_REPORT_FILENAME),
+                                             shipped_directory=shipped_directory)
+
+        except Exception as e:
+            logging.error(f'failed to merge the JUnit reports: {e}')
+
     # TODO(#286): Replace use of root logger
     logging.error("message:[%s]", args.job_message)  # noqa: LOG015
 
@@ -129,20 +181,12 @@ finally:
         try:
             logging.warning('collecting logs [{}]'.format(output_directory))
 
-            # collect the usual logs
-            logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
-
-            # and then the test reports
-            archive.collect_files_from_containers(ctx.docker_client,
-                                                  ctx.irods_containers(),
-                                                  [os.path.join(context.irods_home(), 'test-reports')],
-                                                  output_directory)
-
-            # ...and then the extra logs.
-            if args.extra_logs_path:
-                archive.collect_files_from_containers(
-                    ctx.docker_client, ctx.irods_containers(), [args.extra_logs_path], output_directory
-                )
+            if shipper:
+                # Only what was written since the last poll is left to copy.
+                shipper.stop(bundle=args.bundle_logs)
+            else:
+                logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                  extra_paths=extra_paths, bundle=args.bundle_logs)
 
         except Exception as e:
             logging.error(e)
@@ -151,6 +195,9 @@ finally:
             if rc == 0:
                 rc = 1
 
+    if not instrumentation.report(output_directory, budgets) and rc == 0:
+        rc = 1
+
     if args.cleanup_containers:
         ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
@@ -5,14 +5,22 @@ import logging
 import os
 
 # local modules
-from irods_testing_environment import archive
 from irods_testing_environment import context
 from irods_testing_environment import execute
 from irods_testing_environment import install
+from irods_testing_environment import instrumentation
 from irods_testing_environment import irods_config
+from irods_testing_environment import log_shipper
+from irods_testing_environment import log_slices
 from irods_testing_environment import services
+from irods_testing_environment import snapshot
+from irods_testing_environment import tls_material
 from irods_testing_environment import tls_setup
+from irods_testing_environment import test_results
+from irods_testing_environment import test_retries
 from irods_testing_environment import test_utils
+from irods_testing_environment import test_timings
+from irods_testing_environment import tracing
 
 if __name__ == "__main__":
     import argparse
@@ -75,8 +83,20 @@ if __name__ == "__main__":
     output_directory = test_utils.make_output_directory(dirname, job_name)
 
     logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+    tracing.enable(output_directory)
+    instrumentation.enable(ctx.docker_client, context.docker_client())
+
+    budgets = instrumentation.load_budgets(args.operation_budgets)
+
+    cli.apply_common_args(args)
+    cli.apply_database_config_args(args, ctx.compose_project)
+
+    if args.use_tls:
+        # Generating TLS material can be slow, so it is done while the Zones are being set up.
+        tls_material.prefetch()
 
     rc = 0
+    shipper = None
     containers = None
 
     try:
@@ -85,21 +105,37 @@ if __name__ == "__main__":
         consumer_count = 3
 
         if args.do_setup:
-            # Bring up the services
-            logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
-            services.create_topologies(ctx,
-                                       zone_count=args.executor_count,
-                                       externals_directory=args.irods_externals_package_directory,
-                                       package_directory=args.package_directory,
-                                       package_version=args.package_version,
-                                       odbc_driver=args.odbc_driver,
-                                       consumer_count=consumer_count,
-                                       install_packages=args.install_packages,
-                                       do_unattended_install=args.do_unattended_install)
-
-            # Configure the containers for running iRODS automated tests
-            logging.info('configuring iRODS containers for testing')
-            irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+            key = None
+            if args.use_zone_snapshots:
+                key = snapshot.snapshot_key(ctx.compose_project,
+                                            package_directory=args.package_directory,
+                                            externals_directory=args.irods_externals_package_directory,
+                                            zone_count=args.executor_count,
+                                            package_version=args.package_version,
+                                            odbc_driver=args.odbc_driver,
+                                            consumer_count=consumer_count,
+                                            install_packages=args.install_packages,
+                                            do_unattended_install=args.do_unattended_install)
+
+            if not key or not snapshot.restore_snapshot(ctx, key):
+                # Bring up the services
+                logging.debug('bringing up project [{}]'.format(ctx.compose_project.name))
+                services.create_topologies(ctx,
+                                           zone_count=args.executor_count,
+                                           externals_directory=args.irods_externals_package_directory,
+                                           package_directory=args.package_directory,
+                                           package_version=args.package_version,
+                                           odbc_driver=args.odbc_driver,
+                                           consumer_count=consumer_count,
+                                           install_packages=args.install_packages,
+                                           do_unattended_install=args.do_unattended_install)
+
+                # Configure the containers for running iRODS automated tests
+                logging.info('configuring iRODS containers for testing')
+                irods_config.configure_irods_testing(ctx.docker_client, ctx.compose_project)
+
+                if key:
+                    snapshot.save_snapshot(ctx, key)
 
         run_on_consumer = args.run_on == 'consumer'
 
@@ -136,6 +172,7 @@ if __name__ == "__main__":
                 tls_setup.configure_tls_in_zone(ctx.docker_client, ctx.compose_project)
 
         options_list = list()
+        zone_containers = dict()
         for i in range(args.executor_count):
             logging.debug('hostname_map:{}'.format(hostname_map))
             hostnames_option = [
@@ -172,9 +209,45 @@ if __name__ == "__main__":
 
             options_list.append(options_base + hostnames_option)
 
+            # The tests run on one server of the Zone but exercise all of them, so all of their logs are sliced.
+            zone_containers[containers[i].name] = [
+                c for c in ctx.compose_project.containers()
+                if c.name in consumer_hostname_map or
+                   c.name == context.container_name(ctx.compose_project.name, context.irods_catalog_provider_service(), i + 1)
+            ]
+
         logging.info(options_list)
 
-        rc = test_utils.run_specific_tests(containers, args.tests, options_list, args.fail_fast)
+        timings = test_timings.test_timings(
+            test_timings.path_to_timings_file(ctx.compose_project.name,
+                                              ctx.platform(),
+                                              args.test_timings_directory,
+                                              suite='_'.join(['topology', args.run_on])))
+
+        if args.save_logs and args.log_shipping_interval > 0:
+            # Ship the logs and test reports while the tests run rather than all at the end.
+            shipper = log_shipper.log_shipper(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                              extra_paths=[os.path.join(context.irods_home(), 'test-reports')],
+                                              extra_paths_containers=containers,
+                                              interval=args.log_shipping_interval).start()
+
+        log_indexer = None
+        if args.save_logs and args.slice_logs:
+            log_indexer = log_slices.log_indexer(ctx.docker_client, output_directory,
+                                                 containers_by_executor=zone_containers)
+
+        result_sink = test_results.result_sink(os.path.join(output_directory, test_results.RESULTS_FILENAME))
+
+        rc = test_utils.run_specific_tests(containers,
+                                           args.tests,
+                                           options_list,
+                                           args.fail_fast,
+                                           timings=timings,
+                                           order_by_duration=args.order_tests_by_duration,
+                                           log_indexer=log_indexer,
+                                           result_sink=result_sink,
+                                           retry_policy=test_retries.retry_policy(args.max_test_attempts,
+                                                                                  args.retry_on_fresh_executor))
 
     except Exception as e:
         logging.critical(e)
@@ -186,6 +259,25 @@ if __name__ == "__main__":
             # Just grab the version and sha from the first container since they are all running the same thing.
             cli.log_irods_version_and_commit_id(containers[0])
 
+        if containers:
+            try:
+                shipped_directory = None
+
+                if shipper:
+                    # The test reports are shipped with the logs, so they are merged from the shipped copies.
+                    if shipper.finish() != 0:
+                        logging.warning('failed to ship some logs and test reports')
+
+                    shipped_directory = output_directory
+
+                test_results.merge_junit_reports(ctx.docker_client, containers,
+                                                 os.path.join(context.irods_home(), 'test-reports'),
+                                                 os.path.join(output_directory, test_results.JUNIT_REPORT_FILENAME),
+                                                 shipped_directory=shipped_directory)
+
+            except Exception as e:
+                logging.error(f'failed to merge the JUnit reports: {e}')
+
         # TODO(#286): Replace use of root logger
         logging.error("message:[%s]", args.job_message)  # noqa: LOG015
 
@@ -193,14 +285,15 @@ if __name__ == "__main__":
             try:
                 logging.error('collecting logs [{}]'.format(output_directory))
 
-                # collect the usual logs
-                logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
-
-                # and then the test reports
-                archive.collect_files_from_containers(ctx.docker_client,
-                                                      containers,
-                                                      [os.path.join(context.irods_home(), 'test-reports')],
-                                                      output_directory)
+                if shipper:
+                    # Only what was written since the last poll is left to copy.
+                    shipper.stop(bundle=args.bundle_logs)
+                else:
+                    # collect the usual logs along with the test reports
+                    logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                      extra_paths=[os.path.join(context.irods_home(), 'test-reports')],
+                                      extra_paths_containers=containers,
+                                      bundle=args.bundle_logs)
 
             except Exception as e:
                 logging.error(e)
@@ -210,6 +303,9 @@ if __name__ == "__main__":
                     rc = 1
 
 
+        if not instrumentation.report(output_directory, budgets) and rc == 0:
+            rc = 1
+
         if args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
 
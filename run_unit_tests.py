@@ -7,9 +7,15 @@ import os
 # local modules
 from irods_testing_environment import archive
 from irods_testing_environment import context
+from irods_testing_environment import instrumentation
 from irods_testing_environment import irods_config
+from irods_testing_environment import log_shipper
+from irods_testing_environment import log_slices
 from irods_testing_environment import services
+from irods_testing_environment import test_results
+from irods_testing_environment import test_retries
 from irods_testing_environment import test_utils
+from irods_testing_environment import tracing
 
 if __name__ == "__main__":
     import argparse
@@ -59,8 +65,16 @@ if __name__ == "__main__":
     output_directory = test_utils.make_output_directory(dirname, job_name)
 
     logs.configure(args.verbosity, os.path.join(output_directory, 'script_output.log'))
+    tracing.enable(output_directory)
+    instrumentation.enable(ctx.docker_client, context.docker_client())
+
+    budgets = instrumentation.load_budgets(args.operation_budgets)
+
+    cli.apply_common_args(args)
+    cli.apply_database_config_args(args, ctx.compose_project)
 
     rc = 0
+    shipper = None
     containers = None
 
     try:
@@ -92,7 +106,21 @@ if __name__ == "__main__":
             for i in range(args.executor_count)
         ]
 
-        rc = test_utils.run_unit_tests(containers, args.tests, args.fail_fast)
+        if args.save_logs and args.log_shipping_interval > 0:
+            # Ship the logs while the tests run rather than all at the end.
+            shipper = log_shipper.log_shipper(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                              interval=args.log_shipping_interval).start()
+
+        log_indexer = None
+        if args.save_logs and args.slice_logs:
+            log_indexer = log_slices.log_indexer(ctx.docker_client, output_directory)
+
+        result_sink = test_results.result_sink(os.path.join(output_directory, test_results.RESULTS_FILENAME))
+
+        rc = test_utils.run_unit_tests(containers, args.tests, args.fail_fast,
+                                       log_indexer=log_indexer, result_sink=result_sink,
+                                       retry_policy=test_retries.retry_policy(args.max_test_attempts,
+                                                                              args.retry_on_fresh_executor))
 
     except Exception as e:
         logging.critical(e)
@@ -110,8 +138,16 @@ if __name__ == "__main__":
         if args.save_logs:
             logging.warning('collecting logs [{}]'.format(output_directory))
 
-            # collect the usual logs (unit test reports appear in /var/lib/irods/log for now)
-            logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory)
+            if shipper:
+                # Only what was written since the last poll is left to copy.
+                shipper.stop(bundle=args.bundle_logs)
+            else:
+                # collect the usual logs (unit test reports appear in /var/lib/irods/log for now)
+                logs.collect_logs(ctx.docker_client, ctx.irods_containers(), output_directory,
+                                  bundle=args.bundle_logs)
+
+        if not instrumentation.report(output_directory, budgets) and rc == 0:
+            rc = 1
 
         if args.cleanup_containers:
             ctx.compose_project.down(include_volumes=True, remove_image_type=False)
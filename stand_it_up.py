@@ -7,6 +7,7 @@ import os
 # local modules
 from irods_testing_environment import context
 from irods_testing_environment import services
+from irods_testing_environment import tls_material
 from irods_testing_environment import tls_setup
 
 if __name__ == "__main__":
@@ -65,6 +66,13 @@ if __name__ == "__main__":
 
     logs.configure(args.verbosity)
 
+    cli.apply_common_args(args)
+    cli.apply_database_config_args(args, ctx.compose_project)
+
+    if args.use_tls:
+        # Generating TLS material can be slow, so it is done while the Zones are being set up.
+        tls_material.prefetch()
+
     logging.debug(f'environment variables:[{os.environ}]')
 
     # Bring up the services